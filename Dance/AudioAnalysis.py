@@ -1,64 +1,208 @@
-import json
 import librosa
-import matplotlib
-matplotlib.use("Agg")  # non-GUI backend (thread-safe)
-import matplotlib.pyplot as plt
 import numpy as np
 import os
+import shutil
+import soundfile as sf
 import subprocess
+import threading
 
+from concurrent.futures import Future
 from scipy.ndimage import gaussian_filter1d
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.signal import find_peaks
+from Dance import separation
+from Dance.analysis_cache import cache_key, get_default_cache
+from Dance.decoding import BEAT_SR, ENVELOPE_SR, DecodedAudio, decimation_factor, resample
+from Dance.reporting import NULL_REPORTER, PlotReporter, get_verbose_reporter
+from Dance.task_graph import SharedArray, TaskGraph, attach_array, default_workers, discard, get_executor
+
+# Bump whenever a change to the analysis code changes its results,
+# so cached analyses from older code are never reused.
+ANALYSIS_VERSION = 5
+
+# ===========================
+#   Analysis Quality Tiers
+# ===========================
+# Presets that trade accuracy for speed. "full" is the original analysis.
+#   chroma              - "cqt" or "stft" (much cheaper)
+#   hpss                - compute chroma on the harmonic component only
+#   hop_length          - frame hop of the section analysis
+#   tempo               - "beat_track": beat-track every window of the audio;
+#                         "onset": tempo from slices of the song's onset envelope
+#   tempo_hop_s         - step of the sliding tempo curve
+#   separation_overlap  - Demucs overlap between split segments
+#   envelope_hop_length - lip sync envelope frame hop (at the stem's native rate)
+QUALITY_PRESETS = {
+    "fast": {
+        "chroma": "stft",
+        "hpss": False,
+        "hop_length": 1024,
+        "tempo": "onset",
+        "tempo_hop_s": 1.0,
+        "separation_overlap": 0.1,
+        "envelope_hop_length": 1024,
+    },
+    "balanced": {
+        "chroma": "stft",
+        "hpss": True,
+        "hop_length": 512,
+        "tempo": "onset",
+        "tempo_hop_s": 0.5,
+        "separation_overlap": 0.25,
+        "envelope_hop_length": 512,
+    },
+    "full": {
+        "chroma": "cqt",
+        "hpss": True,
+        "hop_length": 512,
+        "tempo": "beat_track",
+        "tempo_hop_s": 0.5,
+        "separation_overlap": 0.25,
+        "envelope_hop_length": 512,
+    },
+}
+
+
+def get_quality_preset(quality):
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Unknown quality: {quality} (expected one of {list(QUALITY_PRESETS)})")
+    return QUALITY_PRESETS[quality]
 
 # ===========================
 #    Source Separation
 # ===========================
 
-def separate_source(audio_file, model="htdemucs", track_to_separate="vocals", force_separate=False):
+def separate_source(audio_file, model="htdemucs", track_to_separate="vocals", force_separate=False,
+                    cache=None, backend="auto", overlap=0.25):
     """
     Runs Demucs and returns path to separated track.
+    Stems are cached by audio content + model (see Dance.analysis_cache).
+
+    backend:
+        "inprocess" - warm model kept in this process (see Dance.separation)
+        "cli"       - run the demucs command line tool
+        "auto"      - in-process if demucs is importable, otherwise the CLI
+    overlap: Demucs overlap between split segments (lower is faster)
     """
-    out_dir = "data/separated"
-    audio_name = os.path.splitext(os.path.basename(audio_file))[0]
-    track_path = os.path.join(
-        out_dir, model, audio_name, f"{track_to_separate}.wav"
-    )
-    if not force_separate and os.path.isfile(track_path):
-        print("Existing separated track. Skipping source separation to reuse.")
-        return track_path
+    track_path, _ = _separate(audio_file, model, track_to_separate, force_separate, cache, backend, overlap)
+    return track_path
 
-    os.makedirs(out_dir, exist_ok=True)
+
+def load_separated(audio_file, model="htdemucs", track_to_separate="vocals", force_separate=False,
+                   cache=None, backend="auto", overlap=0.25):
+    """
+    Same as separate_source, but returns the separated track as (y, sr).
+    With the in-process backend the stem is handed over in memory instead of
+    being reloaded from the file that was just written.
+    """
+    track_path, stem = _separate(audio_file, model, track_to_separate, force_separate, cache, backend, overlap)
+    if stem is not None:
+        return stem
+    return librosa.load(track_path, sr=None)
+
+
+def _separate(audio_file, model, track_to_separate, force_separate, cache, backend, overlap=0.25):
+    """
+    Returns (cached track path, (y, sr) if separated in-process else None).
+    """
+    if backend not in ("auto", "inprocess", "cli"):
+        raise ValueError(f"Unknown separation backend: {backend}")
+
+    cache = cache or get_default_cache()
+    stem_params = {"model": model, "track": track_to_separate}
+    if overlap != 0.25:
+        # only non-default overlaps are part of the key, so existing stems stay valid
+        stem_params["overlap"] = overlap
+    key = cache_key(audio_file, stem_params, ANALYSIS_VERSION)
+    track_name = f"{track_to_separate}.wav"
+
+    entry = None if force_separate else cache.get("stems", key)
+    if entry is not None:
+        print("Existing separated track. Skipping source separation to reuse.")
+        return os.path.join(entry, track_name), None
 
     print(f"Source-separating {audio_file} for {track_to_separate} track.")
 
-    cmd = [
-        "demucs",
-        "-n", model,
-        f"--two-stems={track_to_separate}",
-        "-o", out_dir,
-        audio_file
-    ]
-    subprocess.run(cmd, check=True)
+    if backend == "inprocess" or (backend == "auto" and separation.is_available()):
+        stem, sr = separation.separate(audio_file, model=model, track_to_separate=track_to_separate,
+                                       overlap=overlap)
 
-    if not os.path.exists(track_path):
-        raise FileNotFoundError(f"{track_to_separate} stem not found after Demucs separation.")
+        def write_stem(tmp_dir):
+            sf.write(os.path.join(tmp_dir, track_name), stem, sr)
 
-    return track_path
+        entry = cache.put("stems", key, write_stem)
+        return os.path.join(entry, track_name), (stem, sr)
+
+    def run_demucs(tmp_dir):
+        cmd = [
+            "demucs",
+            "-n", model,
+            f"--two-stems={track_to_separate}",
+            "--overlap", str(overlap),
+            "-o", tmp_dir,
+            audio_file
+        ]
+        subprocess.run(cmd, check=True)
+
+        # demucs writes <out>/<model>/<audio_name>/<stem>.wav; flatten into the entry
+        audio_name = os.path.splitext(os.path.basename(audio_file))[0]
+        stem_dir = os.path.join(tmp_dir, model, audio_name)
+        if not os.path.exists(os.path.join(stem_dir, track_name)):
+            raise FileNotFoundError(f"{track_to_separate} stem not found after Demucs separation.")
+        for name in os.listdir(stem_dir):
+            os.replace(os.path.join(stem_dir, name), os.path.join(tmp_dir, name))
+        shutil.rmtree(os.path.join(tmp_dir, model))
+
+    entry = cache.put("stems", key, run_demucs)
+    return os.path.join(entry, track_name), None
 
 
 # ===========================
 #         Lip Syncing
 # ===========================
 
+# audio_feature options computed straight from the mix, without source separation
+MIX_FEATURES = ("vocal_band",)
+
+def vocal_activity(y, sr, hop_length=512, n_fft=2048, fmin=300.0, fmax=3400.0, flatness_gate=0.3):
+    """
+    Rough vocal amplitude estimated from the full mix, no source separation.
+
+    - HPSS keeps the harmonic part (voice is harmonic; drums are not)
+    - only energy in the vocal formant band fmin-fmax is kept
+    - frames whose band spectrum is noise-like (high spectral flatness) are gated down
+
+    Returns one amplitude per frame (same framing as librosa.feature.rms).
+    """
+    S = np.abs(librosa.stft(y, n_fft=n_fft, hop_length=hop_length))
+    freqs = librosa.fft_frequencies(sr=sr, n_fft=n_fft)
+    # HPSS only on the band we keep: the median filters dominate the cost
+    band, _ = librosa.decompose.hpss(S[(freqs >= fmin) & (freqs <= fmax)])
+
+    amplitude = np.sqrt(np.mean(band ** 2, axis=0))
+    flatness = librosa.feature.spectral_flatness(S=band)[0]
+    # 1 for tonal frames, fading to 0 as flatness approaches the gate
+    gate = np.clip(1.0 - flatness / flatness_gate, 0.0, 1.0)
+    return amplitude * gate
+
+
 def extract_envelope(track_path,
                      threshold=0,
                      hop_length=512,
                      smooth_sigma=4,
                      compress_gamma=0.6,
-                     audio_feature="waveform"): # [rms, waveform]
+                     audio_feature="waveform", # [rms, waveform, vocal_band]
+                     reporter=None,
+                     name=None,
+                     envelope_sr=None):
     """
     Compute smoothed, compressed envelope.
     Only returns times when the value changes (optionally using a threshold).
+    track_path is a file path, or an already-loaded (y, sr) tuple.
+    envelope_sr resamples the track down before framing (hop and frame sizes
+    are scaled with it, so frame times are unchanged); None keeps the native rate.
+    Pass a reporter (see Dance.reporting) to get the diagnostic envelope plot,
+    saved under `name` (defaults to the track's folder name).
 
     Returns:
         times : np.ndarray
@@ -66,17 +210,31 @@ def extract_envelope(track_path,
         positions : np.ndarray
             Corresponding motor positions [0, 1].
     """
-    y, sr = librosa.load(track_path, sr=None)
+    if isinstance(track_path, tuple):
+        y, sr = track_path
+    else:
+        y, sr = librosa.load(track_path, sr=None)
+        if name is None:
+            name = os.path.basename(os.path.dirname(track_path))
+
+    k = decimation_factor(sr, envelope_sr, hop_length)
+    if k > 1:
+        y = resample(y, sr, sr // k)
+        sr, hop_length = sr // k, hop_length // k
 
     # amplitude
     if audio_feature == "rms":
-        amplitude = librosa.feature.rms(y=y, hop_length=hop_length)[0]
+        amplitude = librosa.feature.rms(y=y, frame_length=2048 // k, hop_length=hop_length)[0]
     elif audio_feature == "waveform":
         abs_y = np.abs(y)
         amplitude = np.array([
             np.max(abs_y[i : i + hop_length]) 
             for i in range(0, len(abs_y), hop_length)
         ])
+    elif audio_feature == "vocal_band":
+        amplitude = vocal_activity(y, sr, hop_length=hop_length, n_fft=2048 // k)
+    else:
+        raise ValueError(f"Unknown audio_feature: {audio_feature}")
 
     amplitude_smooth = gaussian_filter1d(amplitude, sigma=smooth_sigma)
     amplitude_norm = amplitude_smooth / (np.max(amplitude_smooth) + 1e-8)
@@ -90,8 +248,30 @@ def extract_envelope(track_path,
         hop_length=hop_length
     )
 
+    times, positions, _ = _envelope_changes(frame_times, envelope, threshold, envelope[0])
+
+    if reporter is not None and reporter.enabled:
+        reporter.report(
+            name or "envelope",
+            [
+                (frame_times, envelope, "-", "Envelope (all frames)"),
+                (times, positions, "r.-", f"Envelope (threshold={threshold})"),
+            ],
+            title="Smoothed Vocal Envelope",
+            xlabel="Time (s)",
+            ylabel="Normalized Amplitude",
+            ylim=(0, 1.05),
+        )
+
+    return np.array(times), positions
+
+
+def _envelope_changes(frame_times, envelope, threshold, last_val):
+    """
+    Keep only frames where the envelope moved at least `threshold` since the last kept one.
+    Returns times, positions and the updated last_val (for chunked use).
+    """
     times, positions = [], []
-    last_val = envelope[0]
     for t, val in zip(frame_times, envelope):
         if abs(val - last_val) >= threshold:
             # Prefer wider movement
@@ -99,36 +279,306 @@ def extract_envelope(track_path,
             times.append(t)
             positions.append(display_val)
             last_val = val
+    return times, positions, last_val
 
-    # Plot
-    plt.figure(figsize=(12, 4))
-    plt.plot(frame_times, envelope, label="Envelope (all frames)", alpha=0.5)
-    plt.plot(times, positions, 'r.-', label=f"Envelope (threshold={threshold})")
-    plt.xlabel("Time (s)")
-    plt.ylabel("Normalized Amplitude")
-    plt.title("Smoothed Vocal Envelope")
-    plt.legend()
-    plt.ylim(0, 1.05)
-    plt.tight_layout()
-    audio_name = track_path.split("/")[-2]
-    plt.savefig(f"data/lipsync_positions/{audio_name}.png", dpi=300, bbox_inches="tight")
 
-    return np.array(times), positions
+class StreamingEnvelope:
+    """
+    Incremental extract_envelope for a track that arrives in chunks
+    (waveform and rms features).
+
+    Amplitude framing, smoothing and thresholding give the same frames as
+    extract_envelope. The one difference is normalization: the offline version
+    divides by the peak of the whole song, which isn't known yet, so this one
+    divides by the peak seen so far.
+    """
+
+    def __init__(self, sr, threshold=0, hop_length=512, smooth_sigma=4, compress_gamma=0.6,
+                 audio_feature="waveform", frame_length=2048):
+        if audio_feature not in ("waveform", "rms"):
+            raise ValueError(f"Unknown audio_feature: {audio_feature}")
+        self.sr = sr
+        self.threshold = threshold
+        self.hop_length = hop_length
+        self.smooth_sigma = smooth_sigma
+        self.compress_gamma = compress_gamma
+        self.audio_feature = audio_feature
+
+        # frame i covers samples [i*hop + offset, i*hop + offset + window)
+        if audio_feature == "waveform":
+            self._offset, self._window = 0, hop_length
+        else:
+            # librosa rms: centered frames, zero padded
+            self._offset, self._window = -(frame_length // 2), frame_length
+        self._buf = np.zeros(-self._offset, dtype=np.float32)
+        self._buf_start = self._offset   # sample index of _buf[0]
+        self._n_samples = 0
+        self._next_frame = 0
+
+        self._amplitude = np.zeros(0)
+        # gaussian_filter1d's support (default truncate=4.0)
+        self._radius = int(4.0 * smooth_sigma + 0.5)
+        self._n_emitted = 0
+        self._peak = 0.0
+        self._last_val = None
+
+    @property
+    def ready_s(self):
+        """
+        Seconds of the track whose envelope has been emitted.
+        """
+        return self._n_emitted * self.hop_length / self.sr
+
+    def push(self, y):
+        """
+        Add the next chunk of samples. Returns (times, positions) that became final.
+        """
+        self._buf = np.concatenate((self._buf, np.asarray(y, dtype=np.float32)))
+        self._n_samples += len(y)
+        self._frame_amplitudes()
+        return self._emit(final=False)
+
+    def finish(self):
+        """
+        Flush the end of the track. Returns the remaining (times, positions).
+        """
+        if self.audio_feature == "waveform":
+            pad = -self._n_samples % self.hop_length
+        else:
+            pad = -self._offset
+        self._buf = np.concatenate((self._buf, np.zeros(pad, dtype=np.float32)))
+        self._frame_amplitudes()
+        return self._emit(final=True)
+
+    def _frame_amplitudes(self):
+        hop, win = self.hop_length, self._window
+        buf_end = self._buf_start + len(self._buf)
+        first = self._next_frame * hop + self._offset
+        n_ready = (buf_end - first - win) // hop + 1
+        if n_ready <= 0:
+            return
+
+        i = first - self._buf_start
+        frames = sliding_window_view(self._buf[i:i + (n_ready - 1) * hop + win], win)[::hop]
+        if self.audio_feature == "waveform":
+            amplitude = np.max(np.abs(frames), axis=1)
+        else:
+            amplitude = np.sqrt(np.mean(np.abs(frames) ** 2, axis=1))
+        self._amplitude = np.concatenate((self._amplitude, amplitude))
+        self._next_frame += n_ready
+
+        # drop samples no future frame needs
+        keep_from = self._next_frame * hop + self._offset - self._buf_start
+        self._buf = self._buf[keep_from:]
+        self._buf_start += keep_from
+
+    def _emit(self, final):
+        n = len(self._amplitude)
+        stop = n if final else n - self._radius
+        if stop <= self._n_emitted:
+            return np.zeros(0), []
+
+        # smooth with enough context that emitted frames match the offline filter
+        lo = max(0, self._n_emitted - self._radius)
+        hi = n if final else stop + self._radius
+        smooth = gaussian_filter1d(self._amplitude[lo:hi], sigma=self.smooth_sigma)
+        smooth = smooth[self._n_emitted - lo:stop - lo]
+
+        self._peak = max(self._peak, float(np.max(smooth)))
+        envelope = (smooth / (self._peak + 1e-8)) ** self.compress_gamma
+        frame_times = librosa.frames_to_time(
+            np.arange(self._n_emitted, stop), sr=self.sr, hop_length=self.hop_length
+        )
+        if self._last_val is None:
+            self._last_val = envelope[0]
+        times, positions, self._last_val = _envelope_changes(
+            frame_times, envelope, self.threshold, self._last_val
+        )
+        self._n_emitted = stop
+        return np.array(times), positions
+
 
 def lip_sync(
         audio_file, 
         threshold=0,
-        audio_feature="waveform"
+        audio_feature="waveform",
+        reporter=None,
+        cache=None,
+        envelope_sr=ENVELOPE_SR,
+        force_envelope=False,
+        quality="full"
     ):
-    vocal_track = separate_source(audio_file)
-    return extract_envelope(vocal_track, threshold=threshold, audio_feature=audio_feature)
+    """
+    Mouth positions for a song. The waveform/rms features run on the Demucs
+    vocal stem; MIX_FEATURES (vocal_band) skip separation and run on the mix,
+    which is much faster but less accurate.
+    The envelope is computed at envelope_sr (see Dance.decoding).
+    quality picks separation and envelope settings from QUALITY_PRESETS.
+    """
+    preset = get_quality_preset(quality)
+    cache = cache or get_default_cache()
+    params = {
+        "threshold": threshold,
+        "audio_feature": audio_feature,
+        "model": _envelope_model(audio_feature),
+        "envelope_sr": envelope_sr,
+        "quality": quality,
+    }
+    key = cache_key(audio_file, params, ANALYSIS_VERSION)
+    # a reporter wants the envelope recomputed so it has something to plot
+    recompute = force_envelope or reporter is not None
+    cached = None if recompute else cache.get_arrays("envelopes", key)
+    if cached is not None:
+        print("Existing lip sync envelope. Skipping envelope extraction to reuse.")
+        return cached["times"], cached["positions"].tolist()
+
+    if audio_feature in MIX_FEATURES:
+        vocal_track = librosa.load(audio_file, sr=None)
+    else:
+        vocal_track = load_separated(audio_file, cache=cache, overlap=preset["separation_overlap"])
+    audio_name = os.path.splitext(os.path.basename(audio_file))[0]
+    times, positions = extract_envelope(
+        vocal_track, threshold=threshold, audio_feature=audio_feature,
+        hop_length=preset["envelope_hop_length"],
+        reporter=reporter, name=audio_name, envelope_sr=envelope_sr
+    )
+    cache.put_arrays("envelopes", key, times=times, positions=np.array(positions))
+    return times, positions
+
+
+def _envelope_model(audio_feature):
+    return None if audio_feature in MIX_FEATURES else "htdemucs"
+
+
+def lip_sync_stream(
+        audio_file,
+        threshold=0,
+        audio_feature="waveform",
+        chunk_s=10.0,
+        cache=None
+    ):
+    """
+    Streaming lip_sync: separates the vocals chunk by chunk and yields the
+    envelope as each chunk completes, so playback can start before the whole
+    song is separated.
+
+    Yields:
+        (times, positions, ready_s) - new envelope points, and how many seconds
+        of the song are now covered.
+    """
+    if audio_feature in MIX_FEATURES:
+        # fast enough that there is nothing to stream
+        times, positions = lip_sync(audio_file, threshold, audio_feature, cache=cache)
+        yield times, positions, float("inf")
+        return
+
+    cache = cache or get_default_cache()
+    params = {
+        "threshold": threshold,
+        "audio_feature": audio_feature,
+        "model": _envelope_model(audio_feature),
+        "envelope_sr": ENVELOPE_SR,
+        "quality": "full",
+    }
+
+    # a full offline result, if we have one, beats a streamed one
+    cached = cache.get_arrays("envelopes", cache_key(audio_file, params, ANALYSIS_VERSION))
+    # streamed envelopes are framed at the stem's native rate
+    stream_key = cache_key(audio_file, dict(params, envelope_sr=None, stream_chunk_s=chunk_s), ANALYSIS_VERSION)
+    if cached is None:
+        cached = cache.get_arrays("envelopes", stream_key)
+    if cached is not None:
+        print("Existing lip sync envelope. Skipping envelope extraction to reuse.")
+        yield cached["times"], cached["positions"].tolist(), float("inf")
+        return
+
+    if not separation.is_available():
+        print("In-process Demucs unavailable, lip sync will not stream.")
+        times, positions = lip_sync(audio_file, threshold, audio_feature, cache=cache)
+        yield times, positions, float("inf")
+        return
+
+    all_times, all_positions = [], []
+    envelope = None
+    for start, stem, sr in separation.separate_stream(audio_file, chunk_s=chunk_s):
+        if envelope is None:
+            envelope = StreamingEnvelope(sr, threshold=threshold, audio_feature=audio_feature)
+        times, positions = envelope.push(stem)
+        all_times.append(times)
+        all_positions.extend(positions)
+        yield times, positions, envelope.ready_s
+
+    if envelope is None:
+        # no audio to separate; nothing for the mouth to follow
+        yield np.array([]), [], float("inf")
+        return
+
+    times, positions = envelope.finish()
+    all_times.append(times)
+    all_positions.extend(positions)
+    yield times, positions, float("inf")
+
+    cache.put_arrays(
+        "envelopes", stream_key,
+        times=np.concatenate(all_times), positions=np.array(all_positions)
+    )
+
+
+class ProgressiveLipSync:
+    """
+    Runs lip_sync_stream on a background thread.
+
+    `times` and `positions` are lists that only ever grow, so a playback loop
+    can keep indexing into them while the rest of the song is separated.
+    positions is extended first, so it is never shorter than times; readers
+    that don't take the lock should still bound indices by len(positions).
+    """
+
+    def __init__(self, audio_file, **stream_kwargs):
+        self.times = []
+        self.positions = []
+        self.ready_s = 0.0
+        self.done = False
+        self.error = None
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(
+            target=self._run, args=(audio_file,), kwargs=stream_kwargs, daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, audio_file, **stream_kwargs):
+        try:
+            for times, positions, ready_s in lip_sync_stream(audio_file, **stream_kwargs):
+                with self._cond:
+                    self.positions.extend(positions)
+                    self.times.extend(times)
+                    self.ready_s = ready_s
+                    self._cond.notify_all()
+        except Exception as e:
+            print(f"Lip sync stream failed: {e}")
+            self.error = e
+        finally:
+            with self._cond:
+                self.done = True
+                self._cond.notify_all()
+
+    def wait_until(self, seconds, timeout=None):
+        """
+        Block until the envelope covers the first `seconds` of the song
+        (or the stream ended). Returns False on timeout.
+        """
+        with self._cond:
+            ready = self._cond.wait_for(lambda: self.done or self.ready_s >= seconds, timeout)
+        if self.error is not None:
+            raise self.error
+        return ready
 
 # ===========================
 #    Structure Detections
 # ===========================
 
 def detect_structural_boundaries(audio, sr, kernel_size=32, percentile=95,
-                                 hop_length=512, min_section_s=8, verbose=False):
+                                 hop_length=512, min_section_s=8, verbose=False, reporter=None):
     """
     Detect musical section boundaries using chroma-based novelty detection.
     Returns sorted boundary times in seconds.
@@ -148,21 +598,59 @@ def detect_structural_boundaries(audio, sr, kernel_size=32, percentile=95,
             Minimum section duration in seconds.
         verbose : bool
             If True, plot novelty and detected peaks.
+        reporter : reporting sink for the novelty plot. Defaults to the shared
+            background PlotReporter when verbose is set, otherwise nothing is plotted.
+    """
+    novelty = compute_novelty(audio, sr, hop_length=hop_length)
+    return pick_structural_boundaries(
+        novelty, sr, kernel_size=kernel_size, percentile=percentile, hop_length=hop_length,
+        min_section_s=min_section_s, verbose=verbose, reporter=reporter
+    )
+
+
+def compute_novelty(audio, sr, hop_length=512, block_rows=512):
+    """
+    Raw (unsmoothed) chroma novelty curve, one value per frame.
+    This is the expensive part of detect_structural_boundaries.
     """
+    return chroma_novelty(compute_chroma(audio, sr, hop_length=hop_length), block_rows=block_rows)
+
+
+def compute_chroma(audio, sr, hop_length=512, method="cqt", hpss=True, n_fft=2048):
     # 1. Harmonic component & chroma
-    y_harm = librosa.effects.harmonic(audio)
-    chroma = librosa.feature.chroma_cqt(y=y_harm, sr=sr, hop_length=hop_length)
+    y_harm = librosa.effects.harmonic(audio, n_fft=n_fft) if hpss else audio
+    if method == "cqt":
+        return librosa.feature.chroma_cqt(y=y_harm, sr=sr, hop_length=hop_length)
+    if method == "stft":
+        return librosa.feature.chroma_stft(y=y_harm, sr=sr, hop_length=hop_length, n_fft=n_fft)
+    raise ValueError(f"Unknown chroma method: {method}")
+
 
+def chroma_novelty(chroma, block_rows=512):
     # 2. Self-similarity (recurrence) matrix
     R = librosa.segment.recurrence_matrix(chroma, mode='affinity', sym=True)
 
     # 3. Compute novelty: compare each frame to previous + global median
-    novelty = np.zeros(R.shape[0])
+    # (vectorized over blocks of rows to bound the temporary's size)
+    n = R.shape[0]
+    novelty = np.zeros(n)
     R_median = np.median(R, axis=0)  # global reference
-    for i in range(1, R.shape[0]-1):
-        local_diff = np.sum(np.abs(R[i,:] - R[i-1,:]))
-        global_diff = np.sum(np.abs(R[i,:] - R_median))
-        novelty[i] = 0.5 * local_diff + 0.5 * global_diff  # balance local/global
+    for a in range(1, n - 1, block_rows):
+        b = min(a + block_rows, n - 1)
+        local_diff = np.sum(np.abs(R[a:b] - R[a-1:b-1]), axis=1)
+        global_diff = np.sum(np.abs(R[a:b] - R_median), axis=1)
+        novelty[a:b] = 0.5 * local_diff + 0.5 * global_diff  # balance local/global
+    return novelty
+
+
+def pick_structural_boundaries(novelty, sr, kernel_size=32, percentile=95,
+                               hop_length=512, min_section_s=8, verbose=False, reporter=None):
+    """
+    Smooth a raw novelty curve and pick section boundaries from it (cheap).
+    Parameters as in detect_structural_boundaries.
+    """
+    if reporter is None:
+        reporter = get_verbose_reporter() if verbose else NULL_REPORTER
 
     # 4. Smooth novelty
     novelty = gaussian_filter1d(novelty, sigma=kernel_size)
@@ -178,19 +666,18 @@ def detect_structural_boundaries(audio, sr, kernel_size=32, percentile=95,
     times = librosa.frames_to_time(peaks, sr=sr, hop_length=hop_length)
 
     # Optional plot for debugging
-    if verbose:
+    if reporter.enabled:
         times_sec = librosa.frames_to_time(np.arange(len(novelty)), sr=sr, hop_length=hop_length)
-        peak_times = librosa.frames_to_time(peaks, sr=sr, hop_length=hop_length)
-
-        plt.figure(figsize=(12,4))
-        plt.plot(times_sec, novelty, label="Novelty")
-        plt.plot(peak_times, novelty[peaks], "rx", label="Detected peaks")
-        plt.title("Structural Novelty and Peaks")
-        plt.xlabel("Time (s)")
-        plt.ylabel("Novelty")
-        plt.legend()
-        plt.savefig("Dance/novelty_plot.png", dpi=300, bbox_inches="tight")
-        print(f"Saved novelty plot to novelty_plot.png")
+        reporter.report(
+            "novelty_plot",
+            [
+                (times_sec, novelty, "-", "Novelty"),
+                (times, novelty[peaks], "rx", "Detected peaks"),
+            ],
+            title="Structural Novelty and Peaks",
+            xlabel="Time (s)",
+            ylabel="Novelty",
+        )
 
     return np.unique(times).tolist()
 
@@ -198,7 +685,16 @@ def detect_structural_boundaries(audio, sr, kernel_size=32, percentile=95,
 #     Tempo Detections
 # ===========================
 
-def estimate_local_bpm(audio, sr, start_s, end_s):
+def beat_track(audio, sr, hop_length=512, n_fft=2048):
+    """
+    librosa.beat.beat_track with the onset envelope's FFT size exposed, so
+    frames can keep their length in seconds at a reduced analysis rate.
+    """
+    onset_env = librosa.onset.onset_strength(y=audio, sr=sr, hop_length=hop_length, n_fft=n_fft, aggregate=np.median)
+    return librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+
+
+def estimate_local_bpm(audio, sr, start_s, end_s, hop_length=512, n_fft=2048):
     """
     Estimate BPM for a specific time segment.
     Returns None if BPM cannot be estimated.
@@ -210,21 +706,89 @@ def estimate_local_bpm(audio, sr, start_s, end_s):
     if len(segment) < sr * 4:
         return None
 
-    tempo, _ = librosa.beat.beat_track(y=segment, sr=sr)
+    tempo, _ = beat_track(segment, sr, hop_length, n_fft)
     
     return float(tempo) if tempo > 0 else None
 
 
-def compute_tempo_curve(audio, sr, hop_s=0.5, win_s=8.0):
+def compute_tempo_curve(audio, sr, hop_s=0.5, win_s=8.0, part=0, n_parts=1, hop_length=512, n_fft=2048):
+    """
+    Local tempo in sliding windows. part/n_parts computes only every
+    n_parts-th window (starting at part), to split the work across workers.
+    """
     tempos = []
     times = []
 
     hop = int(hop_s * sr)
     win = int(win_s * sr)
 
-    for start in range(0, len(audio) - win, hop):
+    for start in range(part * hop, len(audio) - win, n_parts * hop):
         segment = audio[start:start + win]
-        tempo, _ = librosa.beat.beat_track(y=segment, sr=sr)
+        tempo, _ = beat_track(segment, sr, hop_length, n_fft)
+        tempos.append(float(tempo) if tempo > 0 else np.nan)
+        times.append((start + win / 2) / sr)
+
+    return np.array(times), np.array(tempos)
+
+
+def estimate_downbeats(beat_times, onset_env, sr, hop_length, beats_per_bar=4):
+    """
+    Every beats_per_bar-th beat, starting at the phase whose beats have the
+    strongest onsets on average (accents usually fall on the downbeat).
+    Assumes a constant meter.
+    """
+    beat_times = np.asarray(beat_times)
+    if len(beat_times) < beats_per_bar:
+        return beat_times[:1]
+    frames = librosa.time_to_frames(beat_times, sr=sr, hop_length=hop_length)
+    strength = np.asarray(onset_env)[np.clip(frames, 0, len(onset_env) - 1)]
+    phase = int(np.argmax([strength[p::beats_per_bar].mean() for p in range(beats_per_bar)]))
+    return beat_times[phase::beats_per_bar]
+
+
+def onset_local_bpm(onset_env, sr, hop_length, start_s, end_s):
+    """
+    estimate_local_bpm from a slice of the whole song's onset envelope
+    instead of beat tracking the segment (much cheaper, occasionally picks
+    a different octave).
+    """
+    start = int(round(start_s * sr / hop_length))
+    end = int(round(end_s * sr / hop_length))
+    if (end - start) * hop_length < sr * 4:
+        return None
+    tempo = librosa.feature.tempo(onset_envelope=np.asarray(onset_env[start:end]), sr=sr, hop_length=hop_length)[0]
+    return float(tempo) if tempo > 0 else None
+
+
+def onset_section_energy(onset_env, sr, hop_length, start_s, end_s, reference):
+    """
+    Energy score (0-1) of a section: its mean onset strength relative to
+    reference (the loud parts of the whole song, see get_audio_sections).
+    """
+    start = int(round(start_s * sr / hop_length))
+    end = int(round(end_s * sr / hop_length))
+    section = np.asarray(onset_env[start:end])
+    if len(section) == 0 or reference <= 0:
+        return 0.0
+    return float(min(np.mean(section) / reference, 1.0))
+
+
+def onset_tempo_curve(onset_env, sr, hop_length, hop_s=0.5, win_s=8.0):
+    """
+    compute_tempo_curve from slices of the song's onset envelope.
+    """
+    tempos = []
+    times = []
+
+    hop = int(hop_s * sr)
+    win = int(win_s * sr)
+    n_samples = len(onset_env) * hop_length
+    win_frames = int(round(win / hop_length))
+
+    for start in range(0, n_samples - win, hop):
+        frame = int(round(start / hop_length))
+        segment = np.asarray(onset_env[frame:frame + win_frames])
+        tempo = librosa.feature.tempo(onset_envelope=segment, sr=sr, hop_length=hop_length)[0]
         tempos.append(float(tempo) if tempo > 0 else np.nan)
         times.append((start + win / 2) / sr)
 
@@ -295,9 +859,16 @@ def get_audio_sections(
     audio_filepath,
     novelty_percentile=95,
     bpm_change_thresh=10.0,
-    hop_length=512,
+    hop_length=None,
     force_segment=False,
-    verbose=False):
+    verbose=False,
+    reporter=None,
+    cache=None,
+    analysis_sr=BEAT_SR,
+    max_workers=None,
+    kernel_size=32,
+    quality="full",
+    return_beats=False):
     """
     - detect structural section changes
     - detect tempo changes
@@ -305,63 +876,265 @@ def get_audio_sections(
     - estimate BPM per resulting section
 
     Returns:
-      tempo_sections = [(bpm, start_s), ...]
+      tempo_sections = [{"bpm", "start_s", "energy"}, ...]
+        energy: 0-1 onset strength relative to the song (see onset_section_energy)
       duration_s
       first_beat_s
+      beats (only with return_beats=True) = {"beat_times_s": [...], "downbeat_times_s": [...]}
+
+    Analysis runs on the audio resampled to analysis_sr (see Dance.decoding);
+    None keeps the native rate.
+    quality picks chroma, tempo and hop settings from QUALITY_PRESETS;
+    hop_length=None uses the preset's hop.
+    Independent stages run in up to max_workers processes (see Dance.task_graph);
+    max_workers=1 runs everything in this process.
+    Results are cached by audio content + parameters (see Dance.analysis_cache).
+    The parameter-independent features (chroma, novelty, onset envelope,
+    tempo curve) and per-section BPMs are cached separately, so changing
+    novelty_percentile, kernel_size or bpm_change_thresh only reruns the
+    peak picking and boundary merging.
     """
 
-    out_dir = "data/segmented"
+    preset = get_quality_preset(quality)
+    if hop_length is None:
+        hop_length = preset["hop_length"]
+    cache = cache or get_default_cache()
     audio_name = os.path.splitext(os.path.basename(audio_filepath))[0]
-    json_path = os.path.join(
-        out_dir, f"{audio_name}.json"
-    )
-    if not force_segment and os.path.isfile(json_path):
+    params = {
+        "quality": quality,
+        "novelty_percentile": novelty_percentile,
+        "bpm_change_thresh": bpm_change_thresh,
+        "hop_length": hop_length,
+        "analysis_sr": analysis_sr,
+        "kernel_size": kernel_size,
+    }
+    key = cache_key(audio_filepath, params, ANALYSIS_VERSION)
+    data = None if force_segment else cache.get_json("segments", key)
+    if data is not None:
         print("Existing segmented result. Skipping segmentation to reuse.")
-        with open(json_path, 'r') as f:
-            data = json.load(f)
-        return data["tempo_sections"], data["duration_s"], data["first_beat_s"]
-
-    os.makedirs(out_dir, exist_ok=True)
-
-    print(f"Loading audio {audio_filepath}...")
-    audio, sr = librosa.load(audio_filepath, sr=None)
-    duration_s = len(audio) / sr
-
-    if duration_s > 60.0:
-        min_section_beats = 16
-    else:
-        min_section_beats = 8
-
-    global_bpm, beat_frames = librosa.beat.beat_track(y=audio, sr=sr)
-    seconds_per_beat = 60.0 / global_bpm
-    min_section_s = min_section_beats * seconds_per_beat
-    print(f"global BPM = {global_bpm}. Converting min_section_beats={min_section_beats} to min_section_s={min_section_s}.")
-
-    if len(beat_frames) > 0:
-        first_beat_s = librosa.frames_to_time(beat_frames[0], sr=sr, hop_length=hop_length)
+        result = data["tempo_sections"], data["duration_s"], data["first_beat_s"]
+        if return_beats:
+            result += ({"beat_times_s": data["beat_times_s"], "downbeat_times_s": data["downbeat_times_s"]},)
+        return result
+
+    feature_params = {
+        "hop_length": hop_length,
+        "analysis_sr": analysis_sr,
+        "chroma": preset["chroma"],
+        "hpss": preset["hpss"],
+        "tempo": preset["tempo"],
+        "tempo_hop_s": preset["tempo_hop_s"],
+    }
+    features_key = cache_key(audio_filepath, feature_params, ANALYSIS_VERSION)
+    features = None if force_segment else cache.get_npy("features", features_key)
+    decoded = None
+    if features is not None:
+        print("Existing analysis features. Skipping feature extraction to reuse.")
+        meta, arrays = features
     else:
-        first_beat_s = 0.0
+        print(f"Loading audio {audio_filepath}...")
+        decoded = DecodedAudio.load(audio_filepath)
+        audio, sr = decoded.at(analysis_sr, hop_length)
+        # hop and FFT sizes shrink with the rate, so frames last as long as at the native rate
+        k = decoded.sr // sr
+        meta, arrays = compute_section_features(
+            audio, sr, decoded.duration_s, hop_length // k, max_workers, preset, n_fft=2048 // k
+        )
+        cache.put_npy("features", features_key, meta, **arrays)
+
+    sr = meta["sr"]
+    frame_hop, n_fft = meta["hop_length"], meta["n_fft"]  # in samples at the analysis rate
+    duration_s = meta["duration_s"]
+    first_beat_s = meta["first_beat_s"]
+    min_section_s = meta["min_section_s"]
 
     print("Detecting structural boundaries...")
-    structural_bounds = detect_structural_boundaries(
-        audio, sr, 
+    structural_bounds = pick_structural_boundaries(
+        arrays["novelty"], sr,
+        kernel_size=kernel_size,
         min_section_s=min_section_s,
         percentile=novelty_percentile,
-        hop_length=hop_length, verbose=verbose
+        hop_length=frame_hop, verbose=verbose, reporter=reporter
     )
     print(f"Structural boundaries start times: {structural_bounds}")
 
     print("Detecting tempo change boundaries...")
-    times, tempos = compute_tempo_curve(
-        audio, sr, 
-        # tempo detection doesn't seem consistent enough
-        win_s=min_section_s*2
-    )
     tempo_bounds = detect_tempo_change_boundaries(
-        times, tempos, bpm_change_thresh, verbose=verbose
+        np.asarray(arrays["tempo_times"]), np.asarray(arrays["tempos"]), bpm_change_thresh, verbose=verbose
     )
     print(f"Tempo boundaries start times: {tempo_bounds}")
 
+    def load_audio():
+        nonlocal decoded
+        if decoded is None:
+            print(f"Loading audio {audio_filepath}...")
+            decoded = DecodedAudio.load(audio_filepath)
+        return decoded.at(analysis_sr, hop_length)[0]
+
+    memo = None if force_segment else cache.get_json("section_bpms", features_key)
+    # the onset method needs only the envelope, never the audio
+    onset = (arrays["onset_env"], frame_hop) if preset["tempo"] == "onset" else None
+    with _SectionBPMs(memo, load_audio, sr, get_executor(max_workers or default_workers()), onset,
+                      frame_hop, n_fft) as section_bpms:
+        tempo_sections = _estimate_section_bpms(
+            section_bpms, first_beat_s, structural_bounds, tempo_bounds, duration_s, min_section_s
+        )
+    if section_bpms.updated:
+        cache.put_json("section_bpms", features_key, section_bpms.memo)
+
+    # energy relative to the song's own dynamics, so a quiet song still has high-energy sections
+    onset_env = np.asarray(arrays["onset_env"])
+    reference = float(np.percentile(onset_env, 95)) if len(onset_env) else 0.0
+    ends = [sec["start_s"] for sec in tempo_sections[1:]] + [duration_s]
+    for sec, end_s in zip(tempo_sections, ends):
+        sec["energy"] = onset_section_energy(onset_env, sr, frame_hop, sec["start_s"], end_s, reference)
+
+    print("Detected tempo sections:")
+    for sec in tempo_sections:
+        print(f"  BPM {sec["bpm"]:.1f} @ {sec["start_s"]:.2f}s, energy {sec["energy"]:.2f}")
+
+    output_data = {
+        "audio_name": audio_name,
+        "params": params,
+        "duration_s": duration_s,
+        "first_beat_s": float(first_beat_s),
+        "tempo_sections": tempo_sections,
+        "beat_times_s": np.asarray(arrays["beat_times"]).tolist(),
+        "downbeat_times_s": np.asarray(arrays["downbeat_times"]).tolist(),
+    }
+    
+    entry = cache.put_json("segments", key, output_data)
+    
+    print(f"Analysis saved to {entry}")
+    if return_beats:
+        return tempo_sections, duration_s, first_beat_s, {
+            "beat_times_s": output_data["beat_times_s"],
+            "downbeat_times_s": output_data["downbeat_times_s"],
+        }
+    return tempo_sections, duration_s, first_beat_s
+
+
+def compute_section_features(audio, sr, duration_s, hop_length=512, max_workers=None, preset=None, n_fft=2048):
+    """
+    The expensive, parameter-independent part of get_audio_sections.
+    preset is one of QUALITY_PRESETS (default "full"). hop_length and n_fft
+    are in samples at sr.
+
+    Returns:
+        meta : dict
+            sr, hop_length, n_fft, duration_s, global_bpm, first_beat_s, min_section_s
+        arrays : dict
+            chroma, novelty (raw), onset_env, beat_times, downbeat_times,
+            tempo_times, tempos
+    """
+    # Independent stages run in parallel:
+    #   onset envelope ──> beats ──> min_section_s ──> tempo curve (split in n_parts)
+    #   chroma ──> novelty
+    preset = preset or QUALITY_PRESETS["full"]
+    workers = max_workers or default_workers()
+    with SharedArray(audio) as shared:
+        graph = TaskGraph()
+        graph.add("onset_env", _onset_stage, shared.handle, sr, hop_length, n_fft)
+        graph.add("beats", _beats_stage, sr, hop_length, deps=["onset_env"], local=True)
+        graph.add("novelty", _novelty_stage, shared.handle, sr, hop_length, preset["chroma"], preset["hpss"], n_fft)
+        graph.add("min_section_s", _min_section_s, duration_s, deps=["beats"], local=True)
+        if preset["tempo"] == "onset":
+            n_parts = 1
+            graph.add("tempo_0", _onset_tempo_curve_stage, sr, hop_length, preset["tempo_hop_s"],
+                      deps=["onset_env", "min_section_s"], local=True)
+        else:
+            n_parts = workers
+            for part in range(workers):
+                graph.add(f"tempo_{part}", _tempo_curve_stage, shared.handle, sr, preset["tempo_hop_s"],
+                          part, workers, hop_length, n_fft, deps=["min_section_s"])
+        results = graph.run(get_executor(workers))
+
+    global_bpm, beat_times = results["beats"]
+    first_beat_s = float(beat_times[0]) if len(beat_times) > 0 else 0.0
+    downbeat_times = estimate_downbeats(beat_times, results["onset_env"], sr, hop_length)
+    chroma, novelty = results["novelty"]
+    parts = [results[f"tempo_{part}"] for part in range(n_parts)]
+    tempo_times = np.concatenate([t for t, _ in parts])
+    tempos = np.concatenate([tempo for _, tempo in parts])
+    order = np.argsort(tempo_times)
+
+    meta = {
+        "sr": sr,
+        "hop_length": hop_length,
+        "n_fft": n_fft,
+        "duration_s": duration_s,
+        "global_bpm": global_bpm,
+        "first_beat_s": first_beat_s,
+        "min_section_s": results["min_section_s"],
+    }
+    arrays = {
+        "chroma": chroma,
+        "novelty": novelty,
+        "onset_env": results["onset_env"],
+        "beat_times": beat_times,
+        "downbeat_times": downbeat_times,
+        "tempo_times": tempo_times[order],
+        "tempos": tempos[order],
+    }
+    return meta, arrays
+
+
+class _SectionBPMs:
+    """
+    Per-section BPM estimates memoized by section bounds. The audio is only
+    decoded (and put in shared memory) once an estimate is missing.
+    """
+
+    def __init__(self, memo, load_audio, sr, executor, onset=None, hop_length=512, n_fft=2048):
+        self.memo = dict(memo or {})
+        self._onset = onset
+        self._hop_length = hop_length
+        self._n_fft = n_fft
+        self.updated = False
+        self._load_audio = load_audio
+        self._sr = sr
+        self._executor = executor
+        self._shared = None
+        self._futures = {}
+
+    def submit(self, start_s, end_s):
+        key = f"{start_s}:{end_s}"
+        if key not in self._futures:
+            if key in self.memo or self._onset is not None:
+                future = Future()
+                if key in self.memo:
+                    future.set_result(self.memo[key])
+                else:
+                    onset_env, hop_length = self._onset
+                    future.set_result(onset_local_bpm(onset_env, self._sr, hop_length, start_s, end_s))
+            else:
+                if self._shared is None:
+                    self._shared = SharedArray(self._load_audio())
+                future = self._executor.submit(_local_bpm_stage, self._shared.handle, self._sr, start_s, end_s,
+                                               self._hop_length, self._n_fft)
+            self._futures[key] = future
+        return self._futures[key]
+
+    def close(self):
+        # speculative estimates nobody asked for must not outlive the shared audio
+        discard(self._futures.values())
+        for key, future in self._futures.items():
+            if key not in self.memo and future.done() and not future.cancelled() and future.exception() is None:
+                self.memo[key] = future.result()
+                self.updated = True
+        if self._shared is not None:
+            self._shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _estimate_section_bpms(section_bpms, first_beat_s, structural_bounds, tempo_bounds,
+                           duration_s, min_section_s):
+
     # Combine all boundaries
     boundaries = np.unique(
         np.concatenate((
@@ -375,6 +1148,17 @@ def get_audio_sections(
     print(f"Combined boundaries start times: {boundaries}")
 
     print("Estimating BPM per section...")
+    submit = section_bpms.submit
+
+    # Which section comes next depends on whether the previous estimate
+    # succeeded, so start every section we'd get if they all succeed (the
+    # usual case) in parallel; a failed estimate only adds one more request.
+    start_s = boundaries[0]
+    for end_s in boundaries[1:]:
+        if end_s - start_s >= min_section_s:
+            submit(start_s, end_s)
+            start_s = end_s
+
     tempo_sections = []
     start_s = boundaries[0]
     for i in range(len(boundaries) - 1):
@@ -383,7 +1167,7 @@ def get_audio_sections(
             print(f" section is too short: {end_s - start_s}")
             continue
 
-        bpm = estimate_local_bpm(audio, sr, start_s, end_s)
+        bpm = submit(start_s, end_s).result()
         if bpm is not None:
             # y_section = audio[int(start_s*sr):int(end_s*sr)]
             # energy = compute_section_energy(y_section, sr, bpm)
@@ -399,30 +1183,66 @@ def get_audio_sections(
 
     if not tempo_sections:
         raise RuntimeError("Failed to detect any sections")
+    return tempo_sections
 
-    print("Detected tempo sections:")
-    for sec in tempo_sections:
-        print(f"  BPM {sec["bpm"]:.1f} @ {sec["start_s"]:.2f}s")
 
-    output_data = {
-        "audio_name": audio_name,
-        "duration_s": duration_s,
-        "first_beat_s": first_beat_s,
-        "tempo_sections": tempo_sections
-    }
-    
-    with open(json_path, 'w') as f:
-        json.dump(output_data, f, indent=4)
-    
-    print(f"Analysis saved to {json_path}")
-    return tempo_sections, duration_s, first_beat_s
+# Stage functions for the task graph. They take a SharedArray handle instead of
+# the audio itself and must be top-level so worker processes can import them.
+
+def _onset_stage(audio_handle, sr, hop_length, n_fft=2048):
+    with attach_array(audio_handle) as audio:
+        # same envelope beat_track computes internally
+        return librosa.onset.onset_strength(y=audio, sr=sr, hop_length=hop_length, n_fft=n_fft, aggregate=np.median)
+
+
+def _beats_stage(sr, hop_length, onset_env):
+    global_bpm, beat_frames = librosa.beat.beat_track(onset_envelope=onset_env, sr=sr, hop_length=hop_length)
+    beat_times = librosa.frames_to_time(beat_frames, sr=sr, hop_length=hop_length)
+    return float(np.atleast_1d(global_bpm)[0]), beat_times
+
+
+def _min_section_s(duration_s, beats):
+    global_bpm, _ = beats
+    if duration_s > 60.0:
+        min_section_beats = 16
+    else:
+        min_section_beats = 8
+    seconds_per_beat = 60.0 / global_bpm
+    min_section_s = min_section_beats * seconds_per_beat
+    print(f"global BPM = {global_bpm}. Converting min_section_beats={min_section_beats} to min_section_s={min_section_s}.")
+    return min_section_s
+
+
+def _novelty_stage(audio_handle, sr, hop_length, chroma_method="cqt", hpss=True, n_fft=2048):
+    with attach_array(audio_handle) as audio:
+        chroma = compute_chroma(audio, sr, hop_length=hop_length, method=chroma_method, hpss=hpss, n_fft=n_fft)
+    return chroma, chroma_novelty(chroma)
+
+
+def _tempo_curve_stage(audio_handle, sr, hop_s, part, n_parts, hop_length, n_fft, min_section_s):
+    with attach_array(audio_handle) as audio:
+        return compute_tempo_curve(
+            audio, sr, hop_s=hop_s,
+            # tempo detection doesn't seem consistent enough
+            win_s=min_section_s*2,
+            part=part, n_parts=n_parts,
+            hop_length=hop_length, n_fft=n_fft
+        )
+
+
+def _onset_tempo_curve_stage(sr, hop_length, hop_s, onset_env, min_section_s):
+    return onset_tempo_curve(onset_env, sr, hop_length, hop_s=hop_s, win_s=min_section_s*2)
+
+
+def _local_bpm_stage(audio_handle, sr, start_s, end_s, hop_length=512, n_fft=2048):
+    with attach_array(audio_handle) as audio:
+        return estimate_local_bpm(audio, sr, start_s, end_s, hop_length, n_fft)
 
 
 
 # ================================
 #  Helper Function for Testing
 # ================================
-import soundfile as sf
 
 def add_beeps_to_boundaries(audio, sr, boundaries, beep_freq=1000, beep_duration_s=0.1):
     """
@@ -485,9 +1305,11 @@ if __name__ == "__main__":
 
     start_time = time.time()  # Start timer
 
-    print(lip_sync(song_list[songIndex], threshold=0.1))
+    reporter = PlotReporter("data/lipsync_positions")
+    print(lip_sync(song_list[songIndex], threshold=0.1, reporter=reporter))
     end_time = time.time()  # End timer
     print(f"Source separation took {end_time - start_time:.2f} seconds")
+    reporter.close()
 
 
     # start_time = time.time()  # Start timer
@@ -0,0 +1,268 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import numpy as np
+
+# ===========================
+#   Content-Addressed Cache
+# ===========================
+# Layout:
+#   <root>/<kind>/<key>/...   one directory per cached result
+#   <root>/tmp/               staging area for atomic writes
+#
+# <key> is a hash of the audio *content*, the analysis parameters and the
+# analysis code version, so renamed or same-named files never collide and a
+# parameter change is a cache miss instead of a stale hit.
+# Each entry directory's mtime is its last-used time; when the cache grows
+# past max_bytes the least recently used entries are evicted.
+# Several processes can share a cache root (prepare_library runs a process
+# pool), so entries are only ever renamed into and out of place: a replaced
+# or evicted entry is first moved into tmp/ and deleted from there, and any
+# entry may vanish between listing and reading it.
+
+CACHE_DIR = "data/cache"
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3  # 4 GB; stems dominate
+
+_digest_memo = {}
+_digest_lock = threading.Lock()
+
+def file_digest(path, chunk_size=1 << 20):
+    """
+    sha256 of a file's content. Memoized on (path, size, mtime) so repeated
+    lookups for the same song don't re-read it.
+    """
+    st = os.stat(path)
+    memo_key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _digest_lock:
+        if memo_key in _digest_memo:
+            return _digest_memo[memo_key]
+
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+
+    with _digest_lock:
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def cache_key(audio_path, params, version):
+    """
+    Key for an analysis of audio_path with the given (JSON-serializable) params.
+    """
+    payload = json.dumps(
+        {"audio": file_digest(audio_path), "params": params, "version": version},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+
+class AnalysisCache:
+    """
+    Size-capped LRU cache of analysis results on disk.
+    """
+
+    def __init__(self, root=CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    def entry_dir(self, kind, key):
+        return os.path.join(self.root, kind, key)
+
+    def get(self, kind, key):
+        """
+        Returns the entry directory, or None on a miss. Marks the entry as used.
+        """
+        path = self.entry_dir(kind, key)
+        if not os.path.isdir(path):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            # evicted between the check and the touch
+            return None
+        return path
+
+    def put(self, kind, key, write_fn):
+        """
+        Atomically create an entry. write_fn(tmp_dir) writes the entry's files
+        into a staging directory, which is then renamed into place, so readers
+        never see a half-written entry.
+        Returns the entry directory.
+        """
+        tmp_root = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_root, exist_ok=True)
+        tmp_dir = os.path.join(tmp_root, uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        try:
+            write_fn(tmp_dir)
+            path = self.entry_dir(kind, key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with self._lock:
+                if os.path.isdir(path):
+                    # forced recompute: move the old entry aside, then delete it
+                    self._remove(path)
+                try:
+                    os.rename(tmp_dir, path)
+                except OSError:
+                    # another process put the same key first; same content, keep theirs
+                    if not os.path.isdir(path):
+                        raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+        self.evict(keep=path)
+        return path
+
+    def _remove(self, path):
+        """
+        Move an entry into tmp/ and delete it there, so no reader sees it half
+        deleted. Returns False if it was already gone.
+        """
+        tombstone = os.path.join(self.root, "tmp", uuid.uuid4().hex)
+        os.makedirs(os.path.dirname(tombstone), exist_ok=True)
+        try:
+            os.rename(path, tombstone)
+        except FileNotFoundError:
+            return False
+        shutil.rmtree(tombstone, ignore_errors=True)
+        return True
+
+    # ---- convenience wrappers ----
+    # an entry can be evicted by another process between get() and the read;
+    # that reads as a miss
+
+    def get_json(self, kind, key):
+        path = self.get(kind, key)
+        if path is None:
+            return None
+        try:
+            with open(os.path.join(path, "data.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def put_json(self, kind, key, data):
+        def write(tmp_dir):
+            with open(os.path.join(tmp_dir, "data.json"), "w") as f:
+                json.dump(data, f, indent=4)
+        return self.put(kind, key, write)
+
+    def get_arrays(self, kind, key):
+        path = self.get(kind, key)
+        if path is None:
+            return None
+        try:
+            with np.load(os.path.join(path, "data.npz")) as data:
+                return {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return None
+
+    def put_arrays(self, kind, key, **arrays):
+        def write(tmp_dir):
+            np.savez(os.path.join(tmp_dir, "data.npz"), **arrays)
+        return self.put(kind, key, write)
+
+    def get_npy(self, kind, key, mmap_mode="r"):
+        """
+        Returns (meta, {name: array}) for an entry written by put_npy, or None.
+        Arrays are memory-mapped, so opening a large entry costs almost nothing
+        and only the parts that are read get paged in.
+        """
+        path = self.get(kind, key)
+        if path is None:
+            return None
+        try:
+            with open(os.path.join(path, "meta.json"), "r") as f:
+                meta = json.load(f)
+            arrays = {
+                os.path.splitext(name)[0]: np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+                for name in os.listdir(path) if name.endswith(".npy")
+            }
+        except FileNotFoundError:
+            return None
+        return meta, arrays
+
+    def put_npy(self, kind, key, meta, **arrays):
+        """
+        Store each array as its own <name>.npy (so it can be memory-mapped) plus a meta.json.
+        """
+        def write(tmp_dir):
+            with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+                json.dump(meta, f, indent=4)
+            for name, array in arrays.items():
+                np.save(os.path.join(tmp_dir, f"{name}.npy"), np.asarray(array))
+        return self.put(kind, key, write)
+
+    # ---- eviction ----
+
+    def entries(self):
+        """
+        List of (last_used, size_bytes, path) for every entry.
+        """
+        result = []
+        if not os.path.isdir(self.root):
+            return result
+        for kind in os.listdir(self.root):
+            kind_dir = os.path.join(self.root, kind)
+            if kind == "tmp" or not os.path.isdir(kind_dir):
+                continue
+            try:
+                keys = os.listdir(kind_dir)
+            except FileNotFoundError:
+                continue
+            for key in keys:
+                path = os.path.join(kind_dir, key)
+                try:
+                    last_used = os.stat(path).st_mtime
+                    size = sum(
+                        os.path.getsize(os.path.join(dirpath, name))
+                        for dirpath, _, names in os.walk(path)
+                        for name in names
+                    )
+                except FileNotFoundError:
+                    continue
+                result.append((last_used, size, path))
+        return result
+
+    def size_bytes(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits in max_bytes.
+        The entry at `keep` (usually the one just written) is never evicted.
+        """
+        with self._lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for last_used, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                if path == keep:
+                    continue
+                total -= size
+                # gone already if another process evicted or replaced it
+                if self._remove(path):
+                    print(f"Evicted cache entry {path} (last used {time.ctime(last_used)})")
+
+    def clear(self):
+        with self._lock:
+            shutil.rmtree(self.root, ignore_errors=True)
+
+
+_default_cache = None
+
+def get_default_cache():
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AnalysisCache()
+    return _default_cache
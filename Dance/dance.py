@@ -3,37 +3,52 @@ import librosa
 import random
 import sounddevice as sd
 import soundfile as sf
+import threading
 import time
 import numpy as np
 
 from utils.Dynamixelutils import dynamixel
-from concurrent.futures import ThreadPoolExecutor
 from dynamixel_sdk import *                    # Uses Dynamixel SDK library
 from pythonosc.dispatcher import Dispatcher
 from pythonosc.osc_server import BlockingOSCUDPServer
-from Dance.AudioAnalysis import get_audio_sections, lip_sync
+from Dance import separation
+from Dance.AudioAnalysis import ProgressiveLipSync, get_audio_sections
+from GestureInput.gesture_compiler import compile_gesture
+from GestureInput.gesture_index import GestureIndex, energy_ranks
+from GestureInput.gesture_library import GestureLibrary
 
 # ===========
 #   MOTORS 
 # ===========
+# The port is opened by init_hardware() from __main__ only: the section
+# analysis runs in spawned worker processes, which re-import this module and
+# must not touch the serial port.
 port = '/dev/tty.usbserial-FT62AP2P'
-packethandle = PacketHandler(2.0)
-porthandle = PortHandler(port)
+packethandle = None
+porthandle = None
+HeadTurn = HeadTilt = Mouth = NeckTilt = NeckTurn = None
+motors = []
 
-if not porthandle.openPort():
-    raise RuntimeError(f"Failed to open port {port}")
+dispatcher = Dispatcher()
 
-if not porthandle.setBaudRate(57600):
-    raise RuntimeError(f"Failed to set baudrate for port {port}")
 
-dispatcher = Dispatcher()
+def init_hardware():
+    global packethandle, porthandle, HeadTurn, HeadTilt, Mouth, NeckTilt, NeckTurn, motors
+    packethandle = PacketHandler(2.0)
+    porthandle = PortHandler(port)
+
+    if not porthandle.openPort():
+        raise RuntimeError(f"Failed to open port {port}")
+
+    if not porthandle.setBaudRate(57600):
+        raise RuntimeError(f"Failed to set baudrate for port {port}")
 
-HeadTurn = dynamixel(10,porthandle,packethandle,BAUD = 57600)
-HeadTilt = dynamixel(11,porthandle,packethandle,BAUD = 57600)
-Mouth    = dynamixel(12,porthandle,packethandle,BAUD = 57600)
-NeckTilt = dynamixel(13,porthandle,packethandle,BAUD = 57600)
-NeckTurn = dynamixel(14,porthandle,packethandle,BAUD = 57600)
-motors = [HeadTurn, HeadTilt, Mouth, NeckTurn, NeckTilt]
+    HeadTurn = dynamixel(10,porthandle,packethandle,BAUD = 57600)
+    HeadTilt = dynamixel(11,porthandle,packethandle,BAUD = 57600)
+    Mouth    = dynamixel(12,porthandle,packethandle,BAUD = 57600)
+    NeckTilt = dynamixel(13,porthandle,packethandle,BAUD = 57600)
+    NeckTurn = dynamixel(14,porthandle,packethandle,BAUD = 57600)
+    motors = [HeadTurn, HeadTilt, Mouth, NeckTurn, NeckTilt]
 
 
 def moveHeadTurn(unused_addr, *args):
@@ -101,6 +116,7 @@ MOTOR_MAP = {
 with open("Dance/danceModes.json", "r") as f:
     DANCE_MODES = json.load(f)
 
+
 def normalize_bpm(bpm, bpm_min, bpm_max):
     """
     Fold BPM by factors of 2 until it fits nicely in [bpm_min, bpm_max].
@@ -131,21 +147,108 @@ TICK_SOUND, TICK_SR = make_tick()
 def play_tick():
     sd.play(TICK_SOUND, TICK_SR, blocking=False)
 
-def schedule_dance_moves(tempo_sections, section_modes, duration_s, scale=1.0):
+def time_at_beat(beat_times, beats):
+    """
+    Time of (fractional) beat indices on a beat grid, extrapolated with the
+    first/last beat period outside the grid.
+    """
+    beats = np.asarray(beats, dtype=float)
+    idx = np.arange(len(beat_times))
+    t = np.interp(beats, idx, beat_times)
+    t = np.where(beats < 0, beat_times[0] + beats * (beat_times[1] - beat_times[0]), t)
+    last = len(beat_times) - 1
+    return np.where(beats > last, beat_times[-1] + (beats - last) * (beat_times[-1] - beat_times[-2]), t)
+
+
+def beat_at_time(beat_times, t):
+    """
+    Inverse of time_at_beat: fractional beat index at time t.
+    """
+    t = np.asarray(t, dtype=float)
+    idx = np.arange(len(beat_times))
+    beats = np.interp(t, beat_times, idx)
+    beats = np.where(t < beat_times[0], (t - beat_times[0]) / (beat_times[1] - beat_times[0]), beats)
+    last = len(beat_times) - 1
+    return np.where(t > beat_times[-1], last + (t - beat_times[-1]) / (beat_times[-1] - beat_times[-2]), beats)
+
+
+def gesture_modes(tempo_sections, section_modes, library=None):
+    """
+    Match a recorded gesture to every analysed section (by BPM and energy,
+    see GestureInput/gesture_index.py) and dance it as a compiled mode
+    (GestureInput/gesture_compiler.py). Returns the section modes and
+    DANCE_MODES plus the compiled gestures; sections without a close enough
+    gesture, or whose gesture can't be compiled, keep their mode.
+    """
+    library = GestureLibrary() if library is None else library
+    # built per show so new recordings are picked up
+    index = GestureIndex.from_library(library)
+    modes = dict(DANCE_MODES)
+    section_modes = list(section_modes)
+    # section energies ranked within the song, like gesture speeds within the library
+    energies = [section.get("energy") for section in tempo_sections]
+    ranks = energy_ranks(energies) if None not in energies else [None] * len(energies)
+    prev_gesture = None
+    for i, section in enumerate(tempo_sections):
+        # closest recorded gesture, avoiding a repeat
+        name = index.choose(section["bpm"], ranks[i], exclude=[prev_gesture])
+        section["gesture"] = prev_gesture = name
+        if name is None:
+            continue
+        key = f"gesture:{name}"
+        if key not in modes:
+            try:
+                modes[key] = compile_gesture(library.load(name))
+            except ValueError as e:
+                print(f"Can't dance gesture '{name}': {e}")
+                modes[key] = None
+        if modes[key] is not None:
+            section_modes[i] = key
+    return section_modes, {mode: info for mode, info in modes.items() if info is not None}
+
+
+def schedule_dance_moves(tempo_sections, section_modes, duration_s, scale=1.0, beat_times=None, modes=None):
+    """
+    Precompute every move trigger of the song.
+
+    With beat_times (the analysed beat grid) moves land on the real beats,
+    so they follow tempo drift and rubato; each section starts on the first
+    beat at or after its boundary, so it never overlaps the previous one.
+    Without it, moves are spaced on a constant 60/bpm grid per section.
+    Each event gets a 'times' array of all its trigger times.
+    modes defaults to DANCE_MODES.
+    """
+    modes = DANCE_MODES if modes is None else modes
+    use_grid = beat_times is not None and len(beat_times) >= 2
+    if use_grid:
+        beat_times = np.asarray(beat_times, dtype=float)
     sections_schedule = []
     for i, section in enumerate(tempo_sections):
         section_start = section['start_s']
         section_end = tempo_sections[i+1]['start_s'] if i+1 < len(tempo_sections) else duration_s
         mode = section_modes[i]
         bpm_val = section['bpm']
-        bpm_min = DANCE_MODES[mode]['bpm_min']
-        bpm_max = DANCE_MODES[mode]['bpm_max']
+        bpm_min = modes[mode]['bpm_min']
+        bpm_max = modes[mode]['bpm_max']
         bpm = normalize_bpm(bpm_val, bpm_min, bpm_max)
         beat_to_sec = 60 / bpm
+
+        if use_grid:
+            start_beat = np.ceil(beat_at_time(beat_times, section_start))
+            end_beat = beat_at_time(beat_times, section_end)
+            in_section = beat_times[(beat_times >= section_start) & (beat_times < section_end)]
+            grid_period = np.median(np.diff(in_section if len(in_section) >= 2 else beat_times))
+            # dance beats per grid beat: the same power of 2 normalize_bpm folded by
+            fold = 2.0 ** np.round(np.log2(bpm * grid_period / 60))
+            to_time = lambda dance_beats: time_at_beat(beat_times, start_beat + dance_beats / fold)
+            section_beats = (end_beat - start_beat) * fold
+        else:
+            to_time = lambda dance_beats: section_start + dance_beats * beat_to_sec
+            section_beats = (section_end - section_start) / beat_to_sec
         
         # precompute scaled events
         events = []
-        for e in DANCE_MODES[mode]['moves']:
+        for e in modes[mode]['moves']:
 
             base_pos = e['position']
             scaled_pos = 0.5 + (base_pos - 0.5) * scale
@@ -155,10 +258,12 @@ def schedule_dance_moves(tempo_sections, section_modes, duration_s, scale=1.0):
             if scale < 1.0:
                 print(f"scaling vel from {vel} to {vel * scale}")
                 vel = vel * scale
+            n = max(0, int(np.ceil((section_beats - e['startBeat']) / e['periodBeat'])))
+            times = to_time(e['startBeat'] + e['periodBeat'] * np.arange(n + 1))
+            times = times[(times >= section_start) & (times < section_end)]
             events.append({
                 'motor': e['motor'],
-                'start_s': section_start + e['startBeat']*beat_to_sec,
-                'period_s': e['periodBeat']*beat_to_sec,
+                'times': times,
                 'position': scaled_pos,
                 'velocity': vel
             })
@@ -169,6 +274,7 @@ def schedule_dance_moves(tempo_sections, section_modes, duration_s, scale=1.0):
             'mode': mode,
             'bpm_val': bpm_val,
             'bpm': bpm,
+            'gesture': section.get('gesture'),
             'beat_to_sec': beat_to_sec,
             'events': events
         }
@@ -179,12 +285,34 @@ def schedule_dance_moves(tempo_sections, section_modes, duration_s, scale=1.0):
     return sections_schedule
 
 
+def flatten_triggers(sections_schedule):
+    """
+    All triggers of the song sorted by time: (times array, event per trigger).
+    """
+    times = []
+    events = []
+    for sec in sections_schedule:
+        for e in sec['events']:
+            times.append(e['times'])
+            events.extend([e] * len(e['times']))
+    if not times:
+        return np.zeros(0), []
+    times = np.concatenate(times)
+    order = np.argsort(times, kind="stable")
+    return times[order], [events[i] for i in order]
+
+
 LIP_SYNC_ADVANCE_TIME = 0.3
+# seconds of lip sync that must be ready before the dance starts;
+# separation of the rest of the song continues ahead of the playhead
+LIP_SYNC_PRELOAD_S = 10.0
 def osc_dance(unused_addr, *args):
     """
     Usage:
       # USE CASE 1: /dance test duration_s mode1 bpm1 start1 mode2 bpm2 start2 ...
-      # USE CASE 2: /dance audio_filepath
+      # USE CASE 2: /dance audio_filepath [gestures]
+      #   with "gestures", sections that match a recorded gesture dance it
+      #   instead of their hand-written mode
     """
     
     if len(args) < 1:
@@ -223,17 +351,24 @@ def osc_dance(unused_addr, *args):
 
         use_audio = False
         first_beat_s = 0.0
+        beat_times = None
+        show_modes = DANCE_MODES
 
     else:
         # == USE CASE 2: audio file ==
         audio_filepath = args[0]
-
-        with ThreadPoolExecutor(max_workers=2) as executor:
-            future_sections = executor.submit(get_audio_sections, audio_filepath, novelty_percentile=90, verbose=False)
-            future_lip = executor.submit(lip_sync, audio_filepath, threshold=0.05, audio_feature="waveform")
-
-            tempo_sections, duration_s, first_beat_s = future_sections.result()
-            env_times, env_values = future_lip.result()
+        if len(args) > 2 or (len(args) == 2 and args[1] != "gestures"):
+            raise ValueError("Expected /dance <audio_filepath> [gestures]")
+        use_gestures = len(args) == 2
+
+        # lip sync streams in the background while the sections are analysed
+        lip = ProgressiveLipSync(audio_filepath, threshold=0.05, audio_feature="waveform")
+        tempo_sections, duration_s, first_beat_s, beats = get_audio_sections(
+            audio_filepath, novelty_percentile=90, verbose=False, return_beats=True
+        )
+        beat_times = beats["beat_times_s"]
+        lip.wait_until(first_beat_s + LIP_SYNC_PRELOAD_S)
+        env_times, env_values = lip.times, lip.positions
 
         use_audio = True
 
@@ -263,6 +398,11 @@ def osc_dance(unused_addr, *args):
             section_modes.append(chosen_mode)
             prev_mode = chosen_mode
 
+        show_modes = DANCE_MODES
+        if use_gestures:
+            # recorded gestures replace the hand-written modes where one matches
+            section_modes, show_modes = gesture_modes(tempo_sections, section_modes)
+            print("Matched gestures:", [section["gesture"] for section in tempo_sections])
         print("Assigned dance modes:", section_modes)
 
     if duration_s <= 0:
@@ -272,7 +412,11 @@ def osc_dance(unused_addr, *args):
     # optionally scale down movement to examine lip sync better
     # This is not used because scaled down movement is not smooth (stops before reaching max position)
     if len(env_times) > 0: movement_scale = 0.3
-    sections_schedule = schedule_dance_moves(tempo_sections, section_modes, duration_s, scale=movement_scale)
+    sections_schedule = schedule_dance_moves(
+        tempo_sections, section_modes, duration_s, scale=movement_scale, beat_times=beat_times,
+        modes=show_modes
+    )
+    trigger_times, trigger_events = flatten_triggers(sections_schedule)
 
     # neutral position
     moveHeadTurn(-1, 0.5, 0.02, 0)
@@ -292,34 +436,34 @@ def osc_dance(unused_addr, *args):
         print(f"Starting dance mode '{section_modes[current_section_idx]}' at {tempo_sections[current_section_idx]['bpm']} BPM for section starting at {tempo_sections[current_section_idx]['start_s']:.2f}s")
        
         mouth_idx = -1
+        next_trigger = 0
         while True:
             t = time.time() - start_time
-            if t >= duration_s - first_beat_s:
+            song_t = t + first_beat_s  # the schedule holds song times; playback started first_beat_s earlier
+            if song_t >= duration_s:
                 print("reached maximum duration, stopping robot movement")
                 break
             
             # lip syncing
-            if len(env_times) > 0 and mouth_idx + 1 < len(env_times) and t + first_beat_s >= env_times[mouth_idx + 1] - LIP_SYNC_ADVANCE_TIME:
+            if mouth_idx + 1 < min(len(env_times), len(env_values)) and song_t >= env_times[mouth_idx + 1] - LIP_SYNC_ADVANCE_TIME:
                 mouth_idx += 1
                 moveMouth(-1, env_values[mouth_idx], 0.25, 0)
 
             # section dance switch
             if (current_section_idx + 1 < len(sections_schedule) and
-                t >= sections_schedule[current_section_idx + 1]['start_s']):
+                song_t >= sections_schedule[current_section_idx + 1]['start_s']):
                 current_section_idx += 1
                 sec = sections_schedule[current_section_idx]
                 print(f"Starting dance mode '{sec['mode']}' at {sec['bpm_val']} BPM for section starting at {sec['start_s']:.2f}s")
-            sec = sections_schedule[current_section_idx]
-
-            # execute events in the current section
-            for i, e in enumerate(sec['events']):
-                if t >= e["start_s"]:
-                    n = int((t - e["start_s"]) / e["period_s"])
-                    next_trigger = e["start_s"] + n * e["period_s"]
-                    if 0 <= t - next_trigger < 0.07:  # trigger window
-                        motor = MOTOR_MAP[e["motor"]]
-                        vel = e["velocity"]
-                        motor(-1, e["position"], vel, 0)
+
+            # execute due events (triggers more than a window late are skipped)
+            while next_trigger < len(trigger_times) and song_t >= trigger_times[next_trigger]:
+                if song_t - trigger_times[next_trigger] < 0.07:  # trigger window
+                    e = trigger_events[next_trigger]
+                    motor = MOTOR_MAP[e["motor"]]
+                    vel = e["velocity"]
+                    motor(-1, e["position"], vel, 0)
+                next_trigger += 1
 
             # if not use_audio and t >= next_tick_time:
             #     play_tick()
@@ -331,8 +475,13 @@ def osc_dance(unused_addr, *args):
             sd.wait()  # blocks until playback finishes
 
 if __name__ == "__main__":
+    init_hardware()
     dispatcher.map("/dance", osc_dance)
 
+    # load Demucs in the background so the first /dance doesn't pay for it
+    if separation.is_available():
+        threading.Thread(target=separation.warm_up, daemon=True).start()
+
     NeckTilt.initmotor()
     HeadTurn.initmotor()
 
@@ -387,7 +536,7 @@ if __name__ == "__main__":
         )
 
         # == USE CASE 2. Dance to an input audio with automatic segmentations ==
-        # /dance audio_filepath
+        # /dance audio_filepath [gestures]
         # osc_dance("/dance", song_list[10])
 
     except Exception as e:
@@ -0,0 +1,71 @@
+import librosa
+import numpy as np
+import soxr
+
+# ===========================
+#   Decoding & Resampling
+# ===========================
+# Audio is decoded once at its native rate and resampled (with soxr) to a
+# lower rate per kind of analysis. Rates are always native_sr / k for an
+# integer k that also divides the hop length, so analysis frame i at the
+# lower rate starts exactly at native sample i * hop_length * k and every
+# timestamp maps back onto the original audio without rounding.
+
+BEAT_SR = 22050      # beat tracking, tempo curve, chroma
+ENVELOPE_SR = 11025  # lip sync envelopes
+
+
+def decimation_factor(native_sr, target_sr, hop_length=None):
+    """
+    Largest integer k <= native_sr / target_sr (rounded) that divides
+    native_sr (and hop_length, if given). 1 means "stay at the native rate".
+    """
+    if target_sr is None or target_sr >= native_sr:
+        return 1
+    k = max(1, int(round(native_sr / target_sr)))
+    while k > 1 and (native_sr % k or (hop_length is not None and hop_length % k)):
+        k -= 1
+    return k
+
+
+def resample(y, orig_sr, target_sr):
+    if orig_sr == target_sr:
+        return y
+    return soxr.resample(y, orig_sr, target_sr, quality="HQ").astype(np.float32, copy=False)
+
+
+class DecodedAudio:
+    """
+    A mono track decoded once, with resampled versions made on demand and kept.
+    """
+
+    def __init__(self, y, sr):
+        self.y = y
+        self.sr = sr
+        self._resampled = {sr: y}
+
+    @classmethod
+    def load(cls, path):
+        y, sr = librosa.load(path, sr=None)
+        return cls(y, sr)
+
+    @property
+    def duration_s(self):
+        return len(self.y) / self.sr
+
+    def at(self, target_sr, hop_length=None):
+        """
+        Returns (y, sr) at the analysis rate closest to target_sr
+        (see decimation_factor). target_sr=None means the native rate.
+        """
+        k = decimation_factor(self.sr, target_sr, hop_length)
+        sr = self.sr // k
+        if sr not in self._resampled:
+            self._resampled[sr] = resample(self.y, self.sr, sr)
+        return self._resampled[sr], sr
+
+    def time_to_sample(self, t):
+        """
+        Map analysis timestamps (seconds) to native sample indices.
+        """
+        return np.round(np.asarray(t) * self.sr).astype(int)
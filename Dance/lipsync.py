@@ -3,6 +3,7 @@ import librosa
 import random
 import sounddevice as sd
 import soundfile as sf
+import threading
 import time
 import numpy as np
 
@@ -11,7 +12,8 @@ from concurrent.futures import ThreadPoolExecutor
 from dynamixel_sdk import *                    # Uses Dynamixel SDK library
 from pythonosc.dispatcher import Dispatcher
 from pythonosc.osc_server import BlockingOSCUDPServer
-from Dance.AudioAnalysis import get_audio_sections, lip_sync
+from Dance import separation
+from Dance.AudioAnalysis import ProgressiveLipSync
 
 # ===========
 #   MOTORS 
@@ -175,6 +177,9 @@ def schedule_dance_moves(tempo_sections, section_modes, duration_s, scale=1.0):
     return sections_schedule
 
 LIP_SYNC_ADVANCE_TIME = 0.2
+# seconds of lip sync that must be ready before playback starts;
+# separation of the rest of the song continues ahead of the playhead
+LIP_SYNC_PRELOAD_S = 10.0
 
 def osc_dance(unused_addr, *args):
     """
@@ -186,7 +191,9 @@ def osc_dance(unused_addr, *args):
         raise ValueError("OSC /dance requires at least 1 arguments")
     
     audio_filepath = args[0]
-    env_times, env_values = lip_sync(audio_filepath, threshold=0.05, audio_feature="rms")
+    lip = ProgressiveLipSync(audio_filepath, threshold=0.05, audio_feature="rms")
+    lip.wait_until(LIP_SYNC_PRELOAD_S)
+    env_times, env_values = lip.times, lip.positions
 
     # neutral position
     moveHeadTurn(-1, 0.5, 0.02, 0)
@@ -209,7 +216,7 @@ def osc_dance(unused_addr, *args):
                 break
             
             # lip syncing
-            if len(env_times) > 0 and mouth_idx + 1 < len(env_times) and t >= env_times[mouth_idx + 1] - LIP_SYNC_ADVANCE_TIME:
+            if mouth_idx + 1 < min(len(env_times), len(env_values)) and t >= env_times[mouth_idx + 1] - LIP_SYNC_ADVANCE_TIME:
                 mouth_idx += 1
                 moveMouth(-1, env_values[mouth_idx], 0.2, 0)
             time.sleep(0.01)
@@ -219,6 +226,10 @@ def osc_dance(unused_addr, *args):
 if __name__ == "__main__":
     dispatcher.map("/dance", osc_dance)
 
+    # load Demucs in the background so the first /dance doesn't pay for it
+    if separation.is_available():
+        threading.Thread(target=separation.warm_up, daemon=True).start()
+
     NeckTilt.initmotor()
     HeadTurn.initmotor()
 
@@ -0,0 +1,156 @@
+"""
+Pre-analyse a song library so shows start with zero analysis latency.
+
+Runs sectioning, vocal separation and lip sync envelope extraction for every
+audio file under the given directories, one file per worker process, and
+stores the results in the analysis cache (Dance.analysis_cache) under the
+same keys /dance and /lipsync look up.
+
+Usage (from the repo root):
+    python -m Dance.prepare_library [dirs or files...]   # defaults to data/
+    python -m Dance.prepare_library data/setlist --workers 2 --force
+"""
+import argparse
+import contextlib
+import io
+import multiprocessing
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from Dance import separation
+from Dance.analysis_cache import AnalysisCache, CACHE_DIR
+from Dance.AudioAnalysis import MIX_FEATURES, get_audio_sections, lip_sync, separate_source
+from Dance.task_graph import default_workers
+
+AUDIO_EXTENSIONS = (".wav", ".mp3", ".flac", ".ogg", ".m4a")
+
+# the analyses the show entry points request (keep in sync with dance.py / lipsync.py)
+SECTION_PARAMS = {"novelty_percentile": 90}
+LIP_SYNC_PARAMS = [
+    {"threshold": 0.05, "audio_feature": "waveform"},  # Dance/dance.py
+    {"threshold": 0.05, "audio_feature": "rms"},       # Dance/lipsync.py
+]
+
+
+def find_audio_files(paths):
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for dirpath, _, names in os.walk(path):
+            for name in names:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    files.append(os.path.join(dirpath, name))
+    return sorted(set(files))
+
+
+def _init_worker(torch_threads):
+    # every worker separating at once with torch's default thread count would
+    # oversubscribe the CPU, so split the cores between them
+    if separation.is_available():
+        separation.configure_torch_threads(torch_threads)
+
+
+def prepare_song(audio_file, cache_root=CACHE_DIR, force=False, verbose=False):
+    """
+    Run every analysis for one file. Returns (audio_file, {stage: seconds}, error).
+    """
+    cache = AnalysisCache(cache_root)
+    timings = {}
+    log = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    with log:
+        try:
+            t0 = time.perf_counter()
+            # files are already spread over the cores, so no nested process pool
+            get_audio_sections(audio_file, force_segment=force, cache=cache, max_workers=1, **SECTION_PARAMS)
+            timings["sections"] = time.perf_counter() - t0
+
+            if any(p["audio_feature"] not in MIX_FEATURES for p in LIP_SYNC_PARAMS):
+                t0 = time.perf_counter()
+                separate_source(audio_file, force_separate=force, cache=cache)
+                timings["separation"] = time.perf_counter() - t0
+
+            for params in LIP_SYNC_PARAMS:
+                t0 = time.perf_counter()
+                lip_sync(audio_file, cache=cache, force_envelope=force, **params)
+                timings[f"envelope:{params['audio_feature']}"] = time.perf_counter() - t0
+        except Exception:
+            return audio_file, timings, traceback.format_exc()
+    return audio_file, timings, None
+
+
+def print_report(results, wall_s):
+    stages = []
+    for _, timings, _ in results:
+        for stage in timings:
+            if stage not in stages:
+                stages.append(stage)
+
+    width = max([len("file")] + [len(f) for f, _, _ in results])
+    print()
+    print(f"{'file':<{width}} " + " ".join(f"{s:>18}" for s in stages) + f" {'total':>9}")
+    totals = dict.fromkeys(stages, 0.0)
+    for audio_file, timings, error in results:
+        cells = []
+        for stage in stages:
+            if stage in timings:
+                cells.append(f"{timings[stage]:18.2f}")
+                totals[stage] += timings[stage]
+            else:
+                cells.append(f"{'-':>18}")
+        status = "  FAILED" if error else ""
+        print(f"{audio_file:<{width}} " + " ".join(cells) + f" {sum(timings.values()):9.2f}{status}")
+    print(f"{'sum':<{width}} " + " ".join(f"{totals[s]:18.2f}" for s in stages) + f" {sum(totals.values()):9.2f}")
+    print(f"wall clock {wall_s:.2f}s")
+
+    for audio_file, _, error in results:
+        if error:
+            print(f"\n{audio_file} failed:\n{error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pre-analyse audio files into the analysis cache.")
+    parser.add_argument("paths", nargs="*", default=["data"], help="audio files or directories to scan")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="files analysed at once")
+    parser.add_argument("--cache", default=CACHE_DIR, help="analysis cache directory")
+    parser.add_argument("--force", action="store_true", help="recompute even if results are cached")
+    parser.add_argument("--verbose", action="store_true", help="show the analysis output of each file")
+    args = parser.parse_args()
+
+    audio_files = find_audio_files(args.paths)
+    if not audio_files:
+        print(f"No audio files found in {args.paths}")
+        return
+    workers = max(1, min(args.workers, len(audio_files)))
+    print(f"Preparing {len(audio_files)} files with {workers} workers...")
+
+    results = []
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        # spawn, not fork: forking a process that has torch/OpenMP threads can deadlock
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(max(1, separation.usable_cpu_count() // workers),),
+    ) as pool:
+        futures = [
+            pool.submit(prepare_song, audio_file, args.cache, args.force, args.verbose)
+            for audio_file in audio_files
+        ]
+        for future in as_completed(futures):
+            audio_file, timings, error = future.result()
+            print(f"{'FAILED' if error else 'done':>6} {audio_file} ({sum(timings.values()):.2f}s)")
+            results.append((audio_file, timings, error))
+    wall_s = time.perf_counter() - t0
+
+    results.sort()
+    print_report(results, wall_s)
+    AnalysisCache(args.cache).evict()
+
+
+if __name__ == "__main__":
+    main()
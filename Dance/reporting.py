@@ -0,0 +1,171 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from concurrent.futures import ThreadPoolExecutor
+
+# ===========================
+#    Diagnostic Reporting
+# ===========================
+# Analysis functions describe a diagnostic plot as a list of lines
+#   [(x, y, style, label), ...]
+# and hand it to a reporter. The default reporter drops it, so analysis
+# never pays for matplotlib unless a caller explicitly asks for artifacts.
+
+
+class NullReporter:
+    """
+    Default sink. Discards every report.
+    """
+    enabled = False
+
+    def report(self, name, lines, title="", xlabel="", ylabel="", ylim=None):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ArrayReporter:
+    """
+    Writes the raw arrays of each report to <out_dir>/<name>.npz.
+    Nothing is rendered; use render_saved_report() to plot them later.
+    """
+    enabled = True
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+
+    def report(self, name, lines, title="", xlabel="", ylabel="", ylim=None):
+        os.makedirs(self.out_dir, exist_ok=True)
+        arrays = {}
+        styles = []
+        for i, (x, y, style, label) in enumerate(lines):
+            arrays[f"x{i}"] = np.asarray(x)
+            arrays[f"y{i}"] = np.asarray(y)
+            styles.append([style, label])
+        meta = {
+            "title": title,
+            "xlabel": xlabel,
+            "ylabel": ylabel,
+            "ylim": ylim,
+            "styles": styles,
+        }
+        path = os.path.join(self.out_dir, f"{name}.npz")
+        np.savez(path, meta=json.dumps(meta), **arrays)
+        print(f"Saved report arrays to {path}")
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PlotReporter:
+    """
+    Renders each report to <out_dir>/<name>.png on a single background
+    worker thread, so the analysis call returns without waiting for matplotlib.
+    """
+    enabled = True
+
+    def __init__(self, out_dir, dpi=300, figsize=(12, 4)):
+        self.out_dir = out_dir
+        self.dpi = dpi
+        self.figsize = figsize
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plot-reporter")
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def report(self, name, lines, title="", xlabel="", ylabel="", ylim=None):
+        # copy now: the caller is free to reuse its buffers once we return
+        lines = [(np.array(x), np.array(y), style, label) for x, y, style, label in lines]
+        path = os.path.join(self.out_dir, f"{name}.png")
+        future = self._executor.submit(
+            render_report, path, lines, title, xlabel, ylabel, ylim, self.dpi, self.figsize
+        )
+        with self._lock:
+            self._pending = [f for f in self._pending if not f.done()]
+            self._pending.append(future)
+
+    def flush(self):
+        """
+        Block until every submitted plot has been written.
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        self.flush()
+        self._executor.shutdown(wait=True)
+
+
+def render_report(path, lines, title="", xlabel="", ylabel="", ylim=None, dpi=300, figsize=(12, 4)):
+    """
+    Render one report to an image file.
+
+    Uses the object-oriented Figure API rather than pyplot, so it is safe to call
+    off the main thread and the figure is never registered in pyplot's global
+    figure manager (nothing is left behind to leak).
+    """
+    from matplotlib.figure import Figure
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fig = Figure(figsize=figsize)
+    try:
+        ax = fig.add_subplot()
+        for x, y, style, label in lines:
+            ax.plot(x, y, style, label=label)
+        ax.set_title(title)
+        ax.set_xlabel(xlabel)
+        ax.set_ylabel(ylabel)
+        if ylim is not None:
+            ax.set_ylim(*ylim)
+        ax.legend()
+        fig.tight_layout()
+        fig.savefig(path, dpi=dpi, bbox_inches="tight")
+    finally:
+        fig.clear()
+    print(f"Saved plot to {path}")
+    return path
+
+
+def render_saved_report(npz_path, out_path=None, dpi=300):
+    """
+    Render a report written by ArrayReporter. Defaults to <npz_path>.png.
+    """
+    with np.load(npz_path) as data:
+        meta = json.loads(str(data["meta"]))
+        lines = [
+            (data[f"x{i}"], data[f"y{i}"], style, label)
+            for i, (style, label) in enumerate(meta["styles"])
+        ]
+    if out_path is None:
+        out_path = os.path.splitext(npz_path)[0] + ".png"
+    return render_report(
+        out_path, lines, meta["title"], meta["xlabel"], meta["ylabel"], meta["ylim"], dpi=dpi
+    )
+
+
+NULL_REPORTER = NullReporter()
+
+_verbose_reporter = None
+_verbose_lock = threading.Lock()
+
+def get_verbose_reporter():
+    """
+    Shared PlotReporter used when an analysis function is called with verbose=True
+    and no explicit reporter. Writes next to the Dance module as before.
+    """
+    global _verbose_reporter
+    with _verbose_lock:
+        if _verbose_reporter is None:
+            _verbose_reporter = PlotReporter("Dance")
+        return _verbose_reporter
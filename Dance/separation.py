@@ -0,0 +1,167 @@
+import os
+import threading
+
+import librosa
+import numpy as np
+
+# ===========================
+#  In-process Demucs Backend
+# ===========================
+# The demucs CLI pays interpreter start-up, the torch import and weight
+# loading on every song. Here models are loaded once per process and kept
+# warm in a small pool, and the separated stem is handed back as an array.
+
+_models = {}
+_models_lock = threading.Lock()
+# torch already spreads one separation across all intra-op threads;
+# running two at once would only oversubscribe the CPU.
+_inference_lock = threading.Lock()
+_threads_configured = False
+
+
+def is_available():
+    """
+    True if demucs (and torch) can be imported in this process.
+    """
+    try:
+        import demucs.pretrained  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def usable_cpu_count():
+    """
+    CPUs this process may run on (respects affinity / container limits where the OS exposes them).
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def configure_torch_threads(num_threads=None):
+    """
+    Set torch's intra-op thread count. Defaults to the CPUs available to this
+    process, which avoids torch's default of counting every core on the host
+    inside a container or pinned process.
+    """
+    global _threads_configured
+    import torch
+
+    if num_threads is None:
+        num_threads = usable_cpu_count()
+    torch.set_num_threads(num_threads)
+    _threads_configured = True
+    print(f"torch intra-op threads set to {num_threads}")
+
+
+def get_model(model="htdemucs"):
+    """
+    Return the pretrained Demucs model, loading it on first use.
+    """
+    with _models_lock:
+        if model not in _models:
+            from demucs.pretrained import get_model as load_pretrained
+
+            if not _threads_configured:
+                configure_torch_threads()
+            print(f"Loading Demucs model {model}...")
+            m = load_pretrained(model)
+            m.cpu()
+            m.eval()
+            _models[model] = m
+        return _models[model]
+
+
+def warm_up(model="htdemucs"):
+    """
+    Load the model ahead of the first separation (e.g. at server start-up).
+    """
+    get_model(model)
+
+
+def separate(audio_file, model="htdemucs", track_to_separate="vocals", shifts=1, overlap=0.25):
+    """
+    Separate one stem in-process.
+
+    Returns:
+        stem : np.ndarray
+            Mono float32 stem.
+        sr : int
+            Sample rate of the stem (the model's sample rate).
+    """
+    import torch
+    from demucs.apply import apply_model
+
+    m = get_model(model)
+    if track_to_separate not in m.sources:
+        raise ValueError(f"Model {model} has no '{track_to_separate}' source (has {m.sources})")
+
+    wav, ref_mean, ref_std = _load_mix(audio_file, m)
+
+    with _inference_lock, torch.no_grad():
+        sources = apply_model(
+            m, wav[None], shifts=shifts, split=True, overlap=overlap, progress=False
+        )[0]
+    sources = sources * ref_std + ref_mean
+
+    stem = sources[m.sources.index(track_to_separate)]
+    return stem.mean(dim=0).numpy().astype(np.float32), m.samplerate
+
+
+def separate_stream(audio_file, model="htdemucs", track_to_separate="vocals",
+                    chunk_s=10.0, context_s=2.0, shifts=1, overlap=0.25):
+    """
+    Separate one stem chunk by chunk, in playback order.
+
+    Each chunk is separated together with context_s of audio on either side,
+    which is then discarded, so chunk edges don't get the artifacts of a
+    hard cut. Pieces are final when yielded and can be used immediately.
+
+    Yields:
+        (start_sample, stem, sr) with stem a mono float32 array.
+    """
+    import torch
+    from demucs.apply import apply_model
+
+    m = get_model(model)
+    if track_to_separate not in m.sources:
+        raise ValueError(f"Model {model} has no '{track_to_separate}' source (has {m.sources})")
+    source_idx = m.sources.index(track_to_separate)
+    sr = m.samplerate
+
+    # normalized with whole-song statistics so every chunk sees the same scaling
+    wav, ref_mean, ref_std = _load_mix(audio_file, m)
+
+    n = wav.shape[-1]
+    chunk = int(chunk_s * sr)
+    context = int(context_s * sr)
+    for start in range(0, n, chunk):
+        end = min(start + chunk, n)
+        lo = max(0, start - context)
+        hi = min(n, end + context)
+
+        with _inference_lock, torch.no_grad():
+            sources = apply_model(
+                m, wav[None, :, lo:hi], shifts=shifts, split=True, overlap=overlap, progress=False
+            )[0]
+        stem = sources[source_idx, :, start - lo:end - lo] * ref_std + ref_mean
+        yield start, stem.mean(dim=0).numpy().astype(np.float32), sr
+
+
+def _load_mix(audio_file, m):
+    """
+    Load the mix at the model's rate/channels and normalize it the way the demucs CLI does.
+    Returns (normalized tensor, mean, std) so the output can be de-normalized.
+    """
+    import torch
+
+    mix, _ = librosa.load(audio_file, sr=m.samplerate, mono=False)
+    mix = np.atleast_2d(mix)
+    if mix.shape[0] != m.audio_channels:
+        mix = np.repeat(mix.mean(axis=0, keepdims=True), m.audio_channels, axis=0)
+
+    wav = torch.from_numpy(mix)
+    ref = wav.mean(0)
+    ref_mean, ref_std = ref.mean(), ref.std()
+    return (wav - ref_mean) / ref_std, ref_mean, ref_std
@@ -0,0 +1,188 @@
+import atexit
+import multiprocessing
+import threading
+
+import numpy as np
+
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+from Dance.separation import usable_cpu_count
+
+# ===========================
+#   Parallel Analysis Graph
+# ===========================
+# Independent analysis stages run in a process pool (most of librosa's work
+# is Python-level and holds the GIL, so threads don't help). Decoded audio is
+# put in shared memory once and workers map it instead of unpickling a copy
+# per task.
+
+
+def default_workers():
+    return min(4, usable_cpu_count())
+
+
+# ---- shared audio ----
+
+class SharedArray:
+    """
+    Copy of a 1-D float32 array in shared memory. Pass `handle` to workers and
+    open it there with attach_array(). Use as a context manager so the
+    segment is always unlinked.
+    """
+
+    def __init__(self, array):
+        array = np.ascontiguousarray(array, dtype=np.float32)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+        view = np.ndarray(array.shape, dtype=np.float32, buffer=self._shm.buf)
+        view[:] = array
+        del view
+        self.handle = (self._shm.name, array.shape[0])
+
+    def close(self):
+        self._shm.close()
+        self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@contextmanager
+def attach_array(handle):
+    """
+    Map a SharedArray in a worker. The array is only valid inside the block.
+    """
+    name, length = handle
+    # pool workers share the parent's resource tracker, so attaching here
+    # doesn't take ownership; the parent's unlink() cleans up
+    shm = shared_memory.SharedMemory(name=name)
+    array = np.ndarray((length,), dtype=np.float32, buffer=shm.buf)
+    try:
+        yield array
+    finally:
+        del array
+        shm.close()
+
+
+# ---- executors ----
+
+class _LazyFuture:
+    def __init__(self, fn, args):
+        self._fn = fn
+        self._args = args
+        self._done = False
+        self._result = None
+
+    def result(self):
+        if not self._done:
+            self._result = self._fn(*self._args)
+            self._done = True
+        return self._result
+
+    def done(self):
+        return self._done
+
+    def cancel(self):
+        return not self._done
+
+    def cancelled(self):
+        return False
+
+    def exception(self):
+        return None
+
+
+class InlineExecutor:
+    """
+    Runs tasks in the calling process, only when their result is asked for.
+    Used for max_workers=1 so speculative tasks that end up unused cost nothing.
+    """
+
+    def submit(self, fn, *args):
+        return _LazyFuture(fn, args)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def get_executor(max_workers=None):
+    """
+    Shared process pool with max_workers workers (kept alive between calls so
+    workers only import librosa once), or an InlineExecutor for 1 worker.
+    """
+    if max_workers is None:
+        max_workers = default_workers()
+    if max_workers <= 1:
+        return InlineExecutor()
+    with _pools_lock:
+        if max_workers not in _pools:
+            # spawn, not fork: forking a process that has torch/OpenMP threads can deadlock
+            _pools[max_workers] = ProcessPoolExecutor(
+                max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pools[max_workers]
+
+
+def discard(futures):
+    """
+    Cancel futures whose results are no longer needed and wait for the ones
+    already running, so nothing still uses resources the caller is about to free.
+    """
+    running = [f for f in futures if not f.cancel()]
+    wait([f for f in running if not isinstance(f, _LazyFuture)])
+
+
+@atexit.register
+def _shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+# ---- task graph ----
+
+class TaskGraph:
+    """
+    A small DAG of named tasks. Each task runs fn(*args, *dep_results) once
+    all of its deps are done; tasks whose deps are done run concurrently.
+    Tasks marked local run in the calling process (cheap glue code).
+    """
+
+    def __init__(self):
+        self._tasks = {}
+
+    def add(self, name, fn, *args, deps=(), local=False):
+        for dep in deps:
+            if dep not in self._tasks:
+                raise ValueError(f"Task {name} depends on unknown task {dep}")
+        self._tasks[name] = (fn, args, tuple(deps), local)
+
+    def run(self, executor):
+        """
+        Returns {name: result}.
+        """
+        results = {}
+        running = {}  # future -> name
+        waiting = dict(self._tasks)
+
+        while waiting or running:
+            for name, (fn, args, deps, local) in list(waiting.items()):
+                if not all(dep in results for dep in deps):
+                    continue
+                del waiting[name]
+                args = args + tuple(results[dep] for dep in deps)
+                if local or isinstance(executor, InlineExecutor):
+                    results[name] = fn(*args)
+                else:
+                    running[executor.submit(fn, *args)] = name
+
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    results[running.pop(future)] = future.result()
+            elif waiting and not any(all(d in results for d in deps) for _, _, deps, _ in waiting.values()):
+                raise RuntimeError(f"Task graph is stuck on {list(waiting)}")
+        return results
@@ -1,128 +1,126 @@
-import json
-import numpy as np
-import matplotlib.pyplot as plt
-from GestureInput.Shaiahead import RECORD_DT, save_path
-import numpy as np
-
-def infer_bpm_from_positions(
-    x,                      # position array
-    t,                      # time array
-    position_eps=10.0,      # ticks; below this = noise
-    min_nods=1,             # nods needed before BPM estimate
-    bpm_change_ratio=0.2    # 20% change triggers new segment
-):
-    """
-    Infer BPM from motor position using turning points.
-
-    Returns:
-        times: list of times (seconds)
-        bpms: list of BPM values (0 during inactivity)
-    """
-
-    direction = 0  # -1 down, +1 up, 0 unknown
-    last_dir = 0
-
-    peak_times = []
-    bpm_times = []
-    bpm_values = []
-
-    current_bpm = None
-
-    for i in range(1, len(x)):
-        dx = x[i] - x[i - 1]
+"""
+Tempo analysis of recorded gestures.
 
-        # Determine direction
-        if dx > position_eps:
-            direction = 1
-        elif dx < -position_eps:
-            direction = -1
-        else:
-            direction = 0
+Importing this module has no side effects (no motors, no plotting);
+matplotlib is only loaded by plot_analysis. To analyse and plot one recording:
 
-        # Detect peak: up/inactive -> down
-        if last_dir >= 0 and direction == -1:
-            peak_time = t[i]
-            peak_times.append(peak_time)
+    python -m GestureInput.GestureAnalysis [recording.gest] [--motor 11]
 
-            # Need enough peaks to estimate tempo
-            if len(peak_times) >= min_nods + 1:
-                # Compute periods between last few peaks
-                periods = np.diff(peak_times[-(min_nods + 1):])
-                avg_period = np.mean(periods)
+To analyse a folder of recordings, see GestureInput/analyze_gestures.py.
+"""
+import argparse
 
-                bpm = 60.0 / avg_period
-
-                if current_bpm is None:
-                    current_bpm = bpm
-                    bpm_times.append(peak_times[-(min_nods + 1)])
-                    bpm_values.append(bpm)
-                else:
-                    change = abs(bpm - current_bpm) / current_bpm
-                    if change > bpm_change_ratio:
-                        current_bpm = bpm
-                        bpm_times.append(peak_times[-(min_nods + 1)])
-                        bpm_values.append(bpm)
-
-        last_dir = direction
+import numpy as np
 
-    return np.array(bpm_times), np.array(bpm_values)
+from GestureInput.edit_journal import load_edited
+from GestureInput.gesture_tempo import infer_bpm_from_positions
 
 # -----------------------------
 # Parameters
 # -----------------------------
-fs = 1 / RECORD_DT
-motor_id = "11"  # HeadTilt
+DEFAULT_PATH = "GestureInput/recorded_frames.gest"  # Shaiahead / RecordEditGestures save_path
+DEFAULT_MOTOR = "11"  # HeadTilt
 
-# -----------------------------
-# Recorded data
-# -----------------------------
-with open(save_path, "r") as f:
-    recorded_frames = json.load(f)
 
-# Extract head tilt position
-x = np.array([frame[motor_id] for frame in recorded_frames], dtype=float) # position array
-t = np.array([f["t"] for f in recorded_frames])
-t = t - t[0]   # normalize to start at 0
+def analyze_gesture(recorded, motor_id=DEFAULT_MOTOR, **bpm_kwargs):
+    """
+    Tempo segments of one motor of a Gesture. bpm_kwargs go to
+    infer_bpm_from_positions. Returns a dict with the position trace
+    (t from 0, x), the segments (bpm_times, bpm_values) and summary numbers.
+    """
+    x = np.asarray(recorded.column(motor_id), dtype=float)  # position array
+    t = np.asarray(recorded.t, dtype=float)
+    t = t - t[0] if len(t) else t  # normalize to start at 0
+    bpm_times, bpm_values = infer_bpm_from_positions(x, t, **bpm_kwargs)
+
+    duration_s = float(t[-1]) if len(t) else 0.0
+    if len(bpm_values):
+        # tempo weighted by how long each segment lasts
+        ends = np.append(bpm_times[1:], duration_s)
+        weights = np.maximum(ends - bpm_times, 0)
+        mean_bpm = float(np.average(bpm_values, weights=weights)) if weights.sum() > 0 else float(bpm_values[-1])
+    else:
+        mean_bpm = None
+    return {
+        "motor_id": str(motor_id),
+        "t": t,
+        "x": x,
+        "bpm_times": bpm_times,
+        "bpm_values": bpm_values,
+        "duration_s": duration_s,
+        "n_frames": len(t),
+        "fs": (len(t) - 1) / duration_s if duration_s > 0 else 0.0,
+        "mean_bpm": mean_bpm,
+    }
+
+
+def analyze_file(path, motor_id=DEFAULT_MOTOR, **bpm_kwargs):
+    """
+    analyze_gesture of the recording at path, with its journaled edits applied
+    (as GestureLibrary and playback load it).
+    """
+    return analyze_gesture(load_edited(path), motor_id, **bpm_kwargs)
 
-bpm_times, bpm_values = infer_bpm_from_positions(x, t)
-print(f"Detected the following BPMs from the corresponding seconds:\n{bpm_values}\n{bpm_times}")
 
 # -----------------------------------------------------------
 # Visualization (plot position trajectory and inferred BPM)
 # -----------------------------------------------------------
-fig, ax = plt.subplots(figsize=(10, 4))
-
-# Plot head position
-ax.plot(t, x, color="black", linewidth=1)
-ax.set_xlabel("Time (s)")
-ax.set_ylabel("Position (ticks)")
-fig.suptitle(f"Position and Inferred BPM (Motor {motor_id})")
-colors = plt.cm.Set2.colors
-
-for i in range(len(bpm_times)):
-    start_t = bpm_times[i]
-    end_t = bpm_times[i + 1] if i + 1 < len(bpm_times) else t[-1]
-    bpm = bpm_values[i]
-
-    color = colors[i % len(colors)]
-
-    # Colored region
-    ax.axvspan(
-        start_t,
-        end_t,
-        color=color,
-        alpha=0.25
-    )
-
-    # BPM text
-    ax.text(
-        (start_t + end_t) / 2,
-        np.max(x),
-        f"{bpm:.1f} BPM",
-        ha="center",
-        va="top",
-        fontsize=10,
-        color=color
-    )
-
-plt.show()
+def plot_analysis(analysis, show=True):
+    import matplotlib.pyplot as plt
+
+    t, x = analysis["t"], analysis["x"]
+    bpm_times, bpm_values = analysis["bpm_times"], analysis["bpm_values"]
+    fig, ax = plt.subplots(figsize=(10, 4))
+
+    # Plot head position
+    ax.plot(t, x, color="black", linewidth=1)
+    ax.set_xlabel("Time (s)")
+    ax.set_ylabel("Position (ticks)")
+    fig.suptitle(f"Position and Inferred BPM (Motor {analysis['motor_id']})")
+    colors = plt.cm.Set2.colors
+
+    for i in range(len(bpm_times)):
+        start_t = bpm_times[i]
+        end_t = bpm_times[i + 1] if i + 1 < len(bpm_times) else t[-1]
+        bpm = bpm_values[i]
+
+        color = colors[i % len(colors)]
+
+        # Colored region
+        ax.axvspan(
+            start_t,
+            end_t,
+            color=color,
+            alpha=0.25
+        )
+
+        # BPM text
+        ax.text(
+            (start_t + end_t) / 2,
+            np.max(x),
+            f"{bpm:.1f} BPM",
+            ha="center",
+            va="top",
+            fontsize=10,
+            color=color
+        )
+
+    if show:
+        plt.show()
+    return fig
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plot the position and inferred BPM of a recorded gesture.")
+    parser.add_argument("path", nargs="?", default=DEFAULT_PATH, help="recording (.gest or legacy .json)")
+    parser.add_argument("--motor", default=DEFAULT_MOTOR, help="motor ID to analyse (default: HeadTilt)")
+    args = parser.parse_args()
+
+    analysis = analyze_file(args.path, args.motor)
+    print(f"Detected the following BPMs from the corresponding seconds:\n"
+          f"{analysis['bpm_values']}\n{analysis['bpm_times']}")
+    plot_analysis(analysis)
+
+
+if __name__ == "__main__":
+    main()
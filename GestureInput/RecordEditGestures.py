@@ -1,6 +1,5 @@
 # This file is an extension from Shaiahead that allows Gesture Editing during playback.
 
-import json
 import os
 import threading
 import time
@@ -8,10 +7,22 @@ import time
 import sounddevice as sd
 import numpy as np
 
-from utils.Dynamixelutils import dynamixel
+from utils.Dynamixelutils import dynamixel, sync_moveto, sync_read_positions
 from dynamixel_sdk import *                    # Uses Dynamixel SDK library
 from pythonosc.dispatcher import Dispatcher
 from pythonosc.osc_server import BlockingOSCUDPServer
+from pythonosc.udp_client import SimpleUDPClient
+from GestureInput.edit_journal import EditJournal, load_edited
+from GestureInput.edit_layers import EditStack
+from GestureInput.gesture_compress import compress_gesture
+from GestureInput.gesture_format import EXTENSION
+from GestureInput.gesture_library import GestureLibrary
+from GestureInput.gesture_player import GesturePlayer
+from GestureInput.gesture_recorder import LOG_SUFFIX, GestureRecorder, log_path_for, recover_pending
+from GestureInput.gesture_tempo import BPMTracker
+from GestureInput.gesture_warp import BeatClock, beat_synced_ticks, gesture_peaks, peaks_bpm
+from GestureInput.realtime import AtomicRef, PlaybackState, SPSCRing
+from GestureInput.sampler import FixedRateSampler
 
 dispatcher = Dispatcher()
 
@@ -107,21 +118,56 @@ GOAL_CURRENT_NECK = 50
 
 RECORD_DT = 0.005 # record delta time / interval
 MAX_RECORD_TIME = 600 # seconds
+# takes keep the sampled timestamps; playback and edits follow them (see
+# gesture_player), so resampling onto an exact RECORD_DT grid is optional
+RESAMPLE_ON_SAVE = False
+# tempo of the nods is tracked live while recording (see gesture_tempo)
+BPM_MOTOR = HeadTilt
+# send /bpm <value> to this (host, port) whenever the live tempo changes; None = print only
+BPM_OSC_TARGET = None
+bpm_client = SimpleUDPClient(*BPM_OSC_TARGET) if BPM_OSC_TARGET else None
+live_bpm = None
 # Recording state
 is_recording = False
+# frames stream to disk while recording (see gesture_recorder);
+# a Gesture (see gesture_format) once loaded for playback
+recorder = None
 recorded_frames = []
 # OSC control
 playback_on = False  # disable OSC during playback
+active_player = None  # GesturePlayer of the running playback
+# immutable copy of playback_on / editing_group for the playback loop
+playback_state = AtomicRef(PlaybackState())
 motor_settings_snapshots = {}
-save_path = "GestureInput/recorded_frames.json"
+save_path = "GestureInput/recorded_frames.gest"
+# named gestures (/record <name>, /play <name>, /queue <name>, /crossfade <name> [s]);
+# without a name the recording at save_path is used
+library = GestureLibrary()
+current_name = None
+CROSSFADE_S = 1.0
+# name -> writable recording of a queued / crossfaded gesture, loaded by
+# switch_gesture and adopted for editing once it plays (see adopt_switched_gesture)
+staged_recordings = AtomicRef({})
+# recordings from before the binary format; convert with python -m GestureInput.gesture_format
+legacy_save_path = "GestureInput/recorded_frames.json"
 
 # =====================
 #   THREADING LOCKS
 # =====================
-state_lock = threading.Lock()   # protects shared runtime state
+state_lock = threading.Lock()   # protects shared runtime state (never taken by the playback loop)
 file_lock = threading.Lock()    # protects file read/write
 port_lock = threading.Lock()    # protects Dynamixel serial communication
 
+def current_path():
+    return library.path_for(current_name) if current_name else save_path
+
+def publish_playback_state():
+    """
+    Swap in a new PlaybackState after changing playback_on / editing_group.
+    Call with state_lock held.
+    """
+    playback_state.set(PlaybackState(playback_on, frozenset(m.ID for m in editing_group)))
+
 # ==========
 #    STOP
 # ==========
@@ -132,6 +178,7 @@ def osc_stop(unused_addr, *args):
     with state_lock:
         is_recording = False
         playback_on = False
+        publish_playback_state()
 
 # ==========
 #   RECORD
@@ -166,8 +213,8 @@ def enter_record_mode():
             m.set_p_gain(POSITION_P_GAIN)
             m.set_goal_current(GOAL_CURRENT_NECK)
         
-def exit_record_mode():
-    global motor_settings_snapshots
+def exit_record_mode(bpm=None):
+    global motor_settings_snapshots, recorder
     print("Exiting record mode.")
     
     with port_lock:
@@ -183,50 +230,72 @@ def exit_record_mode():
         motor_settings_snapshots = {}
     print("Restored all motors to settings before the record.")
 
+    with state_lock:
+        take, recorder = recorder, None
+        name, path = current_name, current_path()
+    if take is None:
+        return
     try:
         with file_lock:
-            with open(save_path, "w") as f:
-                json.dump(recorded_frames, f, indent=2)
-        print(f"Saved recorded frames to {os.path.abspath(save_path)}")
+            take.finish(path, resample_dt=RECORD_DT if RESAMPLE_ON_SAVE else None)
+            if name:
+                library.register(name, bpm=bpm)
+        print(f"Saved {take.n_frames} recorded frames to {os.path.abspath(path)}")
     except Exception as e:
-        print(f"Error saving recorded frames: {e}")
+        print(f"Error saving recorded frames (the take log {take.log_path} is kept for recovery): {e}")
+
+def publish_bpm(bpm):
+    global live_bpm
+    live_bpm = bpm
+    print(f"Live tempo: {bpm:.1f} BPM")
+    if BPM_OSC_TARGET is not None:
+        bpm_client.send_message("/bpm", float(bpm))
 
 def record_loop():
-    global recorded_frames, is_recording
+    global recorder, is_recording
     enter_record_mode()
     start_time = time.time()
+    with state_lock:
+        recorder = GestureRecorder(log_path_for(current_path()), [m.ID for m in motors], RECORD_DT)
+        take = recorder
     print(f"Starting to record movements of motors {[m.ID for m in motors]}")
 
-    while True:
+    tracker = BPMTracker()
+    bpm_column = motors.index(BPM_MOTOR)
+
+    # reads are scheduled on absolute deadlines, so read time doesn't add to the period
+    sampler = FixedRateSampler(RECORD_DT)
+    for _ in sampler.ticks():
         with state_lock:
             if not is_recording or (time.time() - start_time >= MAX_RECORD_TIME):
                 break
 
-        frame = {}
+        positions = []
         for m in motors:
             with port_lock:
-                frame[str(m.ID)] = m.read_position()
-        frame["t"] = time.perf_counter()
-
-        with state_lock:
-            recorded_frames.append(frame)
+                positions.append(m.read_position())
+        now = time.perf_counter()
+        take.append(now, positions)
+        if tracker.update(now, positions[bpm_column]) is not None:
+            publish_bpm(tracker.bpm)
 
-        time.sleep(RECORD_DT)
+    print(f"Record sampling: {sampler.stats.summary()}")
 
     with state_lock:
         if is_recording:
             print(f"Reached max record time of {MAX_RECORD_TIME} seconds, stopping recording.")
             is_recording = False
 
-    exit_record_mode()
+    exit_record_mode(bpm=tracker.bpm)
 
 def osc_record(unused_addr, *args):
-    global is_recording, recorded_frames
+    global is_recording, recorded_frames, current_name
     with state_lock:
         if is_recording or playback_on:
             print("Recording/Playback in progress, skipping command. To execute command, run /stop first.")
             return
-        print("User triggered record")
+        current_name = str(args[0]) if args else None
+        print(f"User triggered record{f' of {current_name}' if current_name else ''}")
         recorded_frames = []
         is_recording = True
     # Run in a separate thread so the OSC server stays responsive
@@ -236,16 +305,71 @@ def osc_record(unused_addr, *args):
 #   EDIT
 # ==========
 editing_group = []
-edited_frames = {} 
-# {
-#   <frame_i>: {
-#       {
-#           <motor_id>: <motor_pos>,
-#           <motor_id>: <motor_pos>,
-#           <motor_id>: <motor_pos>
-#       }
-#   }
-# }
+# edits of the running playback, one overlay layer per editing pass (see edit_layers)
+edit_stack = None
+# live edits travel from the playback thread to edit_drain_loop through this ring
+EDIT_RING_CAPACITY = 4096
+EDIT_DRAIN_S = 0.05
+edit_ring = SPSCRing(EDIT_RING_CAPACITY)
+
+def drain_edits():
+    """
+    Move queued live edits into the open edit layer. Call with state_lock held.
+    """
+    for record in edit_ring.drain():
+        if edit_stack is not None:
+            edit_stack.open_layer().set(int(record["motor_id"]), slice(record["start"], record["stop"]), record["position"])
+
+def stage_recording(name):
+    """
+    Load a library gesture for editing and publish it in staged_recordings.
+    Disk I/O, so never call it with state_lock held.
+    """
+    with file_lock:
+        loaded = library.load(name, writable=True)
+    staged_recordings.update(lambda s: {**s, name: loaded})
+
+def stage_switched_gesture():
+    """
+    Stage the recording of a gesture that took over playback but wasn't
+    staged by switch_gesture (it was queued more than once, and the staged
+    copy went to its first turn). Call without state_lock.
+    """
+    player = active_player
+    name = player.tag if player is not None else None
+    if name is None or name == current_name or name in staged_recordings.get():
+        return
+    try:
+        stage_recording(name)
+    except Exception as e:
+        print(f"Error reading {name}: {e}")
+
+def adopt_switched_gesture():
+    """
+    When a queued / crossfaded gesture took over playback, make it the one
+    that edits go to. Call with state_lock held, after stage_switched_gesture.
+    """
+    global current_name, recorded_frames, edit_stack
+    if active_player is None or active_player.tag == current_name:
+        return
+    name = active_player.tag
+    loaded = staged_recordings.get().get(name)
+    if loaded is None:
+        return  # not staged yet; picked up on the next drain
+    staged_recordings.update(lambda s: {k: v for k, v in s.items() if k != name})
+    current_name = name
+    recorded_frames = loaded
+    edit_stack = EditStack(recorded_frames)
+    edit_ring.drain()
+    print(f"Playing {current_name}")
+
+def edit_drain_loop(stop_event):
+    while not stop_event.wait(EDIT_DRAIN_S):
+        stage_switched_gesture()
+        with state_lock:
+            adopt_switched_gesture()
+            drain_edits()
+
 def osc_edit_neck(unused_addr, *args):
     start_edit_group(NECK_MOTORS)
 
@@ -255,10 +379,21 @@ def osc_edit_head(unused_addr, *args):
 def osc_stop_edit(unused_addr, *args):
     stop_edit_group()
 
+def osc_undo(unused_addr, *args):
+    undo_edit()
+
 def start_edit_group(motor_group):
     global editing_group, motor_settings_snapshots
     with state_lock:
+        if beat_clock is not None:
+            print("Editing is not available during beat-synced playback.")
+            return
+        if active_player is not None and (active_player.switching or active_player.tag != current_name):
+            # the recorded frame indices would change under the open edit layer
+            print("Gesture switch pending, skipping command. Edit once the queued / crossfaded gesture plays.")
+            return
         editing_group = motor_group
+        publish_playback_state()
 
     print(f"Motors {[m.ID for m in editing_group]} entering edit/record mode")
     for m in motor_group:
@@ -275,11 +410,12 @@ def start_edit_group(motor_group):
                     motor_settings_snapshots[m.ID] = snapshot
 
 def stop_edit_group():
-    global editing_group, edited_frames, recorded_frames, motor_settings_snapshots
+    global editing_group, recorded_frames, motor_settings_snapshots
 
-    print(f"Restoring motors {[m.ID for m in editing_group]} from edit/record mode")
+    stopped_group = list(editing_group)
+    print(f"Restoring motors {[m.ID for m in stopped_group]} from edit/record mode")
 
-    for m in editing_group:
+    for m in stopped_group:
         with port_lock:
             if m in nonGravityMotors:
                 m.enable_torque()
@@ -293,25 +429,74 @@ def stop_edit_group():
     print("Merging edited frames with recorded frames")
 
     with state_lock:
-        for frame_i, motors_new_pos in edited_frames.items():
-            if frame_i < len(recorded_frames):
-                recorded_frames[frame_i].update(motors_new_pos)
-
-    print(f"Finished editing motors: {[m.ID for m in editing_group]}")
-
+        # playback resumes driving these motors; then collect what is still queued
+        editing_group = []
+        publish_playback_state()
+        drain_edits()
+        layers = edit_stack.layers if edit_stack is not None else []  # merge() starts a new list
+        n_edited = edit_stack.merge() if edit_stack is not None else 0
+        if active_player is not None and n_edited:
+            active_player.set_gesture(compress_gesture(recorded_frames), active_player.tag)
+
+    print(f"Finished editing motors: {[m.ID for m in stopped_group]}")
+
+    # only the edited frames are appended to the recording's journal (see
+    # edit_journal); the whole recording is rewritten when the journal is due
+    # for compaction, or when there is no binary recording yet (legacy .json)
+    # or the journal on disk was left by a different recording
     try:
+        with state_lock:
+            name, path = current_name, current_path()
         with file_lock:
-            with open(save_path, "w") as f:
-                json.dump(recorded_frames, f, indent=2)
-        print(f"Saved recorded frames after editing to {os.path.abspath(save_path)}")
+            journal = EditJournal(path)
+            if not os.path.exists(path) or (journal.motor_ids is not None and not journal.matches(recorded_frames)):
+                journal.compact(recorded_frames, record_dt=RECORD_DT)
+                print(f"Saved recorded frames after editing to {os.path.abspath(path)}")
+            elif n_edited:
+                n_bytes = journal.append_pass(layers, recorded_frames)
+                print(f"Saved {n_edited} edited frames ({n_bytes / 1e3:.1f} kB) to {journal.path}")
+                if journal.needs_compaction():
+                    journal.compact(recorded_frames, record_dt=RECORD_DT)
+                    print(f"Compacted the edit journal into {os.path.abspath(path)}")
+            if name and n_edited:
+                library.register(name)
     except Exception as e:
         print(f"Error saving recorded frames after editing: {e}")
 
     with state_lock:
-        editing_group = []
-        edited_frames = {}
         motor_settings_snapshots = {}
 
+def undo_edit():
+    """
+    Undo the latest saved editing pass of the current recording (/undo).
+    Passes that were compacted into the recording can't be undone.
+    """
+    global recorded_frames, edit_stack
+    with state_lock:
+        if editing_group:
+            print("Finish editing (/stopEdit) before undoing.")
+            return
+        name, path = current_name, current_path()
+    try:
+        with file_lock:
+            if not EditJournal(path).undo():
+                print("Nothing to undo.")
+                return
+            # the base recording plus the passes that are left
+            loaded = load_edited(path, writable=True)
+            if name:
+                library.register(name)
+    except Exception as e:
+        print(f"Error undoing the last edit: {e}")
+        return
+    with state_lock:
+        recorded_frames = loaded
+        if edit_stack is not None:
+            edit_stack = EditStack(recorded_frames)
+        if active_player is not None:
+            active_player.set_gesture(compress_gesture(recorded_frames), active_player.tag)
+    print(f"Undid the last editing pass of {os.path.abspath(path)}")
+
 # ==========
 #  PLAYBACK
 # ==========
@@ -329,95 +514,282 @@ def play_ting(duration=0.05, freq=1000, sample_rate=44100, volume=0.3):
     # Do not block, playback continues asynchronously
 
 def playback():
-    global is_recording, playback_on, recorded_frames, editing_group, edited_frames
+    global is_recording, playback_on, recorded_frames, edit_stack, active_player
     print(f"Starting to playback the recorded movements of motors {[m.ID for m in motors]}")
     
     with state_lock:
         is_recording = False
         playback_on = True
+        if len(recorded_frames) == 0:
+            playback_on = False
+            print("Nothing recorded to play back")
+            return
+        # stream keyframes instead of every recorded sample
+        keyframes = library.keyframes(current_name) if current_name else compress_gesture(recorded_frames)
+        player = GesturePlayer(keyframes, [m.ID for m in motors], RECORD_DT, tag=current_name)
+        active_player = player
+        edit_stack = EditStack(recorded_frames)
+        edit_ring.drain()  # leftovers of a previous playback
+        publish_playback_state()
+
+    drain_stop = threading.Event()
+    drain_thread = threading.Thread(target=edit_drain_loop, args=(drain_stop,), daemon=True)
+    drain_thread.start()
+
+    # frames follow the recorded timestamps (interpolated, skipped when running late);
+    # play a short "ting" every time the recording loops around.
+    # This loop never takes state_lock: it reads the published PlaybackState
+    # and hands edits to edit_drain_loop through edit_ring. edit_drain_loop
+    # also adopts a queued / crossfaded gesture once it takes over.
+    last_i = -1
+    playing_tag = player.tag
+    last_sent = {}  # motor ID -> last goal position written
+    for i, positions in player.ticks(loop=True, on_loop=play_ting):
+        state = playback_state.get()
+        if not state.playing:
+            break
+
+        gesture, tag = player.current
+        if tag != playing_tag:
+            # a queued / crossfaded library gesture took over; frame indices start over
+            playing_tag = tag
+            last_i = -1
+
+        # frames passed since the previous tick (several if it ran late, wrapping on loop)
+        if i >= last_i:
+            passed = [(last_i + 1, i + 1)]
+        else:
+            passed = [(last_i + 1, len(gesture)), (0, i + 1)]
+        last_i = i
+
+        editing, playing, goals = [], [], []
+        for m, pos in zip(motors, positions):
+            if m.ID in state.editing_ids:
+                editing.append(m)
+                last_sent.pop(m.ID, None)
+            elif last_sent.get(m.ID) != pos:
+                playing.append(m)
+                goals.append(pos)
+                last_sent[m.ID] = pos
+
+        # read current positions of the motors being edited, in one bus transaction
+        if editing:
+            with port_lock:
+                edited_positions = sync_read_positions(editing)
+            for m, pos in zip(editing, edited_positions):
+                for start, stop in passed:
+                    if stop > start:
+                        edit_ring.push(start, stop, m.ID, pos)
+
+        # regular playback: all changed goal positions in one bus transaction
+        if playing:
+            with port_lock:
+                sync_moveto(playing, goals)
 
-    i = 0  # frame index
-
-    while True:
-        with state_lock:
-            if not playback_on:
-                break
-            if i >= len(recorded_frames):
-                # if len(editing_group) > 0:
-                #     # We can either break here (stop playback entirely), or just stop the editing mode.
-                #     # stop_edit_group()
-                #     print("Editing should not exceed original length of recording. Stopping playback and editing...")
-                #     break
-                play_ting()  # play short "ting" to signal iteration
-                i = 0 
-
-            if len(recorded_frames) == 0:
-                break
-
-            frame = recorded_frames[i]
-            current_editing_group = list(editing_group)
-
-        for m in motors:
-            if m in current_editing_group:
-                # read current position while editing
-                with port_lock:
-                    pos = m.read_position()
-                with state_lock:
-                    edited_frame = edited_frames.get(i, {})
-                    edited_frame[str(m.ID)] = pos
-                    edited_frames[i] = edited_frame
-            else:
-                # regular playback
-                with port_lock:
-                    # scale down velocity if human is editing
-                    # vel = 0.01 if len(current_editing_group) > 0 else None
-                    m.moveto(frame[str(m.ID)], convertToTick=False)
-
-        time.sleep(RECORD_DT)
-        i += 1
+    print(f"Playback timing: {player.stats.summary() if player.stats else 'n/a'}")
+    if edit_ring.n_dropped:
+        print(f"Edit buffer overflowed, {edit_ring.n_dropped} edits dropped")
 
+    stage_switched_gesture()
     with state_lock:
+        adopt_switched_gesture()  # so current_name matches what was played last
         playback_on = False
+        active_player = None
         editing_active = len(editing_group) > 0
+        publish_playback_state()
 
     if editing_active:
         stop_edit_group()
 
+    drain_stop.set()
+    drain_thread.join()
+    with state_lock:
+        edit_stack = None
+    staged_recordings.set({})
+
     print("Playback finished")
 
-def osc_play(unused_addr, *args):
-    global is_recording, playback_on, recorded_frames
-    with state_lock:
-        if is_recording or playback_on:
-            print("Recording/Playback in progress, skipping command. To execute command, run /stop first.")
-            return
-    print("User triggered playback")
+def load_recording(name):
+    """
+    Load the named library gesture (or the recording at save_path) into
+    recorded_frames. Returns False if it couldn't be read.
+    """
+    global recorded_frames, current_name
     try:
         with file_lock:
-            with open(save_path, "r") as f:
-                loaded = json.load(f)
+            # memory-mapped, copy-on-write so edits can be merged in before saving
+            if name:
+                loaded = library.load(name, writable=True)
+                path = library.path_for(name)
+            else:
+                path = save_path if os.path.exists(save_path) or not os.path.exists(legacy_save_path) else legacy_save_path
+                loaded = load_edited(path, writable=True)
         with state_lock:
             recorded_frames = loaded
-        print(f"Read recorded frames from {save_path}")
+            current_name = name
+        print(f"Read recorded frames from {path}")
+        return True
     except Exception as e:
         print(f"Error reading recorded frames: {e}")
+        return False
+
+def osc_play(unused_addr, *args):
+    with state_lock:
+        if is_recording or playback_on:
+            print("Recording/Playback in progress, skipping command. To execute command, run /stop first.")
+            return
+    name = str(args[0]) if args else None
+    print(f"User triggered playback{f' of {name}' if name else ''}")
+    if not load_recording(name):
         return
     
     # Run in a separate thread so the OSC server stays responsive
     threading.Thread(target=playback, daemon=True).start()
 
+# ======================
+#  BEAT-SYNCED PLAYBACK
+# ======================
+# /playBPM <bpm> [name] loops a gesture time-warped onto a beat clock (its
+# nods land on the beats, see gesture_warp); /tempo <bpm> changes the clock
+# while it plays. Editing is not available in this mode.
+beat_clock = None
+
+def synced_playback(bpm):
+    global is_recording, playback_on, beat_clock
+    with state_lock:
+        if len(recorded_frames) == 0:
+            print("Nothing recorded to play back")
+            return
+        gesture = recorded_frames
+        name = current_name
+    try:
+        peaks = gesture_peaks(gesture)
+        print(f"Recorded tempo {peaks_bpm(peaks):.1f} BPM ({len(peaks)} nods), playing at {bpm:.1f} BPM")
+    except ValueError as e:
+        print(f"Can't sync this gesture to a beat: {e}")
+        return
+
+    keyframes = library.keyframes(name) if name else compress_gesture(gesture)
+    player = GesturePlayer(keyframes, [m.ID for m in motors], RECORD_DT, tag=name)
+    with state_lock:
+        is_recording = False
+        playback_on = True
+        beat_clock = BeatClock(bpm)
+        clock = beat_clock
+        publish_playback_state()
+
+    last_sent = {}
+    for i, positions in beat_synced_ticks(player, clock, peaks):
+        if not playback_state.get().playing:
+            break
+        changed = [(m, pos) for m, pos in zip(motors, positions) if last_sent.get(m.ID) != pos]
+        if changed:
+            with port_lock:
+                sync_moveto([m for m, _ in changed], [pos for _, pos in changed])
+            last_sent.update((m.ID, pos) for m, pos in changed)
+
+    with state_lock:
+        playback_on = False
+        beat_clock = None
+        publish_playback_state()
+    print("Beat-synced playback finished")
+
+def osc_play_bpm(unused_addr, *args):
+    with state_lock:
+        if is_recording or playback_on:
+            print("Recording/Playback in progress, skipping command. To execute command, run /stop first.")
+            return
+    if not args:
+        print("Usage: /playBPM <bpm> [name]")
+        return
+    name = str(args[1]) if len(args) > 1 else None
+    if not load_recording(name):
+        return
+    threading.Thread(target=synced_playback, args=(float(args[0]),), daemon=True).start()
+
+def osc_tempo(unused_addr, *args):
+    with state_lock:
+        clock = beat_clock
+    if clock is None or not args:
+        print("Usage: /tempo <bpm> (during /playBPM)")
+        return
+    clock.set_bpm(float(args[0]))
+    print(f"Tempo set to {float(args[0]):.1f} BPM")
+
+def switch_gesture(args, crossfade):
+    """
+    /queue <name> and /crossfade <name> [seconds]: change what the running
+    playback plays next (starts playback if nothing is playing).
+    """
+    if not args:
+        print("Usage: /queue <name> or /crossfade <name> [seconds]")
+        return
+    name = str(args[0])
+    if name not in library:
+        print(f"No gesture named {name} (have: {library.names()})")
+        return
+    with state_lock:
+        player = active_player if playback_on else None
+        if player is not None and editing_group:
+            print("Editing in progress, skipping command. To execute command, run /stopEdit first.")
+            return
+    if player is None:
+        osc_play(None, name)
+        return
+    # loaded here, not when the playback loop hands over to it
+    try:
+        stage_recording(name)
+    except Exception as e:
+        print(f"Error reading {name}: {e}")
+        return
+    keyframes = library.keyframes(name)
+    if crossfade:
+        seconds = float(args[1]) if len(args) > 1 else CROSSFADE_S
+        player.crossfade_to(keyframes, seconds, tag=name)
+        print(f"Crossfading to {name} over {seconds:.1f}s")
+    else:
+        player.queue(keyframes, tag=name)
+        print(f"Queued {name}")
+
+def osc_queue(unused_addr, *args):
+    switch_gesture(args, crossfade=False)
+
+def osc_crossfade(unused_addr, *args):
+    switch_gesture(args, crossfade=True)
+
+def osc_list(unused_addr, *args):
+    for name in library.names():
+        info = library.info(name)
+        print(f"{name}: {info['duration_s']:.1f}s, motors {info['motor_ids']}, bpm {info['bpm']}")
+
 
 if __name__ == "__main__":
     dispatcher.map("/record", osc_record)
     dispatcher.map("/stop", osc_stop)
     dispatcher.map("/play", osc_play)
+    dispatcher.map("/queue", osc_queue)
+    dispatcher.map("/crossfade", osc_crossfade)
+    dispatcher.map("/list", osc_list)
+    dispatcher.map("/playBPM", osc_play_bpm)
+    dispatcher.map("/tempo", osc_tempo)
 
     dispatcher.map("/editNeck", osc_edit_neck)
     dispatcher.map("/editHead", osc_edit_head)
     dispatcher.map("/stopEdit", osc_stop_edit)
+    dispatcher.map("/undo", osc_undo)
 
     # server = BlockingOSCUDPServer(("127.0.0.1", 9000), dispatcher)
 
+    # a take that was interrupted by a crash is still in its log
+    recover_pending(save_path, resample_dt=RECORD_DT if RESAMPLE_ON_SAVE else None)
+    for log_file in os.listdir(library.root):
+        if log_file.endswith(EXTENSION + LOG_SUFFIX):
+            name = log_file[:-len(EXTENSION + LOG_SUFFIX)]
+            recover_pending(library.path_for(name), resample_dt=RECORD_DT if RESAMPLE_ON_SAVE else None)
+            library.register(name)
+    # keyframes of every named gesture in memory, so switching on stage is instant
+    library.preload()
+
     NeckTilt.initmotor()
     HeadTurn.initmotor()
 
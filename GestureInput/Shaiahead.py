@@ -1,12 +1,14 @@
-import json
 import os
 import threading
 import time
 
-from utils.Dynamixelutils import dynamixel
+from utils.Dynamixelutils import dynamixel, sync_moveto
 from dynamixel_sdk import *                    # Uses Dynamixel SDK library
 from pythonosc.dispatcher import Dispatcher
 from pythonosc.osc_server import BlockingOSCUDPServer
+from GestureInput.gesture_compress import compress_gesture
+from GestureInput.gesture_format import load_gesture, save_gesture
+from GestureInput.gesture_player import GesturePlayer
 
 dispatcher = Dispatcher()
 
@@ -104,7 +106,7 @@ recorded_frames = []
 # OSC control
 playback_on = False  # disable OSC during playback
 snapshots_before_record = {}
-save_path = "GestureInput/recorded_frames.json"
+save_path = "GestureInput/recorded_frames.gest"
 
 def enter_record_mode():
     print(f"Moving to neutral position...")
@@ -137,8 +139,7 @@ def exit_record_mode():
     snapshots_before_record.clear()
     print(f"Restored all motors to settings before the record.")
     try:
-        with open(save_path, "w") as f:
-            json.dump(recorded_frames, f, indent=2)
+        save_gesture(save_path, recorded_frames, record_dt=RECORD_DT)
         print(f"Saved recorded frames to {os.path.abspath(save_path)}")
     except Exception as e:
         print(f"Error saving recorded frames: {e}")
@@ -165,13 +166,18 @@ def playback():
     is_recording = False
     playback_on = True  # stop OSC from moving motors
 
-    for i, frame in enumerate(recorded_frames):
+    # streams keyframes on the recorded timestamps; each output frame is one
+    # sync write of the motors whose goal changed
+    player = GesturePlayer(compress_gesture(recorded_frames), [m.ID for m in motors], RECORD_DT)
+    last_sent = {}
+    for i, positions in player.ticks():
         if not playback_on:
             print("Playback stopped by user.")
             break
-        for m in motors:
-            m.moveto(frame[str(m.ID)], convertToTick=False)
-        time.sleep(RECORD_DT)
+        changed = [(m, pos) for m, pos in zip(motors, positions) if last_sent.get(m.ID) != pos]
+        if changed:
+            sync_moveto([m for m, _ in changed], [pos for _, pos in changed])
+            last_sent.update((m.ID, pos) for m, pos in changed)
 
     playback_on = False
     print("Playback finished")
@@ -201,8 +207,7 @@ def osc_play(unused_addr, *args):
         return
     print("User triggered playback")
     try:
-        with open(save_path, "r") as f:
-            recorded_frames = json.load(f)
+        recorded_frames = load_gesture(save_path)
         print(f"Read recorded frames from {save_path}")
     except Exception as e:
         print(f"Error reading recorded frames: {e}")
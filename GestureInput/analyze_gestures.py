@@ -0,0 +1,101 @@
+"""
+Batch tempo analysis of recorded gestures.
+
+Analyses every recording under the given directories (one file per worker
+process) with GestureAnalysis.analyze_file, journaled edits applied, and
+prints a summary table.
+
+Usage (from the repo root):
+    python -m GestureInput.analyze_gestures [dirs or files...]   # defaults to GestureInput/
+    python -m GestureInput.analyze_gestures GestureInput/library --motor 11 --workers 4
+"""
+import argparse
+import multiprocessing
+import os
+import time
+import traceback
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from GestureInput.GestureAnalysis import DEFAULT_MOTOR, analyze_file
+from GestureInput.gesture_format import EXTENSION
+
+
+def find_recordings(paths):
+    files = []
+    for path in paths:
+        if os.path.isfile(path):
+            files.append(path)
+            continue
+        for dirpath, _, names in os.walk(path):
+            for name in names:
+                if name.endswith(EXTENSION):
+                    files.append(os.path.join(dirpath, name))
+    return sorted(set(files))
+
+
+def summarize(path, motor_id=DEFAULT_MOTOR):
+    """
+    Analysis summary of one recording (no arrays, so it is cheap to send back
+    from a worker). Returns (path, summary, error).
+    """
+    t0 = time.perf_counter()
+    try:
+        analysis = analyze_file(path, motor_id)
+    except Exception:
+        return path, None, traceback.format_exc(limit=3)
+    bpms = analysis["bpm_values"]
+    return path, {
+        "duration_s": analysis["duration_s"],
+        "n_frames": analysis["n_frames"],
+        "fs": analysis["fs"],
+        "n_segments": len(bpms),
+        "mean_bpm": analysis["mean_bpm"],
+        "min_bpm": float(bpms.min()) if len(bpms) else None,
+        "max_bpm": float(bpms.max()) if len(bpms) else None,
+        "seconds": time.perf_counter() - t0,
+    }, None
+
+
+def print_table(results, wall_s):
+    def fmt(value):
+        return f"{value:6.1f}" if value is not None else f"{'-':>6}"
+
+    print(f"{'recording':<44} {'dur (s)':>8} {'frames':>8} {'Hz':>6} {'segs':>5} "
+          f"{'bpm':>6} {'min':>6} {'max':>6} {'time':>7}")
+    for path, summary, error in results:
+        if error is not None:
+            print(f"{path:<44} FAILED: {error.strip().splitlines()[-1]}")
+            continue
+        print(f"{path:<44} {summary['duration_s']:8.1f} {summary['n_frames']:8d} {summary['fs']:6.1f} "
+              f"{summary['n_segments']:5d} {fmt(summary['mean_bpm'])} {fmt(summary['min_bpm'])} "
+              f"{fmt(summary['max_bpm'])} {summary['seconds']:6.2f}s")
+    n_failed = sum(error is not None for _, _, error in results)
+    print(f"{len(results)} recordings in {wall_s:.2f}s" + (f", {n_failed} failed" if n_failed else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tempo analysis of a folder of gesture recordings.")
+    parser.add_argument("paths", nargs="*", default=["GestureInput"], help="recordings or directories to scan")
+    parser.add_argument("--motor", default=DEFAULT_MOTOR, help="motor ID to analyse (default: HeadTilt)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="recordings analysed at once")
+    args = parser.parse_args()
+
+    files = find_recordings(args.paths)
+    if not files:
+        print(f"No {EXTENSION} recordings found under {args.paths}")
+        return
+
+    t0 = time.perf_counter()
+    workers = max(1, min(args.workers, len(files)))
+    if workers == 1:
+        results = [summarize(path, args.motor) for path in files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [pool.submit(summarize, path, args.motor) for path in files]
+            results = sorted((f.result() for f in as_completed(futures)), key=lambda r: r[0])
+    print_table(results, time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    main()
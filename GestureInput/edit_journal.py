@@ -0,0 +1,220 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from GestureInput.gesture_format import load_gesture, save_gesture
+
+# ===========================
+#   Edit Journal
+# ===========================
+# Saving an editing pass appends only what it changed to a journal next to
+# the recording (<recording>.edits) instead of rewriting the recording:
+#
+#   header    <4s H H Q>  magic, version, n_motors, n_frames of the recording
+#   motor ids int32[n_motors]
+#   records   <B 3x I Q> kind, n_runs, n_values
+#             runs   {int32 motor_id, int64 start, int64 stop}[n_runs]
+#             values int32[n_values]   positions of frames start..stop, run after run
+#             crc32 of the record (uint32)
+#
+# A PASS record holds the edited runs of one pass; an UNDO record cancels the
+# latest pass that is still in effect. Loading a recording (load_edited)
+# replays the passes over the base file, so undo is just another append. A
+# torn record at the end (crash while appending) fails its CRC and is
+# dropped. Once the journal holds COMPACT_PASSES passes or COMPACT_RATIO of
+# the recording's size, compact() writes the edited recording with
+# save_gesture (atomic rename) and deletes the journal; passes before a
+# compaction can no longer be undone.
+
+JOURNAL_SUFFIX = ".edits"
+JOURNAL_MAGIC = b"SHGE"
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct("<4sHHQ")
+RECORD_HEADER = struct.Struct("<B3xIQ")
+RECORD_CRC = struct.Struct("<I")
+RUN_DTYPE = np.dtype([("motor_id", "<i4"), ("start", "<i8"), ("stop", "<i8")])
+PASS, UNDO = 1, 2
+COMPACT_PASSES = 16
+COMPACT_RATIO = 0.25
+
+
+def journal_path_for(gesture_path):
+    return gesture_path + JOURNAL_SUFFIX
+
+
+def discard_journal(gesture_path):
+    """
+    Drop the edits of a recording that was replaced (e.g. by a new take).
+    """
+    path = journal_path_for(gesture_path)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def layer_runs(layers, motor_ids):
+    """
+    Runs (RUN_DTYPE) and values of the frames edited by a list of EditLayers,
+    later layers winning where they overlap.
+    """
+    n_motors = len(motor_ids)
+    if not layers:
+        return np.zeros(0, dtype=RUN_DTYPE), np.zeros(0, dtype=np.int32)
+    mask = np.logical_or.reduce([layer.mask for layer in layers])
+    values = np.zeros(mask.shape, dtype=np.int32)
+    for layer in layers:
+        np.copyto(values, layer.values, where=layer.mask)
+    runs, chunks = [], []
+    for row in range(n_motors):
+        edges = np.diff(np.concatenate([[0], mask[row].astype(np.int8), [0]]))
+        for start, stop in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+            runs.append((int(motor_ids[row]), start, stop))
+            chunks.append(values[row, start:stop])
+    values = np.concatenate(chunks) if chunks else np.zeros(0, dtype=np.int32)
+    return np.array(runs, dtype=RUN_DTYPE), values
+
+
+class EditJournal:
+    """
+    The edit passes saved for one recording.
+
+        journal = EditJournal(path)
+        journal.append_pass(edit_stack.layers, gesture)   # before edit_stack.merge()
+        journal.undo()
+        if journal.needs_compaction():
+            journal.compact(gesture)                       # gesture with the edits applied
+    """
+
+    def __init__(self, gesture_path):
+        self.gesture_path = gesture_path
+        self.path = journal_path_for(gesture_path)
+        self.motor_ids = None
+        self.n_frames = None
+        self.passes = []  # (runs, values) of every pass still in effect
+        self._end = 0  # end of the last intact record
+        if os.path.exists(self.path):
+            self._read()
+
+    def _read(self):
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if len(data) < JOURNAL_HEADER.size:
+            return
+        magic, version, n_motors, n_frames = JOURNAL_HEADER.unpack_from(data)
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION:
+            raise ValueError(f"{self.path} is not a gesture edit journal")
+        offset = JOURNAL_HEADER.size + 4 * n_motors
+        if len(data) < offset:
+            return
+        self.motor_ids = np.frombuffer(data, dtype="<i4", count=n_motors, offset=JOURNAL_HEADER.size).tolist()
+        self.n_frames = n_frames
+        self._end = offset
+        while offset + RECORD_HEADER.size <= len(data):
+            kind, n_runs, n_values = RECORD_HEADER.unpack_from(data, offset)
+            body = RECORD_HEADER.size + RUN_DTYPE.itemsize * n_runs + 4 * n_values
+            end = offset + body + RECORD_CRC.size
+            if end > len(data) or RECORD_CRC.unpack_from(data, offset + body)[0] != zlib.crc32(data[offset:offset + body]):
+                break  # torn or corrupt tail
+            if kind == PASS:
+                runs_offset = offset + RECORD_HEADER.size
+                runs = np.frombuffer(data, dtype=RUN_DTYPE, count=n_runs, offset=runs_offset)
+                values = np.frombuffer(data, dtype="<i4", count=n_values, offset=runs_offset + runs.nbytes)
+                self.passes.append((runs, values))
+            elif kind == UNDO and self.passes:
+                self.passes.pop()
+            offset = self._end = end
+
+    def matches(self, gesture):
+        return self.motor_ids == [int(m) for m in gesture.motor_ids] and self.n_frames == len(gesture)
+
+    @property
+    def size_bytes(self):
+        return self._end
+
+    def _append(self, kind, runs, values, gesture=None):
+        record = RECORD_HEADER.pack(kind, len(runs), len(values)) + runs.tobytes() + values.astype("<i4").tobytes()
+        record += RECORD_CRC.pack(zlib.crc32(record))
+        mode = "r+b" if os.path.exists(self.path) and self._end else "wb"
+        with open(self.path, mode) as f:
+            if mode == "wb":
+                motor_ids = [int(m) for m in gesture.motor_ids]
+                f.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, len(motor_ids), len(gesture)))
+                f.write(np.asarray(motor_ids, dtype="<i4").tobytes())
+                self.motor_ids, self.n_frames = motor_ids, len(gesture)
+                self._end = f.tell()
+            f.seek(self._end)
+            f.write(record)
+            f.truncate()  # anything after the last intact record
+            f.flush()
+            os.fsync(f.fileno())
+            self._end = f.tell()
+        return len(record)
+
+    def append_pass(self, layers, gesture):
+        """
+        Save the edits of a pass (a list of EditLayers over gesture). Only the
+        edited runs are written. Returns the number of bytes appended.
+        """
+        if self.motor_ids is not None and not self.matches(gesture):
+            raise ValueError(f"{self.path} belongs to a different recording")
+        runs, values = layer_runs(layers, gesture.motor_ids)
+        if len(runs) == 0:
+            return 0
+        n_bytes = self._append(PASS, runs, values, gesture)
+        self.passes.append((runs, values))
+        return n_bytes
+
+    def undo(self):
+        """
+        Cancel the latest saved pass. Returns False if there is none.
+        """
+        if not self.passes:
+            return False
+        self._append(UNDO, np.zeros(0, dtype=RUN_DTYPE), np.zeros(0, dtype=np.int32))
+        self.passes.pop()
+        return True
+
+    def apply(self, gesture):
+        """
+        Replay the passes into gesture.positions (in place, must be writable).
+        """
+        rows = {int(m): j for j, m in enumerate(gesture.motor_ids)}
+        for runs, values in self.passes:
+            offset = 0
+            for motor_id, start, stop in runs.tolist():
+                gesture.positions[rows[motor_id], start:stop] = values[offset:offset + stop - start]
+                offset += stop - start
+
+    def needs_compaction(self):
+        if not self.passes:
+            return False
+        base_bytes = os.path.getsize(self.gesture_path) if os.path.exists(self.gesture_path) else 0
+        return len(self.passes) >= COMPACT_PASSES or self.size_bytes > COMPACT_RATIO * base_bytes
+
+    def compact(self, gesture, record_dt=None):
+        """
+        Write gesture (the recording with every pass applied) over the base
+        file and drop the journal.
+        """
+        save_gesture(self.gesture_path, gesture, record_dt)
+        discard_journal(self.gesture_path)
+        self.motor_ids = self.n_frames = None
+        self.passes = []
+        self._end = 0
+
+
+def load_edited(gesture_path, writable=False):
+    """
+    load_gesture with the journaled edits applied. The positions are then a
+    copy-on-write mapping of the base file, whatever writable says.
+    """
+    journal = EditJournal(gesture_path) if not gesture_path.endswith(".json") else None
+    if journal is None or not journal.passes:
+        return load_gesture(gesture_path, writable)
+    gesture = load_gesture(gesture_path, writable=True)
+    if not journal.matches(gesture):
+        print(f"Ignoring {journal.path}: it was saved for a different recording")
+        return gesture
+    journal.apply(gesture)
+    return gesture
@@ -0,0 +1,102 @@
+import numpy as np
+
+from GestureInput.gesture_format import Gesture
+
+# ===========================
+#   Edit Layers
+# ===========================
+# Live edits are written into preallocated overlay arrays instead of a dict
+# per frame. A layer has the recording's layout (one row per motor, one
+# column per frame) plus a boolean mask of what was edited, so recording an
+# edit is a slice assignment and merging is a single masked copy.
+# Every editing pass gets its own layer; layers apply in order, so a later
+# pass overrides an earlier one where both touched the same frames.
+
+
+class EditLayer:
+    """
+    Overlay of edited positions for one editing pass.
+    """
+
+    def __init__(self, motor_ids, n_frames):
+        self.motor_ids = [int(m) for m in motor_ids]
+        self._row = {m: j for j, m in enumerate(self.motor_ids)}
+        self.values = np.zeros((len(self.motor_ids), n_frames), dtype=np.int32)
+        self.mask = np.zeros((len(self.motor_ids), n_frames), dtype=bool)
+
+    def set(self, motor_id, frames, position):
+        """
+        Set motor_id to position on frames (an index, slice or index array).
+        """
+        row = self._row[int(motor_id)]
+        self.values[row, frames] = position
+        self.mask[row, frames] = True
+
+    @property
+    def n_edited_frames(self):
+        return int(np.count_nonzero(self.mask.any(axis=0)))
+
+    def apply(self, positions):
+        """
+        Write the edited positions into positions (shape (n_motors, n_frames)) in place.
+        """
+        np.copyto(positions, self.values, where=self.mask)
+
+
+class EditStack:
+    """
+    Editing passes over one Gesture.
+
+        stack = EditStack(recorded_frames)
+        stack.open_layer().set(11, slice(100, 103), 512)   # while editing
+        stack.close_layer()                                  # pass finished
+        stack.merge()                                        # into the gesture
+    """
+
+    def __init__(self, gesture):
+        self.gesture = gesture
+        self.layers = []
+        self._open = None
+
+    def open_layer(self):
+        """
+        The layer of the current editing pass (started on first use).
+        """
+        if self._open is None:
+            self._open = EditLayer(self.gesture.motor_ids, len(self.gesture))
+            self.layers.append(self._open)
+        return self._open
+
+    def close_layer(self):
+        self._open = None
+
+    def undo(self):
+        """
+        Drop the most recent layer that hasn't been merged yet.
+        """
+        if self.layers:
+            if self.layers.pop() is self._open:
+                self._open = None
+
+    def composite(self):
+        """
+        The gesture with all layers applied, as a new Gesture (the original is untouched).
+        """
+        positions = np.array(self.gesture.positions, dtype=np.int32)
+        for layer in self.layers:
+            layer.apply(positions)
+        return Gesture(self.gesture.motor_ids, self.gesture.t, positions, self.gesture.record_dt)
+
+    def merge(self):
+        """
+        Apply all layers to the gesture in place (it must be writable) and
+        clear them. Returns the number of frames that changed.
+        """
+        n_edited = 0
+        if self.layers:
+            n_edited = int(np.count_nonzero(np.logical_or.reduce([layer.mask for layer in self.layers]).any(axis=0)))
+        for layer in self.layers:
+            layer.apply(self.gesture.positions)
+        self.layers = []
+        self._open = None
+        return n_edited
@@ -0,0 +1,189 @@
+import argparse
+import json
+import math
+import os
+import uuid
+
+import numpy as np
+
+from GestureInput.GestureAnalysis import DEFAULT_MOTOR
+from GestureInput.gesture_compress import rdp_keyframes
+from GestureInput.gesture_format import load_gesture
+from GestureInput.gesture_warp import PEAK_EPS, _interp_extrap, gesture_peaks, peaks_bpm
+
+# ===========================
+#   Gesture -> Dance Mode
+# ===========================
+# Dance modes (Dance/danceModes.json) are sparse beat-relative events:
+#
+#   {"motor": "HeadTilt", "startBeat": 0.5, "periodBeat": 4, "position": 0.8, "velocity": 0.03}
+#
+# i.e. every periodBeat beats from startBeat, send the motor towards position
+# (0-1 of its dance range) at a profile velocity. compile_gesture() turns a
+# dense recording into such a mode:
+#
+#   1. the peaks of the beat motor (gesture_warp; HeadTilt, the nodding motor,
+#      when recorded) are the beats: peak j is beat j
+#   2. loop_beats beats from the first peak are cut out as one loop
+#   3. each motor's track on that beat axis is reduced to RDP keyframes
+#      within `tolerance` ticks, snapped to a 1/SUBDIVISION beat grid
+#   4. every keyframe becomes an event that heads for the next keyframe's
+#      position with the velocity that gets there on time at the recorded tempo
+#
+# schedule_dance_moves repeats the events every loop_beats beats, so the
+# compiled mode is used like a hand-written one.
+
+# dance range of each motor in degrees, position 0 -> first, 1 -> second
+# (keep in sync with the move* handlers in Dance/dance.py)
+MOTOR_RANGES = {
+    "HeadTurn": (100, 260),
+    "HeadTilt": (140, 64),
+    "Mouth": (341, 320),
+    "NeckTilt": (156, 210),
+    "NeckTurn": (85, 193),
+}
+MOTOR_NAMES = {"10": "HeadTurn", "11": "HeadTilt", "12": "Mouth", "13": "NeckTilt", "14": "NeckTurn"}
+SKIP_MOTORS = ("Mouth",)  # lip sync drives the mouth while dancing
+
+COMPILE_TOLERANCE = 15.0  # ticks
+SUBDIVISION = 8  # grid steps per beat
+MAX_LOOP_BEATS = 8
+# Dynamixel profile velocity: set_vel writes velocity * 2047 in units of 0.229 rpm
+TICKS_PER_S_PER_VELOCITY = 2047 * 0.229 * 4096 / 60
+# 0 would mean "as fast as possible". dance.py scales velocities down to 0.3
+# while lip syncing, so the floor matches the slowest hand-written move
+# (danceModes.json) and still writes at least 1 raw unit after scaling.
+MIN_VELOCITY = 0.005
+DANCE_MODES_PATH = "Dance/danceModes.json"
+
+
+def ticks_to_position(ticks, motor):
+    """
+    Ticks -> 0-1 of the motor's dance range (clipped).
+    """
+    lo, hi = MOTOR_RANGES[motor]
+    degrees = np.asarray(ticks, dtype=np.float64) * 360 / 4095
+    return np.clip((degrees - lo) / (hi - lo), 0.0, 1.0)
+
+
+def velocity_for(ticks, seconds):
+    """
+    Profile velocity (as passed to dynamixel.moveto) that covers ticks in seconds.
+    """
+    if seconds <= 0:
+        return 1.0
+    return float(min(max(abs(ticks) / seconds / TICKS_PER_S_PER_VELOCITY, MIN_VELOCITY), 1.0))
+
+
+def _loop_length(n_beats, loop_beats):
+    if loop_beats is None:
+        loop_beats = 2 ** int(math.log2(min(n_beats, MAX_LOOP_BEATS)))
+    if loop_beats > n_beats:
+        raise ValueError(f"Recording has {n_beats} beats, can't compile a {loop_beats}-beat loop")
+    return loop_beats
+
+
+def fit_motor(beats, x, loop_beats, tolerance=COMPILE_TOLERANCE, subdivision=SUBDIVISION):
+    """
+    Keyframes (beats, ticks) of one motor over [0, loop_beats], snapped to the
+    beat grid. Both ends are always kept so the loop closes.
+    """
+    keep = rdp_keyframes(beats, x, tolerance)
+    grid = np.unique(np.concatenate([[0.0], np.round(beats[keep] * subdivision) / subdivision, [loop_beats]]))
+    grid = grid[(grid >= 0) & (grid <= loop_beats)]
+    return grid, np.interp(grid, beats, x)
+
+
+def compile_gesture(gesture, loop_beats=None, motor_id=None, tolerance=COMPILE_TOLERANCE,
+                    subdivision=SUBDIVISION, energy=0.5, position_eps=PEAK_EPS):
+    """
+    A DANCE_MODES entry for a recorded Gesture (see the notes above).
+    motor_id picks the beat motor (default: HeadTilt, else the one moving most).
+    """
+    if motor_id is None and DEFAULT_MOTOR in [str(m) for m in gesture.motor_ids]:
+        motor_id = DEFAULT_MOTOR
+    peaks = gesture_peaks(gesture, motor_id, position_eps)
+    bpm = peaks_bpm(peaks)
+    loop_beats = _loop_length(len(peaks) - 1, loop_beats)
+    t = np.asarray(gesture.t, dtype=np.float64)
+    beats = _interp_extrap(t - t[0], peaks, np.arange(len(peaks), dtype=np.float64))
+    in_loop = (beats >= 0) & (beats <= loop_beats)
+    beat_s = 60.0 / bpm
+
+    moves = []
+    for m in gesture.motor_ids:
+        motor = MOTOR_NAMES.get(str(m))
+        if motor is None or motor in SKIP_MOTORS:
+            continue
+        x = np.asarray(gesture.column(m), dtype=np.float64)
+        # add the exact loop ends so the keyframes don't depend on where samples fall
+        loop_b = np.concatenate([[0.0], beats[in_loop], [float(loop_beats)]])
+        loop_x = np.interp(loop_b, beats, x)
+        if np.ptp(loop_x) <= tolerance:
+            continue  # motor holds still in this loop
+        grid, ticks = fit_motor(loop_b, loop_x, loop_beats, tolerance, subdivision)
+        positions = ticks_to_position(ticks, motor)
+        for j in range(len(grid) - 1):
+            moves.append({
+                "motor": motor,
+                "startBeat": round(float(grid[j]), 4),
+                "periodBeat": loop_beats,
+                "position": round(float(positions[j + 1]), 3),
+                "velocity": round(velocity_for(ticks[j + 1] - ticks[j], (grid[j + 1] - grid[j]) * beat_s), 4),
+            })
+    moves.sort(key=lambda e: (e["startBeat"], e["motor"]))
+    # an octave around the recorded tempo, so normalize_bpm can always fold a song into it
+    return {
+        "energy": energy,
+        "bpm_min": round(bpm / math.sqrt(2)),
+        "bpm_max": round(bpm * math.sqrt(2)),
+        "moves": moves,
+    }
+
+
+def add_dance_mode(name, mode, path=DANCE_MODES_PATH):
+    """
+    Add (or replace) a mode in danceModes.json, written atomically.
+    """
+    with open(path, "r") as f:
+        modes = json.load(f)
+    modes[name] = mode
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "w") as f:
+            json.dump(modes, f, indent=4)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile a recorded gesture into a beat-relative dance mode.")
+    parser.add_argument("recording", help="recording (.gest) or the name of a library gesture")
+    parser.add_argument("--name", help="mode name (default: the recording's name)")
+    parser.add_argument("--beats", type=int, help=f"loop length in beats (default: up to {MAX_LOOP_BEATS})")
+    parser.add_argument("--motor", help="beat motor ID (default: HeadTilt)")
+    parser.add_argument("--tolerance", type=float, default=COMPILE_TOLERANCE, help="max fit error in ticks")
+    parser.add_argument("--energy", type=float, default=0.5, help="energy value of the mode (0-1)")
+    parser.add_argument("--write", action="store_true", help=f"add the mode to {DANCE_MODES_PATH}")
+    args = parser.parse_args()
+
+    if os.path.isfile(args.recording):
+        gesture = load_gesture(args.recording)
+    else:
+        from GestureInput.gesture_library import GestureLibrary
+        gesture = GestureLibrary().load(args.recording)
+    name = args.name or os.path.splitext(os.path.basename(args.recording))[0]
+    mode = compile_gesture(gesture, args.beats, args.motor, args.tolerance, energy=args.energy)
+    print(json.dumps({name: mode}, indent=4))
+    n_samples = len(gesture) * len(gesture.motor_ids)
+    print(f"{n_samples} samples -> {len(mode['moves'])} events "
+          f"({mode['bpm_min']}-{mode['bpm_max']} BPM, {mode['moves'][0]['periodBeat'] if mode['moves'] else 0}-beat loop)")
+    if args.write:
+        add_dance_mode(name, mode)
+        print(f"Added '{name}' to {DANCE_MODES_PATH}")
+
+
+if __name__ == "__main__":
+    main()
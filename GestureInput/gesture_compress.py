@@ -0,0 +1,217 @@
+import os
+import sys
+import time
+import uuid
+
+import numpy as np
+
+from GestureInput.gesture_format import Gesture, load_gesture
+
+# ===========================
+#   Keyframe Compression
+# ===========================
+# Most of a 200 Hz recording is redundant: a slow nod moves less than a tick
+# per sample. Each motor's track is reduced independently to the keyframes
+# that Ramer-Douglas-Peucker keeps, so that linear interpolation between
+# keyframes stays within `tolerance` ticks of every recorded sample.
+# Playback interpolates linearly anyway (see gesture_player), so the
+# keyframes play back the same motion.
+#
+# Keyframe files (KEYFRAME_EXTENSION) are .npz archives holding motor_ids,
+# record_dt, n_frames, tolerance and per motor t_<id> / x_<id> (t relative
+# to the start of the recording). Recordings that are not on a uniform
+# record_dt grid (legacy .json takes, takes saved without resampling) also
+# keep frame_t, the time of every recorded frame, so edits made during
+# playback land on the right frames.
+
+KEYFRAME_EXTENSION = ".gestk"
+COMPRESS_TOLERANCE = 1.0  # ticks
+GRID_TOLERANCE_S = 1e-6  # frames this close to i * record_dt count as on the grid
+
+
+def rdp_keyframes(t, x, tolerance=COMPRESS_TOLERANCE):
+    """
+    Indices of the samples Ramer-Douglas-Peucker keeps for the track x(t).
+    The error is measured vertically (in ticks), against linear interpolation.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    x = np.asarray(x, dtype=np.float64)
+    n = len(x)
+    if n <= 2:
+        return np.arange(n)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        a, b = stack.pop()
+        if b - a < 2:
+            continue
+        seg_t = t[a + 1:b]
+        if t[b] > t[a]:
+            line = x[a] + (seg_t - t[a]) * ((x[b] - x[a]) / (t[b] - t[a]))
+        else:
+            line = np.full(len(seg_t), x[a])
+        err = np.abs(x[a + 1:b] - line)
+        j = int(np.argmax(err))
+        if err[j] > tolerance:
+            mid = a + 1 + j
+            keep[mid] = True
+            stack.append((a, mid))
+            stack.append((mid, b))
+    return np.flatnonzero(keep)
+
+
+class KeyframeGesture:
+    """
+    A gesture stored as per-motor keyframes: tracks[motor_id] = (t, x),
+    t in seconds from the start of the recording.
+    """
+
+    def __init__(self, motor_ids, tracks, n_frames, record_dt, tolerance=COMPRESS_TOLERANCE, frame_t=None):
+        self.motor_ids = [int(m) for m in motor_ids]
+        self.tracks = {int(m): (np.asarray(t, dtype=np.float64), np.asarray(x, dtype=np.float64))
+                       for m, (t, x) in tracks.items()}
+        self.n_frames = n_frames
+        self.record_dt = record_dt
+        self.tolerance = tolerance
+        # None when the recording is on the uniform record_dt grid
+        self.frame_t = None if frame_t is None else np.asarray(frame_t, dtype=np.float64)
+
+    def __len__(self):
+        return self.n_frames
+
+    @property
+    def duration_s(self):
+        return max((float(t[-1]) for t, _ in self.tracks.values() if len(t)), default=0.0)
+
+    @property
+    def n_keyframes(self):
+        return sum(len(t) for t, _ in self.tracks.values())
+
+    @property
+    def nbytes(self):
+        frame_bytes = 0 if self.frame_t is None else self.frame_t.nbytes
+        return frame_bytes + sum(t.nbytes + x.nbytes for t, x in self.tracks.values())
+
+    def frame_index(self, time_s):
+        """
+        Index of the recorded frame at or before time_s.
+        """
+        if self.frame_t is not None:
+            i = int(np.searchsorted(self.frame_t, time_s + 1e-9, side="right")) - 1
+        elif self.record_dt:
+            i = int(time_s / self.record_dt + 1e-9)
+        else:
+            return 0
+        return min(max(i, 0), self.n_frames - 1)
+
+    def sample(self, time_s, motor_ids=None):
+        """
+        Interpolated positions (float ticks) at time_s, in the order of motor_ids.
+        """
+        motor_ids = self.motor_ids if motor_ids is None else motor_ids
+        return np.array([np.interp(time_s, *self.tracks[int(m)]) for m in motor_ids])
+
+    def decompress(self, t=None):
+        """
+        Back to a Gesture sampled at t (seconds from the start; defaults to
+        the original record_dt grid).
+        """
+        if t is None:
+            t = self.frame_t if self.frame_t is not None else np.arange(self.n_frames) * self.record_dt
+        positions = np.empty((len(self.motor_ids), len(t)), dtype=np.int32)
+        for j, m in enumerate(self.motor_ids):
+            positions[j] = np.rint(np.interp(t, *self.tracks[m]))
+        return Gesture(self.motor_ids, np.asarray(t, dtype=np.float64), positions, self.record_dt)
+
+
+def compress_gesture(gesture, tolerance=COMPRESS_TOLERANCE):
+    """
+    Reduce every motor track of a Gesture (or list of frame dicts) to keyframes
+    within tolerance ticks.
+    """
+    if not isinstance(gesture, Gesture):
+        gesture = Gesture.from_frames(gesture)
+    t = np.asarray(gesture.t, dtype=np.float64)
+    t = t - t[0] if len(t) else t
+    tracks = {}
+    for m in gesture.motor_ids:
+        x = np.asarray(gesture.column(m))
+        keep = rdp_keyframes(t, x, tolerance)
+        tracks[m] = (t[keep], x[keep])
+    return KeyframeGesture(gesture.motor_ids, tracks, len(gesture), gesture.record_dt, tolerance,
+                           frame_t=None if on_grid(t, gesture.record_dt) else t)
+
+
+def on_grid(t, record_dt):
+    """
+    True if frame i of t (seconds from the start) is at i * record_dt.
+    """
+    if not record_dt:
+        return len(t) <= 1
+    return bool(np.all(np.abs(t - np.arange(len(t)) * record_dt) <= GRID_TOLERANCE_S))
+
+
+def save_keyframes(path, keyframes):
+    """
+    Write a KeyframeGesture atomically (temp file + rename), like save_gesture.
+    """
+    arrays = {
+        "motor_ids": np.asarray(keyframes.motor_ids, dtype=np.int32),
+        "record_dt": np.float64(keyframes.record_dt),
+        "n_frames": np.int64(keyframes.n_frames),
+        "tolerance": np.float64(keyframes.tolerance),
+    }
+    for m, (t, x) in keyframes.tracks.items():
+        arrays[f"t_{m}"] = t
+        arrays[f"x_{m}"] = x.astype(np.int32)
+    if keyframes.frame_t is not None:
+        arrays["frame_t"] = keyframes.frame_t
+
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def load_keyframes(path):
+    with np.load(path) as data:
+        motor_ids = data["motor_ids"].tolist()
+        tracks = {m: (data[f"t_{m}"], data[f"x_{m}"]) for m in motor_ids}
+        return KeyframeGesture(motor_ids, tracks, int(data["n_frames"]),
+                               float(data["record_dt"]), float(data["tolerance"]),
+                               frame_t=data["frame_t"] if "frame_t" in data.files else None)
+
+
+def keyframe_path_for(path):
+    return os.path.splitext(path)[0] + KEYFRAME_EXTENSION
+
+
+if __name__ == "__main__":
+    # python -m GestureInput.gesture_compress recorded_frames.gest [more.gest ...] [--tolerance 1]
+    args = sys.argv[1:]
+    tolerance = COMPRESS_TOLERANCE
+    if "--tolerance" in args:
+        k = args.index("--tolerance")
+        tolerance = float(args[k + 1])
+        del args[k:k + 2]
+    if not args:
+        print("Usage: python -m GestureInput.gesture_compress <recording.gest> [...] [--tolerance TICKS]")
+        sys.exit(1)
+    for path in args:
+        gesture = load_gesture(path)
+        t0 = time.perf_counter()
+        keyframes = compress_gesture(gesture, tolerance)
+        seconds = time.perf_counter() - t0
+        out_path = keyframe_path_for(path)
+        save_keyframes(out_path, keyframes)
+        n_samples = len(gesture) * len(gesture.motor_ids)
+        print(f"{path}: {n_samples} samples -> {keyframes.n_keyframes} keyframes "
+              f"({n_samples / max(keyframes.n_keyframes, 1):.1f}x) in {seconds:.2f}s, "
+              f"{os.path.getsize(path) / 1e6:.2f} MB -> {os.path.getsize(out_path) / 1e6:.2f} MB ({out_path})")
@@ -0,0 +1,205 @@
+import argparse
+import math
+
+import numpy as np
+
+from GestureInput.GestureAnalysis import analyze_gesture
+from GestureInput.gesture_warp import beat_motor, gesture_peaks, peaks_bpm
+
+# ===========================
+#   Gesture Feature Index
+# ===========================
+# To pick a recorded gesture for a song section, every gesture in the library
+# gets a few features (extract_features, stored in the library index so they
+# are computed once per recording):
+#
+#   bpm       - duration-weighted tempo of the beat motor (infer_bpm_from_positions;
+#               its threshold is per sample, so slow moves recorded at a high
+#               rate fall back to the peaks of gesture_warp)
+#   amplitude - position range per motor (ticks)
+#   dominant  - motors moving at least DOMINANT_RATIO of the biggest range
+#   speed     - summed mean |velocity| over the motors (ticks/s)
+#   duration_s
+#
+# GestureIndex puts them in a KD-tree. Tempo is a point on a circle of
+# log2(bpm), so gestures at half / double time match too (the dance modes fold
+# BPM the same way, see normalize_bpm in Dance/dance.py).
+#
+# Energy is a rank on both sides: a gesture's is the rank of its speed within
+# the library, a section's the rank of its energy (mean onset strength, see
+# get_audio_sections) among the sections of its song, both 0 calmest ..
+# 1 busiest (energy_ranks). So the calmest section of a song asks for the
+# calmest gesture, whatever the absolute loudness of the song or speed of
+# the recordings.
+#
+# choose() only returns a gesture within MAX_TEMPO_RATIO (folded) and
+# MAX_ENERGY_DIFF of the section -- the nearest one can still be a poor
+# match. Those tolerances bound a radius query on the tree, so a lookup only
+# visits the gestures near the section and can run between sections on stage.
+
+DOMINANT_RATIO = 0.5
+ENERGY_WEIGHT = 1.0  # energy difference 1 ~ tempo off by 13%
+DEFAULT_ENERGY = 0.5  # for sections without an energy score
+MAX_TEMPO_RATIO = 0.10  # folded tempo within 10%
+MAX_ENERGY_DIFF = 0.35  # in ranks: about a third of the library away
+
+
+def extract_features(gesture):
+    """
+    Retrieval features of a Gesture, as a JSON-friendly dict.
+    """
+    motor_ids = [str(m) for m in gesture.motor_ids]
+    positions = np.asarray(gesture.positions, dtype=np.float64)
+    if len(gesture) > 1:
+        amplitude = np.ptp(positions, axis=1)
+        speed = float(np.abs(np.diff(positions, axis=1)).sum() / gesture.duration_s) if gesture.duration_s > 0 else 0.0
+    else:
+        amplitude = np.zeros(len(motor_ids))
+        speed = 0.0
+    order = np.argsort(-amplitude, kind="stable")
+    dominant = [motor_ids[i] for i in order if amplitude[i] > 0 and amplitude[i] >= DOMINANT_RATIO * amplitude[order[0]]]
+    bpm = None
+    if len(gesture) > 1:
+        motor_id = beat_motor(gesture)
+        bpm = analyze_gesture(gesture, motor_id)["mean_bpm"]
+        if bpm is None:
+            peaks = gesture_peaks(gesture, motor_id)
+            bpm = peaks_bpm(peaks) if len(peaks) >= 2 else None
+    return {
+        "bpm": bpm,
+        "amplitude": {m: float(a) for m, a in zip(motor_ids, amplitude)},
+        "dominant": dominant,
+        "speed": speed,
+        "duration_s": gesture.duration_s if len(gesture) > 1 else 0.0,
+    }
+
+
+def _tempo_point(bpm):
+    angle = 2 * math.pi * math.log2(bpm)
+    return math.cos(angle), math.sin(angle)
+
+
+def _folded_tempo_ratio(bpm, other):
+    # 0.0 for the same tempo or half / double time, 1.0 for a tritone of tempo
+    octaves = abs(math.log2(bpm / other)) % 1.0
+    return 2 ** min(octaves, 1.0 - octaves) - 1
+
+
+def energy_ranks(values):
+    """
+    Ranks of values scaled to 0 (lowest) .. 1 (highest); DEFAULT_ENERGY for
+    fewer than two. Used for gesture speeds and for section energies alike.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) < 2:
+        return np.full(len(values), DEFAULT_ENERGY)
+    return np.argsort(np.argsort(values, kind="stable"), kind="stable") / (len(values) - 1)
+
+
+class GestureIndex:
+    """
+    Nearest-neighbour search over gesture features.
+
+        index = GestureIndex.from_library(library)
+        energy = energy_ranks([section["energy"] for section in sections])
+        name = index.choose(section["bpm"], energy[i], exclude=[previous])
+
+    Gestures without a detectable tempo are left out.
+    """
+
+    def __init__(self, names, features, energy_weight=ENERGY_WEIGHT,
+                 max_tempo_ratio=MAX_TEMPO_RATIO, max_energy_diff=MAX_ENERGY_DIFF):
+        from sklearn.neighbors import KDTree
+
+        keep = [i for i, f in enumerate(features) if f.get("bpm")]
+        self.names = [names[i] for i in keep]
+        self.features = [features[i] for i in keep]
+        self.energy_weight = energy_weight
+        self.max_tempo_ratio = max_tempo_ratio
+        self.max_energy_diff = max_energy_diff
+        self.energy = energy_ranks([f["speed"] for f in self.features])
+        self._bpm = np.array([f["bpm"] for f in self.features], dtype=np.float64)
+        points = np.array([[*_tempo_point(f["bpm"]), energy_weight * e]
+                           for f, e in zip(self.features, self.energy)]).reshape(-1, 3)
+        self._tree = KDTree(points) if len(points) else None
+        self._positions = {name: i for i, name in enumerate(self.names)}
+        # tree distance of a gesture at both tolerances; nothing further can match
+        tempo_chord = 2 * math.sin(math.pi * math.log2(1 + max_tempo_ratio))
+        self._radius = math.hypot(tempo_chord, energy_weight * max_energy_diff)
+
+    @classmethod
+    def from_library(cls, library, names=None, **kwargs):
+        names = library.names() if names is None else list(names)
+        return cls(names, [library.features(name) for name in names], **kwargs)
+
+    def __len__(self):
+        return len(self.names)
+
+    def _point(self, bpm, energy):
+        energy = DEFAULT_ENERGY if energy is None else energy
+        return np.array([[*_tempo_point(bpm), self.energy_weight * energy]])
+
+    def query(self, bpm, energy=None, k=1):
+        """
+        The k closest gestures to a section as [(name, distance), ...], closest first.
+        energy is a rank (see energy_ranks).
+        """
+        if self._tree is None or not bpm or bpm <= 0:
+            return []
+        dist, idx = self._tree.query(self._point(bpm, energy), k=min(k, len(self.names)))
+        return [(self.names[i], float(d)) for d, i in zip(dist[0], idx[0])]
+
+    def _fits(self, i, bpm, energy):
+        energy = DEFAULT_ENERGY if energy is None else energy
+        return (_folded_tempo_ratio(bpm, self._bpm[i]) <= self.max_tempo_ratio
+                and abs(self.energy[i] - energy) <= self.max_energy_diff)
+
+    def matches(self, name, bpm, energy=None):
+        """
+        True when the gesture is within the tempo and energy tolerances of a section.
+        """
+        return self._fits(self._positions[name], bpm, energy)
+
+    def choose(self, bpm, energy=None, exclude=()):
+        """
+        Name of the best gesture for a section that is not in exclude (e.g.
+        the previous section's gesture), or None when none is within the
+        tolerances. energy is a rank (see energy_ranks).
+        """
+        if self._tree is None or not bpm or bpm <= 0:
+            return None
+        exclude = set(e for e in exclude if e is not None)
+        idx, dist = self._tree.query_radius(self._point(bpm, energy), self._radius,
+                                            return_distance=True, sort_results=True)
+        for i in idx[0]:
+            if self.names[i] not in exclude and self._fits(i, bpm, energy):
+                return self.names[i]
+        return None
+
+
+def main():
+    from GestureInput.gesture_library import LIBRARY_DIR, GestureLibrary
+
+    parser = argparse.ArgumentParser(description="Gesture features, and the best matches for a section.")
+    parser.add_argument("library", nargs="?", default=LIBRARY_DIR, help="gesture library directory")
+    parser.add_argument("--bpm", type=float, help="section BPM to match")
+    parser.add_argument("--energy", type=float, help="section energy rank (0 calmest .. 1 busiest section of the song)")
+    parser.add_argument("-k", type=int, default=3, help="number of matches to list")
+    args = parser.parse_args()
+
+    library = GestureLibrary(args.library)
+    index = GestureIndex.from_library(library)
+    print(f"{'name':<24} {'bpm':>6} {'energy':>6} {'speed':>8} {'duration':>9}  dominant")
+    for name, f, e in zip(index.names, index.features, index.energy):
+        print(f"{name:<24} {f['bpm']:6.1f} {e:6.2f} {f['speed']:8.0f} {f['duration_s']:8.1f}s  {', '.join(f['dominant'])}")
+    skipped = len(library.names()) - len(index)
+    if skipped:
+        print(f"({skipped} gestures without a detectable tempo left out)")
+    if args.bpm:
+        for name, dist in index.query(args.bpm, args.energy, args.k):
+            fits = "" if index.matches(name, args.bpm, args.energy) else ", outside tolerance"
+            print(f"match: {name} (distance {dist:.3f}{fits})")
+
+
+if __name__ == "__main__":
+    main()
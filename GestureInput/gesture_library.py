@@ -0,0 +1,247 @@
+import json
+import os
+import re
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+
+from GestureInput.edit_journal import discard_journal, load_edited
+from GestureInput.gesture_compress import compress_gesture
+from GestureInput.gesture_format import EXTENSION, load_gesture, read_header, save_gesture
+from GestureInput.gesture_index import extract_features
+
+# ===========================
+#   Gesture Library
+# ===========================
+# Named gestures live in one directory, one .gest file each, next to an
+# index.json that holds what is needed to list and pick them without opening
+# the recordings:
+#
+#   {"version": 1, "gestures": {"<name>": {"file": "<name>.gest",
+#       "motor_ids": [...], "n_frames": N, "record_dt": dt, "duration_s": s,
+#       "bpm": bpm or null, "size_bytes": n, "modified": unix time,
+#       "features": {...}}}}
+#
+# features (see gesture_index.extract_features) are filled in on first use
+# and dropped whenever the recording is re-registered.
+#
+# Edits of a recording are journaled next to it (<name>.gest.edits, see
+# edit_journal) and applied whenever it is loaded.
+#
+# Recordings are opened lazily and their keyframes (what playback streams,
+# see gesture_compress) are kept in an LRU cache bounded by bytes, so
+# switching between prepared gestures on stage is a dictionary lookup.
+
+LIBRARY_DIR = "GestureInput/library"
+INDEX_FILE = "index.json"
+INDEX_VERSION = 1
+CACHE_BYTES = 64 * 1024 * 1024
+
+
+def _safe_name(name):
+    name = re.sub(r"[^A-Za-z0-9_.-]+", "_", str(name).strip()).strip("._")
+    if not name:
+        raise ValueError("Gesture name is empty")
+    return name
+
+
+class GestureLibrary:
+    """
+    Named gestures on disk plus an in-memory LRU of their keyframes.
+
+        library = GestureLibrary()
+        library.add("nod", gesture)              # or register("nod") after writing path_for("nod")
+        keyframes = library.keyframes("nod")     # cached, ready for GesturePlayer
+    """
+
+    def __init__(self, root=LIBRARY_DIR, cache_bytes=CACHE_BYTES):
+        self.root = root
+        self.cache_bytes = cache_bytes
+        self._cache = OrderedDict()  # name -> (keyframes, nbytes)
+        self._cached_bytes = 0
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._index = self._read_index()
+
+    # ---------- index ----------
+    @property
+    def index_path(self):
+        return os.path.join(self.root, INDEX_FILE)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            if index.get("version") == INDEX_VERSION:
+                return index["gestures"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return self._scan()
+
+    def _write_index(self):
+        tmp_path = f"{self.index_path}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump({"version": INDEX_VERSION, "gestures": self._index}, f, indent=2)
+            os.replace(tmp_path, self.index_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _scan(self):
+        """
+        Index entries for every recording in the directory (used when index.json is missing).
+        """
+        entries = {}
+        for file in sorted(os.listdir(self.root)):
+            if file.endswith(EXTENSION):
+                try:
+                    entries[file[:-len(EXTENSION)]] = self._entry(file)
+                except (OSError, ValueError) as e:
+                    print(f"Skipping {file}: {e}")
+        return entries
+
+    def _entry(self, file, bpm=None):
+        path = os.path.join(self.root, file)
+        motor_ids, n_frames, record_dt = read_header(path)
+        duration_s = load_gesture(path).duration_s if n_frames > 1 else 0.0  # edits never change t
+        return {
+            "file": file,
+            "motor_ids": motor_ids,
+            "n_frames": int(n_frames),
+            "record_dt": record_dt,
+            "duration_s": duration_s,
+            "bpm": bpm,
+            "size_bytes": os.path.getsize(path),
+            "modified": os.path.getmtime(path),
+        }
+
+    def rebuild_index(self):
+        with self._lock:
+            self._index = self._scan()
+            self._write_index()
+            self._evict_all()
+
+    # ---------- entries ----------
+    def names(self):
+        return sorted(self._index)
+
+    def __contains__(self, name):
+        return _safe_name(name) in self._index
+
+    def info(self, name):
+        return dict(self._index[_safe_name(name)])
+
+    def path_for(self, name):
+        return os.path.join(self.root, _safe_name(name) + EXTENSION)
+
+    def register(self, name, bpm=None):
+        """
+        (Re)index a recording that was written to path_for(name), e.g. by a
+        GestureRecorder take or after an edit was saved.
+        """
+        name = _safe_name(name)
+        with self._lock:
+            old = self._index.get(name, {})
+            if bpm is None:
+                bpm = old.get("bpm")
+            self._index[name] = self._entry(name + EXTENSION, bpm)
+            self._write_index()
+            self._evict(name)
+        return self.info(name)
+
+    def add(self, name, gesture, bpm=None):
+        save_gesture(self.path_for(name), gesture)
+        discard_journal(self.path_for(name))
+        return self.register(name, bpm)
+
+    def features(self, name):
+        """
+        Retrieval features of a gesture (see gesture_index), computed once and
+        kept in the index.
+        """
+        name = _safe_name(name)
+        features = self._index[name].get("features")
+        if features is None:
+            features = extract_features(self.load(name))
+            with self._lock:
+                if name in self._index:
+                    self._index[name]["features"] = features
+                    self._write_index()
+        return features
+
+    def set_bpm(self, name, bpm):
+        name = _safe_name(name)
+        with self._lock:
+            self._index[name]["bpm"] = bpm
+            self._write_index()
+
+    def remove(self, name):
+        name = _safe_name(name)
+        with self._lock:
+            entry = self._index.pop(name)
+            self._write_index()
+            self._evict(name)
+        path = os.path.join(self.root, entry["file"])
+        if os.path.exists(path):
+            os.remove(path)
+        discard_journal(path)
+
+    # ---------- loading ----------
+    def load(self, name, writable=False):
+        """
+        The recording itself with its journaled edits (memory-mapped, see
+        load_edited). Not cached.
+        """
+        return load_edited(os.path.join(self.root, self._index[_safe_name(name)]["file"]), writable)
+
+    def keyframes(self, name):
+        """
+        Keyframes of a gesture for playback, from the LRU cache when possible.
+        """
+        name = _safe_name(name)
+        with self._lock:
+            if name in self._cache:
+                self._cache.move_to_end(name)
+                return self._cache[name][0]
+        keyframes = compress_gesture(self.load(name))
+        nbytes = keyframes.nbytes
+        with self._lock:
+            if name not in self._cache:
+                self._cache[name] = (keyframes, nbytes)
+                self._cached_bytes += nbytes
+                while self._cached_bytes > self.cache_bytes and len(self._cache) > 1:
+                    _, (_, dropped) = self._cache.popitem(last=False)
+                    self._cached_bytes -= dropped
+        return keyframes
+
+    def preload(self, names=None):
+        """
+        Fill the cache ahead of a show (as far as it fits).
+        """
+        for name in self.names() if names is None else names:
+            self.keyframes(name)
+
+    def _evict(self, name):
+        if name in self._cache:
+            _, nbytes = self._cache.pop(name)
+            self._cached_bytes -= nbytes
+
+    def _evict_all(self):
+        self._cache.clear()
+        self._cached_bytes = 0
+
+
+if __name__ == "__main__":
+    # python -m GestureInput.gesture_library [library dir] [--rebuild]
+    args = [a for a in sys.argv[1:] if a != "--rebuild"]
+    library = GestureLibrary(args[0] if args else LIBRARY_DIR)
+    if "--rebuild" in sys.argv[1:]:
+        library.rebuild_index()
+    print(f"{'name':<24} {'duration':>9} {'motors':<20} {'bpm':>6} {'size':>9}")
+    for name in library.names():
+        info = library.info(name)
+        bpm = f"{info['bpm']:.1f}" if info["bpm"] else "-"
+        print(f"{name:<24} {info['duration_s']:8.1f}s {str(info['motor_ids']):<20} {bpm:>6} "
+              f"{info['size_bytes'] / 1e3:7.1f}kB")
@@ -0,0 +1,178 @@
+from collections import deque
+
+import numpy as np
+
+from GestureInput.gesture_compress import KeyframeGesture
+from GestureInput.gesture_format import Gesture
+from GestureInput.sampler import FixedRateSampler
+
+# ===========================
+#   Timestamp-driven Playback
+# ===========================
+# Playback follows the recorded timestamps instead of stepping one frame per
+# sleep: every output tick (on FixedRateSampler deadlines) looks up where
+# the recording is at that moment and linearly interpolates between the two
+# surrounding frames. The output rate is independent of the recording rate,
+# and when a tick runs late the recording simply moves on -- frames in
+# between are skipped instead of slowing the whole gesture down.
+# A KeyframeGesture (gesture_compress) plays the same way, interpolating
+# between keyframes instead of recorded frames.
+#
+# While playing, other gestures can be queued (they start when the current
+# one reaches its end) or crossfaded to (blended in over a few seconds).
+# Each gesture can carry a tag (e.g. its library name), exposed as
+# player.tag for the one currently playing. The gesture and its tag are
+# swapped as one tuple (player.current), so other threads never see a new
+# gesture with the old tag.
+
+
+class GesturePlayer:
+    """
+    Plays a Gesture, KeyframeGesture or list of frame dicts against the monotonic clock.
+
+        player = GesturePlayer(recorded_frames, [m.ID for m in motors], RECORD_DT)
+        for i, positions in player.ticks(loop=True, on_loop=play_ting):
+            sync_moveto(motors, positions)
+
+    positions are int ticks in the order of motor_ids; i is the index of the
+    recorded frame of player.gesture at or before the current playback time.
+    speed scales playback (2.0 plays twice as fast).
+    """
+
+    def __init__(self, gesture, motor_ids=None, output_dt=None, speed=1.0, tag=None):
+        self.motor_ids = None if motor_ids is None else [int(m) for m in motor_ids]
+        self.set_gesture(gesture, tag)
+        self.output_dt = output_dt or self.gesture.record_dt or 0.005
+        self.speed = speed
+        self.stats = None
+        self.n_loops = 0
+        self._queue = deque()
+        self._fade = None
+
+    def set_gesture(self, gesture, tag=None):
+        """
+        Swap what is being played (e.g. after edits were merged); takes effect on the next tick.
+        """
+        gesture = _as_playable(gesture)
+        if self.motor_ids is None:
+            self.motor_ids = list(gesture.motor_ids)
+        self.current = (gesture, tag)
+
+    @property
+    def gesture(self):
+        return self.current[0]
+
+    @property
+    def tag(self):
+        return self.current[1]
+
+    def queue(self, gesture, tag=None):
+        """
+        Play gesture after the current one (and anything queued before it) ends.
+        """
+        self._queue.append((_as_playable(gesture), tag))
+
+    def crossfade_to(self, gesture, seconds, tag=None):
+        """
+        Start gesture now, blending from the current one over seconds.
+        """
+        self._fade = (_as_playable(gesture), tag, max(seconds, 1e-9), None)
+
+    def clear_queue(self):
+        self._queue.clear()
+
+    @property
+    def switching(self):
+        """
+        True while a queued or crossfaded gesture is still to take over.
+        """
+        return bool(self._queue) or self._fade is not None
+
+    @property
+    def duration_s(self):
+        return self.gesture.duration_s
+
+    def sample(self, time_s, gesture=None):
+        """
+        (frame index, interpolated positions) at time_s seconds into the recording.
+        Positions are read from the gesture on every call, so edits merged
+        into it during playback are picked up.
+        """
+        gesture = self.gesture if gesture is None else gesture
+        if isinstance(gesture, KeyframeGesture):
+            positions = gesture.sample(time_s, self.motor_ids)
+            return gesture.frame_index(time_s), np.rint(positions).astype(np.int64)
+        rows = [gesture.motor_ids.index(m) for m in self.motor_ids]
+        t = gesture.t
+        t_abs = t[0] + time_s
+        i = int(np.searchsorted(t, t_abs, side="right")) - 1
+        i = min(max(i, 0), len(t) - 1)
+        p0 = gesture.positions[rows, i].astype(np.float64)
+        if i + 1 >= len(t) or t[i + 1] <= t[i]:
+            return i, np.rint(p0).astype(np.int64)
+        w = min(max((t_abs - t[i]) / (t[i + 1] - t[i]), 0.0), 1.0)
+        p1 = gesture.positions[rows, i + 1]
+        return i, np.rint(p0 + w * (p1 - p0)).astype(np.int64)
+
+    def ticks(self, loop=False, on_loop=None):
+        """
+        Yields (frame index, positions) once per output_dt until the end of the
+        recording (the last frame is always yielded) and of everything queued.
+        With loop=True the last gesture wraps around and on_loop() is called
+        at every wrap. Stop by breaking out of the loop.
+        """
+        if len(self.gesture) == 0:
+            return
+
+        sampler = FixedRateSampler(self.output_dt)
+        self.stats = sampler.stats
+        start = None
+        for deadline in sampler.ticks():
+            if start is None:
+                start = deadline
+            elapsed = (deadline - start) * self.speed
+            duration = self.duration_s
+
+            if self._fade is not None:
+                target, tag, fade_s, fade_start = self._fade
+                if fade_start is None:
+                    fade_start = deadline
+                    self._fade = (target, tag, fade_s, fade_start)
+                into = (deadline - fade_start) * self.speed
+                if into < fade_s:
+                    w = into / fade_s
+                    i, current = self.sample(min(elapsed, duration))
+                    _, incoming = self.sample(min(into, target.duration_s), target)
+                    yield i, np.rint((1 - w) * current + w * incoming).astype(np.int64)
+                    continue
+                self._fade = None
+                self.set_gesture(target, tag)
+                start = deadline - into / self.speed
+                elapsed, duration = into, self.duration_s
+
+            while elapsed >= duration and self._queue:
+                # hand over to the next queued gesture without a gap
+                start += duration / self.speed
+                elapsed -= duration
+                self.set_gesture(*self._queue.popleft())
+                duration = self.duration_s
+
+            if elapsed >= duration:
+                if not loop or duration <= 0:
+                    yield self.sample(duration)
+                    if not self._queue and self._fade is None:
+                        return
+                    continue  # something was queued meanwhile; pick it up next tick
+                wraps = int(elapsed // duration)
+                start += wraps * duration / self.speed
+                elapsed -= wraps * duration
+                self.n_loops += wraps
+                if on_loop is not None:
+                    on_loop()
+            yield self.sample(elapsed)
+
+
+def _as_playable(gesture):
+    if isinstance(gesture, (Gesture, KeyframeGesture)):
+        return gesture
+    return Gesture.from_frames(gesture)
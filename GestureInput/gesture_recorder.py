@@ -0,0 +1,199 @@
+import os
+import queue
+import struct
+import threading
+
+import numpy as np
+
+from GestureInput.edit_journal import discard_journal
+from GestureInput.gesture_format import Gesture, save_gesture
+from GestureInput.sampler import resample_uniform
+
+# ===========================
+#   Crash-safe Take Recorder
+# ===========================
+# While recording, frames are appended to a row-oriented log next to the
+# final recording (<save_path>.log):
+#
+#   header    <4s H H d>  magic, version, n_motors, record_dt
+#   motor ids int32[n_motors]   (padded to 8 bytes)
+#   records   {float64 t, int32 positions[n_motors]} ...
+#
+# Every record has the same size, so after a crash the log is read back up
+# to the last complete record. The sampling thread only copies a frame into
+# an in-memory chunk; full chunks are written, flushed and fsynced by a
+# writer thread, so disk stalls never delay sampling and at most one chunk
+# (plus whatever is queued) is lost on power loss.
+# When the take ends the log is converted to the columnar .gest format.
+
+LOG_MAGIC = b"SHGL"
+LOG_VERSION = 1
+LOG_HEADER = struct.Struct("<4sHHd")
+LOG_SUFFIX = ".log"
+
+
+def log_path_for(save_path):
+    return save_path + LOG_SUFFIX
+
+
+def _record_dtype(n_motors):
+    return np.dtype([("t", "<f8"), ("positions", "<i4", (n_motors,))])
+
+
+def _data_offset(n_motors):
+    offset = LOG_HEADER.size + 4 * n_motors
+    return offset + (-offset % 8)
+
+
+class GestureRecorder:
+    """
+    Appends frames to an on-disk log from a background writer thread.
+
+    Usage:
+        recorder = GestureRecorder(log_path_for(save_path), motor_ids, RECORD_DT)
+        recorder.append(time.perf_counter(), [positions...])   # sampling thread
+        recorder.finish(save_path)                              # -> .gest
+    """
+
+    def __init__(self, log_path, motor_ids, record_dt=0.0, chunk_frames=200):
+        self.log_path = log_path
+        self.motor_ids = [int(m) for m in motor_ids]
+        self.record_dt = record_dt
+        self.chunk_frames = chunk_frames
+        self.n_frames = 0
+        self.error = None
+
+        self._dtype = _record_dtype(len(self.motor_ids))
+        self._chunk = np.zeros(chunk_frames, dtype=self._dtype)
+        self._n_chunk = 0
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        self._close_lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        self._file = open(log_path, "wb")
+        self._file.write(LOG_HEADER.pack(LOG_MAGIC, LOG_VERSION, len(self.motor_ids), record_dt))
+        self._file.write(np.asarray(self.motor_ids, dtype="<i4").tobytes())
+        self._file.write(b"\0" * (_data_offset(len(self.motor_ids)) - self._file.tell()))
+        self._sync()
+
+        self._writer = threading.Thread(target=self._write_loop, name="gesture-writer", daemon=True)
+        self._writer.start()
+
+    def append(self, t, positions):
+        """
+        Add one frame. Never touches the disk; safe to call from the sampling loop.
+        """
+        record = self._chunk[self._n_chunk]
+        record["t"] = t
+        record["positions"] = positions
+        self._n_chunk += 1
+        self.n_frames += 1
+        if self._n_chunk == self.chunk_frames:
+            self._queue.put(self._chunk)
+            self._chunk = np.zeros(self.chunk_frames, dtype=self._dtype)
+            self._n_chunk = 0
+
+    def close(self):
+        """
+        Write out everything appended so far and close the log. Idempotent.
+        """
+        with self._close_lock:
+            if self._closed:
+                return
+            self._closed = True
+        if self._n_chunk:
+            self._queue.put(self._chunk[:self._n_chunk])
+        self._queue.put(None)
+        self._writer.join()
+        self._file.close()
+        if self.error is not None:
+            print(f"Error writing gesture log {self.log_path}: {self.error}")
+
+    def finish(self, save_path, resample_dt=None):
+        """
+        Close the log, convert it to a .gest recording at save_path and remove the log.
+        With resample_dt the take is resampled onto an exact uniform grid first.
+        Returns the recorded Gesture.
+        Raises OSError if writing the log failed; the (truncated) log is kept
+        so recover_pending can still save what reached the disk.
+        """
+        self.close()
+        if self.error is not None:
+            raise OSError(f"Gesture log {self.log_path} is missing frames after a write error: {self.error}") from self.error
+        return recover(self.log_path, save_path, resample_dt)
+
+    def _write_loop(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            if self.error is not None:
+                continue  # keep draining so the sampler never backs up
+            try:
+                self._file.write(chunk.tobytes())
+                self._sync()
+            except OSError as e:
+                self.error = e
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+
+def read_log(log_path):
+    """
+    Read a (possibly partial) take log as a Gesture. A torn record at the end
+    and zero-filled blocks left by a crash are dropped.
+    """
+    with open(log_path, "rb") as f:
+        magic, version, n_motors, record_dt = LOG_HEADER.unpack(f.read(LOG_HEADER.size))
+        if magic != LOG_MAGIC:
+            raise ValueError(f"{log_path} is not a gesture log")
+        if version != LOG_VERSION:
+            raise ValueError(f"{log_path} has unsupported gesture log version {version}")
+        motor_ids = np.frombuffer(f.read(4 * n_motors), dtype="<i4").tolist()
+
+    dtype = _record_dtype(n_motors)
+    offset = _data_offset(n_motors)
+    n_records = max(0, (os.path.getsize(log_path) - offset) // dtype.itemsize)
+    if n_records:
+        records = np.fromfile(log_path, dtype=dtype, count=n_records, offset=offset)
+    else:
+        records = np.zeros(0, dtype=dtype)
+
+    # timestamps come from perf_counter and are never 0, so t == 0 marks
+    # blocks the filesystem allocated but never wrote
+    valid = np.flatnonzero(records["t"] != 0)
+    records = records[:valid[-1] + 1] if len(valid) else records[:0]
+    return Gesture(motor_ids, records["t"].copy(), records["positions"].T.copy(), record_dt)
+
+
+def recover(log_path, save_path=None, resample_dt=None):
+    """
+    Turn a take log into a .gest recording (default: the log path without
+    LOG_SUFFIX) and delete the log, along with the edits of the recording it
+    replaces (see edit_journal). Returns the Gesture.
+    """
+    if save_path is None:
+        save_path = log_path[:-len(LOG_SUFFIX)] if log_path.endswith(LOG_SUFFIX) else log_path + ".gest"
+    gesture = read_log(log_path)
+    if resample_dt:
+        gesture = resample_uniform(gesture, resample_dt)
+    save_gesture(save_path, gesture)
+    discard_journal(save_path)
+    os.remove(log_path)
+    return gesture
+
+
+def recover_pending(save_path, resample_dt=None):
+    """
+    If a take was interrupted before it was saved (its log still exists),
+    recover it into save_path. Returns the Gesture or None.
+    """
+    log_path = log_path_for(save_path)
+    if not os.path.exists(log_path):
+        return None
+    gesture = recover(log_path, save_path, resample_dt)
+    print(f"Recovered {len(gesture)} frames ({gesture.duration_s:.1f}s) of an interrupted recording into {save_path}")
+    return gesture
@@ -0,0 +1,113 @@
+from collections import deque
+
+import numpy as np
+
+# ===========================
+#   Tempo from Motor Positions
+# ===========================
+# A nod is a turning point of a motor: the position stops rising (or was
+# still) and starts falling by more than position_eps per sample. The tempo
+# is 60 / mean interval of the last min_nods peaks; a new tempo segment
+# starts when that moves by more than bpm_change_ratio.
+#
+# infer_bpm_from_positions() does this for a whole recording with array
+# operations; BPMTracker does the same one sample at a time (O(1) per
+# sample) so it can run inside the record loop. Both give the same segments.
+
+
+def _directions(dx, position_eps):
+    return np.where(dx > position_eps, 1, np.where(dx < -position_eps, -1, 0))
+
+
+def _segments(peak_times, min_nods, bpm_change_ratio):
+    """
+    Tempo segments from peak times: (start times, bpms).
+    """
+    peak_times = np.asarray(peak_times, dtype=np.float64)
+    if len(peak_times) < min_nods + 1:
+        return np.array([]), np.array([])
+    spans = peak_times[min_nods:] - peak_times[:-min_nods]
+    bpms = 60.0 * min_nods / spans
+    starts = peak_times[:len(bpms)]
+
+    # a segment only depends on the previous accepted tempo, so this walks
+    # the peaks (a few per second), not the samples
+    bpm_times, bpm_values = [starts[0]], [bpms[0]]
+    for start, bpm in zip(starts[1:], bpms[1:]):
+        if abs(bpm - bpm_values[-1]) / bpm_values[-1] > bpm_change_ratio:
+            bpm_times.append(start)
+            bpm_values.append(bpm)
+    return np.array(bpm_times), np.array(bpm_values)
+
+
+def infer_bpm_from_positions(
+    x,                      # position array
+    t,                      # time array
+    position_eps=10.0,      # ticks; below this = noise
+    min_nods=1,             # nods needed before BPM estimate
+    bpm_change_ratio=0.2    # 20% change triggers new segment
+):
+    """
+    Infer BPM from motor position using turning points.
+
+    Returns:
+        times: array of times (seconds) where a tempo segment starts
+        bpms: array of BPM values
+    """
+    x = np.asarray(x, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+    if len(x) < 2:
+        return np.array([]), np.array([])
+    direction = _directions(np.diff(x), position_eps)           # direction at samples 1..n-1
+    last_dir = np.concatenate([[0], direction[:-1]])
+    peaks = np.flatnonzero((last_dir >= 0) & (direction == -1)) + 1
+    return _segments(t[peaks], min_nods, bpm_change_ratio)
+
+
+class BPMTracker:
+    """
+    Streaming infer_bpm_from_positions: feed samples with update(t, x).
+
+        tracker = BPMTracker()
+        for t, x in samples:
+            if tracker.update(t, x) is not None:
+                print(f"{tracker.bpm:.1f} BPM")
+
+    bpm_times / bpm_values accumulate the segments found so far.
+    """
+
+    def __init__(self, position_eps=10.0, min_nods=1, bpm_change_ratio=0.2):
+        self.position_eps = position_eps
+        self.min_nods = min_nods
+        self.bpm_change_ratio = bpm_change_ratio
+        self.bpm = None
+        self.bpm_times = []
+        self.bpm_values = []
+        self._peaks = deque(maxlen=min_nods + 1)
+        self._last_x = None
+        self._last_dir = 0
+
+    def update(self, t, x):
+        """
+        Add one sample. Returns the new BPM when a tempo segment starts, else None.
+        """
+        last_x, self._last_x = self._last_x, x
+        if last_x is None:
+            return None
+        dx = x - last_x
+        direction = 1 if dx > self.position_eps else -1 if dx < -self.position_eps else 0
+        is_peak = self._last_dir >= 0 and direction == -1
+        self._last_dir = direction
+        if not is_peak:
+            return None
+
+        self._peaks.append(t)
+        if len(self._peaks) < self.min_nods + 1:
+            return None
+        bpm = 60.0 * self.min_nods / (self._peaks[-1] - self._peaks[0])
+        if self.bpm is not None and abs(bpm - self.bpm) / self.bpm <= self.bpm_change_ratio:
+            return None
+        self.bpm = bpm
+        self.bpm_times.append(self._peaks[0])
+        self.bpm_values.append(bpm)
+        return bpm
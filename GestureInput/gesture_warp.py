@@ -0,0 +1,184 @@
+import time
+
+import numpy as np
+
+from GestureInput.gesture_compress import rdp_keyframes
+from GestureInput.gesture_format import Gesture
+from GestureInput.sampler import FixedRateSampler
+
+# ===========================
+#   Tempo Warping
+# ===========================
+# A recorded nod has its own tempo. To use it as a dance move at another
+# tempo the gesture is time-warped so that its peaks (the turning points of
+# the beat motor, as in GestureAnalysis.infer_bpm_from_positions) land on
+# beats: peak j of the recording is mapped to beat j, and time in between is
+# stretched linearly. Before the first and after the last peak the average
+# ratio is used.
+#
+# - warp_to_bpm() resamples the whole gesture offline (vectorized np.interp).
+# - beat_synced_ticks() follows a live BeatClock instead: every output tick
+#   converts the clock's beat position into recording time, so tempo changes
+#   take effect immediately and the nods stay on the beat.
+
+PEAK_EPS = 10.0  # ticks a motor has to turn back before a peak counts
+
+
+def detect_peaks(t, x, position_eps=PEAK_EPS):
+    """
+    Times of the maxima of x(t) that are followed by a fall of more than
+    position_eps (zigzag with hysteresis). Runs over the RDP keyframes of the
+    track, which keep every turning point bigger than a tick.
+    """
+    t = np.asarray(t, dtype=np.float64)
+    keep = rdp_keyframes(t, x, 1.0)
+    kt, kx = t[keep], np.asarray(x, dtype=np.float64)[keep]
+    peaks = []
+    mode, ext, lo, hi = 0, 0, 0, 0  # mode: 0 unknown, 1 rising (ext = max), -1 falling (ext = min)
+    for j in range(1, len(kx)):
+        if mode == 0:
+            hi = j if kx[j] > kx[hi] else hi
+            lo = j if kx[j] < kx[lo] else lo
+            if kx[hi] - kx[j] > position_eps:
+                if hi > 0:
+                    peaks.append(kt[hi])
+                mode, ext = -1, j
+            elif kx[j] - kx[lo] > position_eps:
+                mode, ext = 1, j
+        elif mode == 1:
+            if kx[j] >= kx[ext]:
+                ext = j
+            elif kx[ext] - kx[j] > position_eps:
+                peaks.append(kt[ext])
+                mode, ext = -1, j
+        else:
+            if kx[j] <= kx[ext]:
+                ext = j
+            elif kx[j] - kx[ext] > position_eps:
+                mode, ext = 1, j
+    return np.array(peaks)
+
+
+def beat_motor(gesture):
+    """
+    The motor that moves the most (largest position range).
+    """
+    ranges = np.ptp(np.asarray(gesture.positions), axis=1) if len(gesture) else np.zeros(len(gesture.motor_ids))
+    return gesture.motor_ids[int(np.argmax(ranges))]
+
+
+def gesture_peaks(gesture, motor_id=None, position_eps=PEAK_EPS):
+    """
+    Peak times (seconds from the start) of the beat motor of a Gesture.
+    """
+    motor_id = beat_motor(gesture) if motor_id is None else motor_id
+    t = np.asarray(gesture.t, dtype=np.float64)
+    return detect_peaks(t - t[0], gesture.column(motor_id), position_eps)
+
+
+def peaks_bpm(peaks):
+    if len(peaks) < 2:
+        raise ValueError("Need at least two peaks to find the tempo of a gesture")
+    return 60.0 / float(np.mean(np.diff(peaks)))
+
+
+def _interp_extrap(x, xp, fp):
+    """
+    np.interp with linear extrapolation from the first / last segment.
+    """
+    y = np.interp(x, xp, fp)
+    x = np.asarray(x, dtype=np.float64)
+    lo, hi = x < xp[0], x > xp[-1]
+    y = np.where(lo, fp[0] + (x - xp[0]) * (fp[1] - fp[0]) / (xp[1] - xp[0]), y)
+    y = np.where(hi, fp[-1] + (x - xp[-1]) * (fp[-1] - fp[-2]) / (xp[-1] - xp[-2]), y)
+    return y
+
+
+def warp_map(peaks, duration_s, bpm):
+    """
+    Knots (target times, source times) of the piecewise-linear time warp that
+    puts peak j on beat j at bpm, including both ends of the gesture.
+    """
+    period = 60.0 / bpm
+    ratio = period / (60.0 / peaks_bpm(peaks))
+    target_peaks = peaks[0] * ratio + period * np.arange(len(peaks))
+    target = np.concatenate([[0.0], target_peaks, [target_peaks[-1] + (duration_s - peaks[-1]) * ratio]])
+    source = np.concatenate([[0.0], peaks, [duration_s]])
+    # a peak right at either end would repeat a knot
+    keep = np.concatenate([[True], np.diff(source) > 0])
+    return target[keep], source[keep]
+
+
+def warp_to_bpm(gesture, bpm, motor_id=None, output_dt=None, position_eps=PEAK_EPS):
+    """
+    The gesture time-warped so its peaks fall on a beat grid at bpm (first
+    beat at the warped first peak). Resampled on a uniform output_dt grid
+    (default: the gesture's record_dt).
+    """
+    output_dt = output_dt or gesture.record_dt or 0.005
+    t = np.asarray(gesture.t, dtype=np.float64)
+    t_rel = t - t[0]
+    peaks = gesture_peaks(gesture, motor_id, position_eps)
+    target, source = warp_map(peaks, gesture.duration_s, bpm)
+    grid = np.arange(0.0, target[-1] + 1e-9, output_dt)
+    source_times = np.clip(np.interp(grid, target, source), 0.0, t_rel[-1])
+    positions = np.empty((len(gesture.motor_ids), len(grid)), dtype=np.int32)
+    for j, m in enumerate(gesture.motor_ids):
+        positions[j] = np.rint(np.interp(source_times, t_rel, gesture.column(m)))
+    return Gesture(gesture.motor_ids, grid, positions, output_dt)
+
+
+class BeatClock:
+    """
+    Beat position over the monotonic clock, either at a steady (adjustable)
+    bpm or following a list of beat times (e.g. AudioAnalysis beat_times_s,
+    started together with the song).
+
+        clock = BeatClock(96)
+        clock.beat_at(time.perf_counter())   # beats since start, fractional
+        clock.set_bpm(120)                   # phase-continuous tempo change
+    """
+
+    def __init__(self, bpm=None, beat_times=None, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.beat_times = None if beat_times is None else np.asarray(beat_times, dtype=np.float64)
+        self.bpm = bpm
+        self._beat0, self._t0 = 0.0, self.start
+        if self.beat_times is None and not bpm:
+            raise ValueError("BeatClock needs a bpm or beat times")
+
+    def beat_at(self, now):
+        if self.beat_times is not None:
+            if len(self.beat_times) < 2:
+                return 0.0
+            return float(_interp_extrap(now - self.start, self.beat_times, np.arange(len(self.beat_times))))
+        return self._beat0 + (now - self._t0) * self.bpm / 60.0
+
+    def set_bpm(self, bpm, now=None):
+        now = time.perf_counter() if now is None else now
+        self._beat0, self._t0 = self.beat_at(now), now
+        self.beat_times = None
+        self.bpm = bpm
+
+
+def beat_to_source_time(beat, peaks):
+    """
+    Recording time for a beat position, looping over the span between the
+    first and last peak (one beat per peak interval).
+    """
+    n_beats = len(peaks) - 1
+    return float(np.interp(beat % n_beats, np.arange(len(peaks)), peaks))
+
+
+def beat_synced_ticks(player, clock, peaks, output_dt=None):
+    """
+    Like GesturePlayer.ticks(loop=True), but the recording time comes from
+    the beat clock: yields (frame index, positions) with the gesture's peaks
+    on the clock's beats. Stop by breaking out of the loop.
+    """
+    if len(peaks) < 2:
+        raise ValueError("Need at least two peaks to sync a gesture to a beat")
+    sampler = FixedRateSampler(output_dt or player.output_dt)
+    player.stats = sampler.stats
+    for deadline in sampler.ticks():
+        yield player.sample(beat_to_source_time(clock.beat_at(deadline), peaks))
@@ -0,0 +1,91 @@
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+# ===========================
+#   Lock-free Thread Exchange
+# ===========================
+# The playback thread runs a 5 ms loop and should never wait for an OSC
+# handler. Two primitives let it share state without taking a lock:
+#
+# - AtomicRef holds an immutable snapshot (e.g. PlaybackState). Writers
+#   build a new snapshot and swap the reference; the reader just loads it.
+# - SPSCRing is a fixed-size ring of numpy records with one producer and
+#   one consumer. Each side only advances its own index.
+#
+# Both rely on CPython executing a single attribute store / load atomically
+# and in program order (the GIL), so a record is fully written before the
+# producer's index that publishes it.
+
+# what the playback thread needs to know every tick
+PlaybackState = namedtuple("PlaybackState", ["playing", "editing_ids"], defaults=(False, frozenset()))
+
+# one live edit: motor held at position over frames [start, stop)
+EDIT_RECORD = np.dtype([("start", "<i8"), ("stop", "<i8"), ("motor_id", "<i4"), ("position", "<i4")])
+
+
+class AtomicRef:
+    """
+    A reference to an immutable value that readers load without locking.
+    Writers may race each other, so update() serializes read-modify-write.
+    """
+
+    def __init__(self, value):
+        self._value = value
+        self._write_lock = threading.Lock()
+
+    def get(self):
+        return self._value
+
+    def set(self, value):
+        self._value = value
+
+    def update(self, fn):
+        with self._write_lock:
+            self._value = fn(self._value)
+            return self._value
+
+
+class SPSCRing:
+    """
+    Bounded single-producer / single-consumer queue of numpy records.
+    push() never blocks: when the ring is full the record is dropped and
+    counted in n_dropped.
+    """
+
+    def __init__(self, capacity, dtype=EDIT_RECORD):
+        capacity = 1 << max(int(capacity) - 1, 1).bit_length()  # power of two
+        self._buf = np.zeros(capacity, dtype=dtype)
+        self._mask = capacity - 1
+        self._head = 0  # written only by the producer
+        self._tail = 0  # written only by the consumer
+        self.n_dropped = 0
+
+    @property
+    def capacity(self):
+        return len(self._buf)
+
+    def __len__(self):
+        return self._head - self._tail
+
+    def push(self, *fields):
+        head = self._head
+        if head - self._tail >= len(self._buf):
+            self.n_dropped += 1
+            return False
+        self._buf[head & self._mask] = fields
+        self._head = head + 1  # publish after the record is written
+        return True
+
+    def drain(self):
+        """
+        All records pushed so far, oldest first, as a new array.
+        """
+        tail, head = self._tail, self._head
+        if head == tail:
+            return self._buf[:0].copy()
+        idx = np.arange(tail, head) & self._mask
+        records = self._buf[idx]
+        self._tail = head
+        return records
@@ -0,0 +1,104 @@
+import math
+import time
+
+import numpy as np
+
+from GestureInput.gesture_format import Gesture
+
+# ===========================
+#    Fixed-rate Sampling
+# ===========================
+# A loop of "read, then sleep(dt)" runs at dt + read time + sleep overshoot
+# and drifts. Here every sample has an absolute deadline start + k * period:
+# the loop sleeps until shortly before the deadline and spins the rest, so
+# read time doesn't accumulate. A sample that starts more than a full period
+# late is an overrun; the deadlines it missed are skipped rather than
+# replayed in a burst.
+
+
+class SamplerStats:
+    """
+    Running lateness (jitter) statistics, in seconds. Constant memory.
+    """
+
+    def __init__(self):
+        self.n_samples = 0
+        self.n_overruns = 0
+        self.n_skipped = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.max = 0.0
+
+    def add(self, lateness):
+        self.n_samples += 1
+        delta = lateness - self.mean
+        self.mean += delta / self.n_samples
+        self._m2 += delta * (lateness - self.mean)
+        self.max = max(self.max, lateness)
+
+    @property
+    def std(self):
+        return math.sqrt(self._m2 / self.n_samples) if self.n_samples > 1 else 0.0
+
+    def summary(self):
+        return (f"{self.n_samples} samples, {self.n_overruns} overruns ({self.n_skipped} deadlines skipped), "
+                f"lateness mean {self.mean * 1e3:.3f} ms, std {self.std * 1e3:.3f} ms, max {self.max * 1e3:.3f} ms")
+
+
+class FixedRateSampler:
+    """
+    Yields once per period, against absolute deadlines.
+
+        sampler = FixedRateSampler(RECORD_DT)
+        for deadline in sampler.ticks():
+            ...read motors...
+        print(sampler.stats.summary())
+
+    spin_s is how long before a deadline to stop sleeping and busy-wait,
+    which hides the OS sleep overshoot at the cost of a little CPU.
+    """
+
+    def __init__(self, period, spin_s=0.0005):
+        self.period = period
+        self.spin_s = spin_s
+        self.stats = SamplerStats()
+
+    def ticks(self):
+        period = self.period
+        deadline = time.perf_counter()
+        while True:
+            remaining = deadline - time.perf_counter()
+            if remaining > self.spin_s:
+                time.sleep(remaining - self.spin_s)
+            while time.perf_counter() < deadline:
+                pass
+
+            lateness = time.perf_counter() - deadline
+            if lateness >= period:
+                missed = int(lateness // period)
+                self.stats.n_overruns += 1
+                self.stats.n_skipped += missed
+                deadline += missed * period
+                lateness -= missed * period
+            self.stats.add(lateness)
+
+            yield deadline
+            deadline += period
+
+
+def resample_uniform(gesture, dt=None):
+    """
+    Resample a Gesture onto an exact grid t0 + k * dt by linear interpolation
+    (positions rounded to whole ticks). dt defaults to the gesture's record_dt.
+    """
+    if dt is None:
+        dt = gesture.record_dt
+    if len(gesture) < 2 or not dt:
+        return gesture
+    t = np.asarray(gesture.t, dtype=np.float64)
+    n = int(math.floor((t[-1] - t[0]) / dt + 1e-9)) + 1
+    grid = t[0] + dt * np.arange(n)
+    positions = np.empty((len(gesture.motor_ids), n), dtype=np.int32)
+    for j in range(len(gesture.motor_ids)):
+        positions[j] = np.rint(np.interp(grid, t, gesture.positions[j]))
+    return Gesture(gesture.motor_ids, grid, positions, dt)
@@ -0,0 +1,71 @@
+"""
+End-to-end speed-up of analysing at reduced rates (Dance.decoding) vs the native rate.
+
+Runs get_audio_sections (native vs BEAT_SR) and the lip sync envelope
+(native vs ENVELOPE_SR) with a throwaway cache, and reports how far the
+results move.
+
+Usage (from the repo root):
+    python -m benchmarks.analysis_rates [audio files...]   # defaults to data/*.wav
+"""
+import glob
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from Dance.analysis_cache import AnalysisCache
+from Dance.AudioAnalysis import get_audio_sections, lip_sync
+from Dance.decoding import BEAT_SR, ENVELOPE_SR
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def main(audio_files):
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AnalysisCache(tmp)
+        # warm up numba-compiled librosa code so the first file isn't penalized
+        get_audio_sections(audio_files[0], cache=AnalysisCache(tmp + "/warmup"))
+
+        for audio_file in audio_files:
+            (native, _, native_beat), native_s = timed(
+                get_audio_sections, audio_file, force_segment=True, cache=cache, analysis_sr=None
+            )
+            (reduced, _, reduced_beat), reduced_s = timed(
+                get_audio_sections, audio_file, force_segment=True, cache=cache, analysis_sr=BEAT_SR
+            )
+            if len(native) == len(reduced):
+                bpm_diff = max(abs(a["bpm"] - b["bpm"]) for a, b in zip(native, reduced))
+                start_diff = max(abs(a["start_s"] - b["start_s"]) for a, b in zip(native, reduced))
+            else:
+                bpm_diff = start_diff = float("nan")
+            rows.append((audio_file, "get_audio_sections", native_s, reduced_s,
+                         f"sections {len(native)} vs {len(reduced)}, max dBPM {bpm_diff:.2f}, "
+                         f"max dstart {start_diff:.3f}s, first beat {native_beat:.3f}s vs {reduced_beat:.3f}s"))
+
+            # vocal stem is cached after the first call, so both runs time only the envelope
+            lip_sync(audio_file, cache=cache, envelope_sr=None)
+            (t_native, p_native), native_s = timed(
+                lip_sync, audio_file, cache=cache, envelope_sr=None, force_envelope=True
+            )
+            (t_reduced, p_reduced), reduced_s = timed(
+                lip_sync, audio_file, cache=cache, envelope_sr=ENVELOPE_SR, force_envelope=True
+            )
+            dense = np.interp(t_native, t_reduced, p_reduced)
+            rows.append((audio_file, "lip_sync envelope", native_s, reduced_s,
+                         f"mean |d position| {np.mean(np.abs(dense - np.asarray(p_native))):.3f}"))
+
+    print()
+    print(f"{'file':<32} {'stage':<20} {'native s':>9} {'reduced s':>9} {'speed-up':>8}  result change")
+    for audio_file, stage, native_s, reduced_s, change in rows:
+        print(f"{audio_file:<32} {stage:<20} {native_s:9.2f} {reduced_s:9.2f} {native_s / reduced_s:7.1f}x  {change}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob("data/*.wav")))
@@ -0,0 +1,72 @@
+"""
+Accuracy vs speed of the lip sync envelope modes.
+
+Reference: Demucs vocal stem + "waveform" envelope (what /dance uses).
+Candidates: envelope features computed straight from the mix (Dance.AudioAnalysis.MIX_FEATURES).
+
+Usage (from the repo root):
+    python -m benchmarks.lipsync_modes [audio files...]   # defaults to data/*.wav
+"""
+import glob
+import sys
+import tempfile
+import time
+
+import librosa
+import numpy as np
+
+from Dance import separation
+from Dance.analysis_cache import AnalysisCache
+from Dance.AudioAnalysis import MIX_FEATURES, extract_envelope, load_separated
+
+ACTIVE_LEVEL = 0.3  # envelope above this counts as "mouth open"
+
+
+def dense_envelope(track, audio_feature):
+    # threshold=0 keeps every frame
+    times, positions = extract_envelope(track, threshold=0, audio_feature=audio_feature)
+    return times, np.asarray(positions)
+
+
+def compare(ref_times, ref, times, env):
+    env = np.interp(ref_times, times, env)
+    corr = np.corrcoef(ref, env)[0, 1]
+    mae = np.mean(np.abs(ref - env))
+    agreement = np.mean((ref > ACTIVE_LEVEL) == (env > ACTIVE_LEVEL))
+    return corr, mae, agreement
+
+
+def main(audio_files):
+    if separation.is_available():
+        t0 = time.perf_counter()
+        separation.warm_up()
+        print(f"Demucs model load: {time.perf_counter() - t0:.2f}s (paid once per process)")
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = AnalysisCache(tmp)
+        for audio_file in audio_files:
+            duration = librosa.get_duration(path=audio_file)
+
+            t0 = time.perf_counter()
+            vocals = load_separated(audio_file, cache=cache, force_separate=True)
+            ref_times, ref = dense_envelope(vocals, "waveform")
+            ref_s = time.perf_counter() - t0
+            rows.append((audio_file, "demucs+waveform", duration, ref_s, 1.0, 0.0, 1.0))
+
+            for feature in MIX_FEATURES:
+                t0 = time.perf_counter()
+                mix = librosa.load(audio_file, sr=None)
+                times, env = dense_envelope(mix, feature)
+                elapsed = time.perf_counter() - t0
+                rows.append((audio_file, feature, duration, elapsed, *compare(ref_times, ref, times, env)))
+
+    print()
+    print(f"{'file':<32} {'mode':<16} {'audio s':>8} {'time s':>8} {'x realtime':>10} {'corr':>6} {'MAE':>6} {'active agree':>12}")
+    for audio_file, mode, duration, elapsed, corr, mae, agreement in rows:
+        print(f"{audio_file:<32} {mode:<16} {duration:8.1f} {elapsed:8.2f} {duration / elapsed:10.1f} "
+              f"{corr:6.2f} {mae:6.3f} {agreement:12.1%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob("data/*.wav")))
@@ -0,0 +1,128 @@
+"""
+Runtime and agreement of the analysis quality tiers (AudioAnalysis.QUALITY_PRESETS)
+against the "full" tier.
+
+For get_audio_sections it reports how many of the full tier's section
+boundaries are matched within BOUNDARY_TOL_S (and vice versa) and the mean
+BPM difference over the song (also after folding octave errors). For
+lip_sync (vocal separation + envelope) it reports the mean position
+difference and correlation of the mouth curves.
+Every run uses a fresh throwaway cache, so nothing is reused between tiers.
+
+Usage (from the repo root):
+    python -m benchmarks.quality_tiers [audio files...]   # defaults to data/*.wav
+    python -m benchmarks.quality_tiers --no-lip-sync     # sections only
+"""
+import glob
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from Dance.analysis_cache import AnalysisCache
+from Dance.AudioAnalysis import QUALITY_PRESETS, get_audio_sections, lip_sync
+
+BOUNDARY_TOL_S = 0.5
+REFERENCE = "full"
+
+
+def timed(fn, *args, **kwargs):
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - t0
+
+
+def boundary_agreement(reference, estimate, tol=BOUNDARY_TOL_S):
+    """
+    (fraction of reference boundaries hit, fraction of estimated boundaries that are real)
+    """
+    reference, estimate = np.asarray(reference), np.asarray(estimate)
+    if len(reference) == 0 or len(estimate) == 0:
+        return float(len(reference) == len(estimate)), float(len(reference) == len(estimate))
+    dist = np.abs(reference[:, None] - estimate[None, :])
+    recall = np.mean(dist.min(axis=1) <= tol)
+    precision = np.mean(dist.min(axis=0) <= tol)
+    return recall, precision
+
+
+def bpm_at(sections, times):
+    starts = np.array([sec["start_s"] for sec in sections])
+    bpms = np.array([sec["bpm"] for sec in sections])
+    idx = np.clip(np.searchsorted(starts, times, side="right") - 1, 0, len(bpms) - 1)
+    return bpms[idx]
+
+
+def octave_folded(bpm, reference):
+    """
+    bpm moved by whole octaves to be closest to reference (half/double tempo
+    picks are common and the dance scheduler folds BPMs anyway).
+    """
+    octaves = np.round(np.log2(reference / bpm))
+    return bpm * 2.0 ** octaves
+
+
+def run_sections(audio_file, tier, tmp):
+    (sections, duration_s, _), seconds = timed(
+        get_audio_sections, audio_file, quality=tier, force_segment=True,
+        cache=AnalysisCache(f"{tmp}/{tier}")
+    )
+    return sections, duration_s, seconds
+
+
+def run_lip_sync(audio_file, tier, tmp):
+    (times, positions), seconds = timed(
+        lip_sync, audio_file, threshold=0.05, quality=tier,
+        cache=AnalysisCache(f"{tmp}/lip_{tier}_{time.monotonic_ns()}")
+    )
+    return np.asarray(times), np.asarray(positions, dtype=float), seconds
+
+
+def main(audio_files, with_lip_sync=True):
+    tiers = [REFERENCE] + [tier for tier in QUALITY_PRESETS if tier != REFERENCE]
+    section_rows = []
+    lip_rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        # warm up numba-compiled librosa code so the first run isn't penalized
+        for tier in tiers:
+            get_audio_sections(audio_files[0], quality=tier, cache=AnalysisCache(f"{tmp}/warmup"))
+
+        for audio_file in audio_files:
+            ref_sections, duration_s, ref_s = run_sections(audio_file, REFERENCE, tmp)
+            ref_bounds = [sec["start_s"] for sec in ref_sections]
+            grid = np.arange(0, duration_s, 0.1)
+            ref_bpm = bpm_at(ref_sections, grid)
+            for tier in tiers:
+                sections, _, seconds = run_sections(audio_file, tier, tmp)
+                recall, precision = boundary_agreement(ref_bounds, [sec["start_s"] for sec in sections])
+                bpm = bpm_at(sections, grid)
+                bpm_diff = np.mean(np.abs(bpm - ref_bpm))
+                folded_diff = np.mean(np.abs(octave_folded(bpm, ref_bpm) - ref_bpm))
+                section_rows.append((audio_file, tier, seconds, ref_s / seconds,
+                                     f"sections {len(sections)}, boundaries hit {recall:.0%} / "
+                                     f"real {precision:.0%}, mean dBPM {bpm_diff:.2f} "
+                                     f"({folded_diff:.2f} octave-folded)"))
+
+            if not with_lip_sync:
+                continue
+            ref_t, ref_p, ref_s = run_lip_sync(audio_file, REFERENCE, tmp)
+            for tier in tiers:
+                t, p, seconds = run_lip_sync(audio_file, tier, tmp)
+                dense = np.interp(ref_t, t, p)
+                corr = np.corrcoef(dense, ref_p)[0, 1] if np.std(dense) > 0 and np.std(ref_p) > 0 else float("nan")
+                lip_rows.append((audio_file, tier, seconds, ref_s / seconds,
+                                 f"mean |d position| {np.mean(np.abs(dense - ref_p)):.3f}, corr {corr:.3f}"))
+
+    for title, rows in (("get_audio_sections", section_rows), ("lip_sync", lip_rows)):
+        if not rows:
+            continue
+        print()
+        print(title)
+        print(f"{'file':<32} {'tier':<9} {'seconds':>8} {'speed-up':>8}  agreement with {REFERENCE}")
+        for audio_file, tier, seconds, speedup, agreement in rows:
+            print(f"{audio_file:<32} {tier:<9} {seconds:8.2f} {speedup:7.1f}x  {agreement}")
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if a != "--no-lip-sync"]
+    main(args or sorted(glob.glob("data/*.wav")), with_lip_sync="--no-lip-sync" not in sys.argv[1:])
@@ -0,0 +1,103 @@
+"""
+Latency of the playback loop's per-tick state access while OSC-style
+handler threads contend for the shared state (GestureInput.realtime).
+
+"locked" is the previous scheme: every tick takes state_lock to read
+playback_on / copy editing_group and again to store an edit, while the
+handlers hold the same lock for HOLD_S (bus I/O, merges, saves).
+"lock-free" reads an AtomicRef snapshot and pushes edits into an SPSCRing;
+the handlers still take their lock, but the playback thread never does.
+
+For each scheme it reports the per-tick access time (p50 / p99 / max) and
+the lateness of the 5 ms ticks themselves.
+
+Usage (from the repo root):
+    python -m benchmarks.realtime_exchange [seconds] [handler threads]
+"""
+import sys
+import threading
+import time
+
+import numpy as np
+
+from GestureInput.realtime import AtomicRef, PlaybackState, SPSCRing
+from GestureInput.sampler import FixedRateSampler
+
+TICK_S = 0.005
+HOLD_S = 0.002      # how long a handler keeps the lock
+HANDLER_PERIOD_S = 0.01
+EDIT_IDS = (10, 11, 12)
+
+
+def handler_loop(stop_event, lock, publish):
+    k = 0
+    while not stop_event.is_set():
+        with lock:
+            time.sleep(HOLD_S)  # I/O while holding the lock releases the GIL, like a bus transfer
+            publish(k)
+        k += 1
+        time.sleep(HANDLER_PERIOD_S)
+
+
+def run(scheme, seconds, n_handlers):
+    lock = threading.Lock()
+    shared = {"playing": True, "editing_group": list(EDIT_IDS), "edits": {}}
+    ref = AtomicRef(PlaybackState(True, frozenset(EDIT_IDS)))
+    ring = SPSCRing(4096)
+
+    if scheme == "locked":
+        def publish(k):
+            shared["editing_group"] = list(EDIT_IDS[:1 + k % len(EDIT_IDS)])
+    else:
+        def publish(k):
+            ring.drain()  # the consumer side of the ring
+            ref.set(PlaybackState(True, frozenset(EDIT_IDS[:1 + k % len(EDIT_IDS)])))
+
+    stop_event = threading.Event()
+    handlers = [threading.Thread(target=handler_loop, args=(stop_event, lock, publish), daemon=True)
+                for _ in range(n_handlers)]
+    for h in handlers:
+        h.start()
+
+    access = []
+    sampler = FixedRateSampler(TICK_S)
+    end = time.perf_counter() + seconds
+    for i, _ in enumerate(sampler.ticks()):
+        if time.perf_counter() >= end:
+            break
+        t0 = time.perf_counter()
+        if scheme == "locked":
+            with lock:
+                playing = shared["playing"]
+                editing = list(shared["editing_group"])
+            for motor_id in editing:
+                with lock:
+                    shared["edits"].setdefault(i, {})[str(motor_id)] = 512
+        else:
+            state = ref.get()
+            playing = state.playing
+            for motor_id in state.editing_ids:
+                ring.push(i, i + 1, motor_id, 512)
+        access.append(time.perf_counter() - t0)
+        if not playing:
+            break
+
+    stop_event.set()
+    for h in handlers:
+        h.join()
+    return np.array(access), sampler.stats
+
+
+def main(seconds=3.0, n_handlers=2):
+    print(f"{seconds:.0f} s of {TICK_S * 1e3:.0f} ms ticks, {n_handlers} handler threads "
+          f"holding the lock {HOLD_S * 1e3:.0f} ms every {HANDLER_PERIOD_S * 1e3:.0f} ms")
+    print(f"{'scheme':<10} {'access p50':>11} {'p99':>9} {'max':>9}  tick lateness")
+    for scheme in ("locked", "lock-free"):
+        access, stats = run(scheme, seconds, n_handlers)
+        p50, p99 = np.percentile(access, [50, 99]) * 1e3
+        print(f"{scheme:<10} {p50:9.3f}ms {p99:7.3f}ms {access.max() * 1e3:7.3f}ms  {stats.summary()}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(float(args[0]) if args else 3.0, int(args[1]) if len(args) > 1 else 2)
@@ -0,0 +1,43 @@
+import numpy as np
+
+from GestureInput.gesture_compress import compress_gesture, load_keyframes, save_keyframes
+from GestureInput.gesture_format import Gesture
+from GestureInput.gesture_player import GesturePlayer
+
+
+def jittered_gesture(n_frames=2000, record_dt=0.005, seed=0):
+    # a take saved without resampling: nominal record_dt in the header, uneven t
+    rng = np.random.default_rng(seed)
+    t = 100.0 + np.cumsum(record_dt * rng.uniform(0.6, 1.8, n_frames))
+    positions = np.rint(2048 + 300 * np.sin(2 * np.pi * (t - t[0]) / 1.3)).astype(np.int32)
+    return Gesture([11, 13], t, np.vstack([positions, positions // 2]), record_dt)
+
+
+def test_frame_index_follows_jittered_timestamps():
+    gesture = jittered_gesture()
+    keyframes = compress_gesture(gesture)
+    t = gesture.t - gesture.t[0]
+    assert keyframes.frame_t is not None
+    for time_s in np.linspace(0, t[-1], 97):
+        expected = int(np.searchsorted(t, time_s, side="right")) - 1
+        assert keyframes.frame_index(time_s) == expected
+    # the same frames as the uncompressed recording plays
+    player = GesturePlayer(gesture)
+    assert keyframes.frame_index(t[-1] / 2) == player.sample(t[-1] / 2)[0]
+
+
+def test_uniform_recording_keeps_no_frame_times():
+    gesture = jittered_gesture()
+    gesture.t = gesture.t[0] + np.arange(len(gesture)) * gesture.record_dt
+    keyframes = compress_gesture(gesture)
+    assert keyframes.frame_t is None
+    assert keyframes.frame_index(1.0) == 200
+
+
+def test_frame_times_survive_save_and_load(tmp_path):
+    keyframes = compress_gesture(jittered_gesture())
+    path = tmp_path / "take.gestk"
+    save_keyframes(str(path), keyframes)
+    loaded = load_keyframes(str(path))
+    np.testing.assert_array_equal(loaded.frame_t, keyframes.frame_t)
+    assert loaded.frame_index(3.21) == keyframes.frame_index(3.21)
@@ -23,6 +23,38 @@ def degtotick(degree):
     return int(degree * 4095 / 360)
 def ticktodeg(tick):
     return int(tick * 360 / 4095)
+
+def sync_moveto(motors, positions):
+    """
+    Set the goal positions (in ticks) of several motors sharing a port in one
+    GroupSyncWrite packet, instead of one write4ByteTxRx round trip per motor.
+    """
+    if not motors:
+        return COMM_SUCCESS
+    group = GroupSyncWrite(motors[0].portHandler, motors[0].packetHandler, motors[0].ADDR_GOAL_POSITION, 4)
+    for m, pos in zip(motors, positions):
+        pos = int(pos)
+        group.addParam(m.ID, [DXL_LOBYTE(DXL_LOWORD(pos)), DXL_HIBYTE(DXL_LOWORD(pos)),
+                              DXL_LOBYTE(DXL_HIWORD(pos)), DXL_HIBYTE(DXL_HIWORD(pos))])
+    dxl_comm_result = group.txPacket()
+    if dxl_comm_result != COMM_SUCCESS:
+        print("%s" % motors[0].packetHandler.getTxRxResult(dxl_comm_result))
+    return dxl_comm_result
+
+def sync_read_positions(motors):
+    """
+    Present positions of several motors sharing a port with one GroupSyncRead
+    round trip. Motors that didn't answer are read individually.
+    """
+    if not motors:
+        return []
+    addr = motors[0].ADDR_PRESENT_POSITION
+    group = GroupSyncRead(motors[0].portHandler, motors[0].packetHandler, addr, 4)
+    for m in motors:
+        group.addParam(m.ID)
+    group.txRxPacket()
+    return [group.getData(m.ID, addr, 4) if group.isAvailable(m.ID, addr, 4) else m.read_position()
+            for m in motors]
     
 class dynamixel:
 